@@ -1,22 +1,42 @@
 # app.py — Chatbot Buen Fin Indiana 2025
-from flask import Flask, request, jsonify, send_from_directory, render_template, redirect
-from heyoo import WhatsApp
-import redis, json, os, sys, time
+from flask import Flask, Response, request, jsonify, send_from_directory, send_file, render_template, redirect, stream_with_context
+import redis, json, os, time
 from datetime import datetime
 from dotenv import load_dotenv
 from werkzeug.middleware.proxy_fix import ProxyFix
-from ticket_validator import validar_ticket_desde_media
-from sheets_logger import registrar_ticket_en_sheets
-from sheets_utils import open_worksheet, parse_money
-from control_inventario import obtener_premio_disponible, obtener_premio_especial
-from vendedores import VENDEDORES
+import ticket_validator
+from ticket_validator import validar_ticket_desde_media, metricas_ocr
+from sheets_logger import registrar_ticket_en_sheets, registrar_ticket_con_fila
+import sheets_logger
+from sheets_utils import open_worksheet, header_map, parse_money
+from control_inventario import obtener_premio_disponible, obtener_premio_especial, obtener_premios_especiales
+import registro_vendedores
+import image_store
+import ticket_store
+import exportar
+import notificaciones
+import eventos
+import http_cache
+import leaderboards
+import series
+import qr_analytics
+import sesiones
+import flujo
+import control_carga
+import metricas
+import profiler
+import logs
+import redis_pool
+from circuit_breaker import obtener as obtener_circuito, estado_todos as estado_circuitos, CircuitoAbierto
 
 # ------------------ Config básica ------------------
 load_dotenv()
+log = logs.obtener("app")
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
 app = Flask(__name__, template_folder="templates")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
+metricas.instrumentar_app(app)  # antes de comprimir: la latencia incluye la compresión
 
 # Entorno / tokens
 token_facebook       = os.getenv("WHATSAPP_TOKEN")
@@ -27,12 +47,38 @@ URL_SERVER           = os.getenv("URL_SERVER")
 # Ajustes Dashboard
 AUTO_SYNC_ON_DASHBOARD = os.getenv("AUTO_SYNC_ON_DASHBOARD", "1") == "1"
 AUTO_SYNC_MAX_AGE_S    = int(os.getenv("AUTO_SYNC_MAX_AGE_S", "3600"))  # 1h por defecto
-r = redis.Redis(host='localhost', port=6379, decode_responses=True)
-# WhatsApp
-wa = WhatsApp(token_facebook, id_numero)
-
-def dbg(*args):
-    print(*args, file=sys.stdout, flush=True)
+# Pools separados (redis_pool.py): r para webhook/dashboard, r_fondo para hilos y tareas de fondo
+r = redis_pool.cliente("hot")
+r_fondo = redis_pool.cliente("fondo")
+r_pubsub = redis_pool.cliente("pubsub")
+metricas.registrar_cola("notificaciones", lambda: notificaciones.pendientes(r_fondo))
+metricas.registrar_cola("tickets_sync", ticket_store.pendientes_sync)
+profiler.instrumentar_app(app, r_fondo)
+app.after_request(http_cache.comprimir)
+dashboard_condicional = http_cache.condicional(r)
+# WhatsApp (el cliente se crea al primer envío o en calentar())
+_wa = None
+CB_GRAPH = obtener_circuito("graph")
+
+def whatsapp():
+    global _wa
+    if _wa is None:
+        from heyoo import WhatsApp
+        _wa = WhatsApp(token_facebook, id_numero)
+    return _wa
+
+@app.before_request
+def _correlacion():
+    logs.fijar_cid(request.headers.get("X-Request-ID"))
+
+def _resumen_graph(resp):
+    """Sólo el id del mensaje (o el error) de la respuesta de Graph, no el JSON completo."""
+    if not isinstance(resp, dict):
+        return {"resp": str(resp)[:200]}
+    if "error" in resp:
+        err = resp.get("error") or {}
+        return {"error": err.get("message", str(err))[:200], "codigo": err.get("code")}
+    return {"wamid": ((resp.get("messages") or [{}])[0]).get("id", "")}
 
 @app.route("/qr")
 def qr_redirect():
@@ -40,11 +86,15 @@ def qr_redirect():
     if not vendedor_id:
         return "❌ Falta el parámetro vendedor", 400
 
-    # Registrar escaneo (opcional)
-    r.incr(f"vendedor:{vendedor_id}:scans")
-    r.expire(f"vendedor:{vendedor_id}:scans", 86400)
+    vendedor_id = vendedor_id.strip()[:32]
+
+    # Analítica del QR (un solo round trip); nunca bloquea la redirección
+    try:
+        visitante = qr_analytics.visitante(request.remote_addr or "", request.headers.get("User-Agent", ""))
+        qr_analytics.registrar_escaneo(r, qr_analytics.vendedor_de_qr(r, vendedor_id), visitante)
+    except Exception as e:
+        log.error("qr_analytics.registrar_escaneo error: %s", e)
 
-    #vendedor_nombre = VENDEDORES.get(vendedor_id, "Sin vendedor")
 
     telefono_bot = "5217206266927"
 
@@ -54,104 +104,141 @@ def qr_redirect():
 
     wa_link = f"https://wa.me/{telefono_bot}?text={mensaje}"
 
-    print(f"🔗 QR generado → {wa_link}")
+    log.info("QR generado", extra={"vendedor": vendedor_id, "muestra": 0.1})
     return redirect(wa_link)
 
 def wsend(to, text):
     try:
-        resp = wa.send_message(text, to)
-        dbg("Graph API send_message resp:", resp)
-        return resp
+        resp = CB_GRAPH.call(whatsapp().send_message, text, to)
+        log.debug("Graph API send_message", extra={"to": to, **_resumen_graph(resp)})
+        return resp if notificaciones.entregado(resp) else None  # {"error": ...} no es un envío
+    except CircuitoAbierto as e:
+        log.warning("send_message omitido: %s", e, extra={"to": to})
+        return None
+    except Exception as e:
+        log.error("Error send_message: %s", e, extra={"to": to})
+        return None
+
+def wsend_botones(to, text, titulos):
+    """Mensaje con botones de respuesta rápida (máx. 3 en WhatsApp)."""
+    button = {
+        "type": "button",
+        "body": {"text": text},
+        "action": {"buttons": [{"type": "reply", "reply": {"id": str(i), "title": t}}
+                               for i, t in enumerate(titulos, start=1)]},
+    }
+    try:
+        resp = CB_GRAPH.call(whatsapp().send_reply_button, recipient_id=to, button=button)
+        log.debug("Graph API send_reply_button", extra={"to": to, **_resumen_graph(resp)})
+        return resp if notificaciones.entregado(resp) else None
+    except CircuitoAbierto as e:
+        log.warning("send_reply_button omitido: %s", e, extra={"to": to})
+        return None
     except Exception as e:
-        dbg("❌ Error send_message:", e)
+        log.error("Error send_reply_button: %s", e, extra={"to": to})
         return None
 
 # ------------------ Sesiones ------------------
 def cargar_sesion(telefono):
-    datos = r.get(f"chatbot:{telefono}")
-    return json.loads(datos) if datos else None
+    return sesiones.cargar(r, telefono)
 
 def guardar_sesion(telefono, datos):
-    r.set(f"chatbot:{telefono}", json.dumps(datos), ex=86400)
+    """Reemplaza paso + respuestas; el historial de tickets va aparte (sesiones.agregar_ticket)."""
+    sesiones.reemplazar(r, telefono, datos.get("paso", 0), datos.get("respuestas"))
 
 def eliminar_sesion(telefono):
-    r.delete(f"chatbot:{telefono}")
+    sesiones.eliminar(r, telefono)
+
+# ------------------ Registro de tickets ------------------
+def registrar_ticket(datos_generales, nuevo_ticket):
+    """
+    Guarda el ticket en el almacén local (SQLite) y suma a leaderboards y
+    series. La copia a Google Sheets la hace el replicador en segundo plano
+    (_ticket_replicado avisa al dashboard cuando ya tiene fila).
+    """
+    try:
+        ticket_store.insertar(datos_generales, nuevo_ticket)
+    except Exception as e:
+        log.error("ticket_store.insertar error: %s", e)
+        # Sin almacén local: escribimos directo al Sheet como antes
+        ok, row_index = registrar_ticket_con_fila(datos_generales, nuevo_ticket)
+        if not ok:
+            return False
+    iniciar_replicador()
+    try:
+        p = r.pipeline(transaction=False)
+        leaderboards.registrar(r, datos_generales.get("tienda", ""), datos_generales.get("vendedor", ""), pipe=p)
+        monto = parse_money(datos_generales.get("monto"))
+        series.registrar(r, pipe=p, tickets=1, ocr_validos=int(monto > 0), monto=monto)
+        http_cache.bump(r, pipe=p)
+        p.execute()
+    except Exception as e:
+        log.error("leaderboards/series error: %s", e)
+    return True
+
+def _ticket_replicado(ticket_id, row_index, datos_generales):
+    """Callback del replicador: el ticket ya tiene fila en el Sheet (asignable)."""
+    http_cache.bump(r_fondo)
+    if row_index and ticket_store.es_pendiente(datos_generales.get("premio", "")):
+        eventos.publicar(r_fondo, "ticket_pendiente", {
+            "row_index": row_index,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "nombre": datos_generales.get("nombre", ""),
+            "telefono": datos_generales.get("telefono", ""),
+            "tienda": datos_generales.get("tienda", ""),
+            "monto_ocr": datos_generales.get("monto", ""),
+            "premio": datos_generales.get("premio", ""),
+            "ticket": datos_generales.get("nombre_archivo", ""),
+        })
+
+def _reconstruir_leaderboards():
+    """Filas nuevas o editadas a mano en el Sheet: los ZINCRBY del bot no las vieron."""
+    leaderboards.reconstruir(r_fondo, ticket_store.filas_leaderboard())
+
+def importar_sheet(forzar=False):
+    """Sheet -> SQLite (ediciones manuales). Un solo proceso a la vez."""
+    if not forzar and not r_fondo.set("tickets:import:lock", os.getpid(), nx=True, ex=120):
+        return 0
+    try:
+        n = ticket_store.importar_desde_sheet(open_worksheet(), al_cambiar_conteos=_reconstruir_leaderboards)
+        http_cache.bump(r_fondo)
+        return n
+    finally:
+        r_fondo.delete("tickets:import:lock")
+
+def iniciar_replicador():
+    return ticket_store.iniciar_replicador(registrar_ticket_con_fila, _ticket_replicado, importar_sheet)
+
+@app.before_request
+def _arrancar_replicador():
+    iniciar_replicador()
 
 # ------------------ Helpers Sheets / Inventario ------------------
+def _asegurar_store():
+    try:
+        ticket_store.asegurar(open_worksheet)  # primer arranque: trae el histórico del Sheet
+    except Exception as e:
+        log.error("ticket_store.asegurar error: %s", e)
+
 def contar_tiendas():
     """
-    Lee el Sheet y devuelve (conteos_por_tienda: dict[str,int], total_registros: int).
-    Usa la columna 'Tienda'. Ignora vacíos.
+    Devuelve (conteos_por_tienda: dict[str,int], total_registros: int) desde
+    el almacén local (SQL). Ignora vacíos.
     """
+    _asegurar_store()
     try:
-        ws = open_worksheet()
-        rows = ws.get_all_values() or []
-        if not rows:
-            return {}, 0
-
-        headers = [h.strip().lower() for h in rows[0]]
-        idx_tienda = None
-        for i, h in enumerate(headers):
-            if h == "tienda":
-                idx_tienda = i
-                break
-        if idx_tienda is None:
-            return {}, 0
-
-        counts = {}
-        total = 0
-        for row in rows[1:]:
-            if idx_tienda < len(row):
-                tienda = (row[idx_tienda] or "").strip()
-                if not tienda:
-                    continue
-                tienda_norm = " ".join(tienda.split())
-                counts[tienda_norm] = counts.get(tienda_norm, 0) + 1
-                total += 1
-        return counts, total
+        return ticket_store.contar_tiendas()
     except Exception:
         return {}, 0
 
 def contar_premios_asignados():
     """
-    Lee el Sheet y devuelve (conteos_por_premio, total_asignados).
+    Devuelve (conteos_por_premio, total_asignados) desde el almacén local (SQL).
     Filtra valores que no son premios reales (ej: 'monto insuficiente', 'revisión manual', etc.).
     """
+    _asegurar_store()
     try:
-        ws = open_worksheet()
-        rows = ws.get_all_values() or []
-        if not rows:
-            return {}, 0
-
-        headers = [h.strip() for h in rows[0]]
-        idx_premio = None
-        for i, h in enumerate(headers):
-            if h.strip().lower() == "premio":
-                idx_premio = i
-                break
-
-        if idx_premio is None:
-            return {}, 0
-
-        counts = {}
-        total = 0
-        EXCLUDE_PREFIXES = (
-            "monto insuficiente", "revisión manual", "revision manual",
-            "sin premios", "sin premio", "rechazado"
-        )
-
-        for row in rows[1:]:
-            if idx_premio < len(row):
-                premio = (row[idx_premio] or "").strip()
-                if not premio:
-                    continue
-                low = premio.lower()
-                if any(low.startswith(pfx) for pfx in EXCLUDE_PREFIXES):
-                    continue
-                counts[premio] = counts.get(premio, 0) + 1
-                total += 1
-
-        return counts, total
+        return ticket_store.contar_premios_asignados()
     except Exception:
         return {}, 0
 
@@ -221,6 +308,8 @@ def _sync_redis_from_sheets(mode: str = "available", preview: bool = True, prefi
             cambios.append({"key": key, "nombre": nombre, "old": actual, "new": target})
             if not preview:
                 r.set(key, target)
+                http_cache.bump(r)
+                eventos.publicar(r, "inventario", {"premio": nombre, "disponibles": target, "delta": target - actual})
 
     return {
         "mode": mode,
@@ -253,36 +342,22 @@ def auto_sync_from_sheets_if_stale(max_age_s=AUTO_SYNC_MAX_AGE_S, mode="availabl
         r.delete("premio_sync:lock")
 
 # ------------------ Flujo Buen Fin Indiana ------------------
-# Campos que se pedirán por texto/botón ANTES de la foto:
-# 1) nombre, 2) tienda, 3) rfc_nombre, 4) ocupacion (botones), 5) festejo (botones)
-#CAMPOS = ["nombre", "tienda", "rfc_nombre", "ocupacion", "festejo", "medio"]
-CAMPOS = ["nombre", "tienda", "rfc_nombre", "correo", "ocupacion", "medio"]
-TOTAL_CAMPOS = len(CAMPOS)  # cuando paso == TOTAL_CAMPOS, esperamos la foto
-
-BIENVENIDA = (
-    """La promoción Buen Fin Indiana 2025 ha llegado a su cierre oficial y queremos agradecer tu participación. Tu confianza y preferencia hicieron posible ¡el gran éxito de esta edición!.
-
-En los próximos días continuaremos con la validación final y la entrega de premios pendientes a clientes finales y ejecutivos.
-Gracias por elegir Indiana Wire & Cable
-
-¡Nos vemos en 2026!"""
-)
-
-PREGUNTAS = [
-    "¡Listo! Por favor, escribe tu *nombre completo*.",
-    "Cuéntanos, ¿*en qué tienda* realizaste tu compra?",
-    "Ingresa el *RFC o Nombre completo* a quien está registrado el ticket o factura.\n"
-    "No importa si lo estás registrando con autorización de alguien más.",
-    "Por favor ingresa tu *correo electrónico*."
-]
-
-VALIDACION_MSG = (
-    "⏳ ¡Gracias! *Estamos validando tu ticket*.\n"
-    "Nuestro equipo revisará tu compra y te contactará en un máximo de *24 horas*.\n"
-    "Si tienes dudas, escríbenos al 📞 55 3478 4786 o 55 1954 2345."
+# Pasos, mensajes y modo de campaña (CAMPANA_MODO=abierta|cerrada) viven en flujo.py
+def _validar_medido(media_id, telefono):
+    # El OCR tarda segundos: control_carga lo mide aparte del resto del mensaje
+    with control_carga.tramo_ocr():
+        return validar_ticket_desde_media(media_id, token_facebook, telefono)
+
+CTX_FLUJO = flujo.Contexto(
+    redis=r,
+    enviar=wsend,
+    enviar_botones=wsend_botones,
+    validar=_validar_medido,
+    registrar=lambda datos_generales, nuevo_ticket: registrar_ticket(datos_generales, nuevo_ticket),
+    url_ticket=lambda nombre_archivo: f"{URL_SERVER}/catalogo_img/{nombre_archivo}",
 )
 
-# ------------------ Webhook Modo "Campaña Finalizada" ------------------
+# ------------------ Webhook ------------------
 @app.route("/webhook", methods=["GET", "POST"])
 @app.route("/webhook/", methods=["GET", "POST"])
 def webhook():
@@ -292,7 +367,7 @@ def webhook():
         token     = request.args.get('hub.verify_token')
         challenge = request.args.get('hub.challenge')
         if mode == "subscribe" and token == WEBHOOK_VERIFY_TOKEN:
-            print("✅ Webhook verificado exitosamente")
+            log.info("Webhook verificado")
             return challenge, 200
         return "❌ Token inválido", 403
 
@@ -310,342 +385,132 @@ def webhook():
 
         mensaje  = change['messages'][0]
         telefono = mensaje['from']
-        
-        # (Opcional) Evitar responder a mensajes muy viejos para no hacer spam si se atora la cola
-        # timestamp = int(mensaje.get('timestamp', 0))
-        # ... logica de tiempo ...
-
-        # ------------------------------------------------------
-        #  RESPUESTA ÚNICA: CAMPAÑA CERRADA
-        # ------------------------------------------------------
-        # No leemos sesión, no validamos texto, no procesamos fotos.
-        # Simplemente respondemos el mensaje de cierre.
-        
-        wsend(telefono, BIENVENIDA)
-        
-        return jsonify({"status": "mensaje de cierre enviado"}), 200
+        logs.fijar_cid(mensaje.get("id"))  # el wamid sigue al mensaje por OCR y Sheets
+        log.info("mensaje entrante", extra={"telefono": telefono, "tipo": mensaje.get("type"), "muestra": 0.2})
+
+        # Control de carga: mensajes viejos (cola atorada), flood por teléfono y saturación global
+        decision = control_carga.evaluar(r, telefono, mensaje.get("timestamp"))
+        if decision == "viejo":
+            return jsonify({"status": "mensaje viejo descartado"}), 200
+        if decision == "limitado":
+            if control_carga.avisar_limite(r, telefono):
+                wsend(telefono, control_carga.MENSAJE_LIMITADO)
+            return jsonify({"status": "limitado"}), 200
+        if decision in ("degradar", "saturado"):
+            wsend(telefono, control_carga.MENSAJE_SATURADO)
+            return jsonify({"status": decision}), 200
+
+        # Conversión QR -> WhatsApp: primer mensaje que trae el código del vendedor
+        texto = (mensaje.get("text") or {}).get("body", "")
+        if texto:
+            try:
+                vendedor = registro_vendedores.resolver_texto(r, texto)
+                if vendedor:
+                    qr_analytics.registrar_mensaje(r, telefono, vendedor.canonico)
+            except Exception as e:
+                log.error("qr_analytics.registrar_mensaje error: %s", e)
+
+        t0 = time.monotonic()
+        try:
+            status = flujo.procesar(CTX_FLUJO, mensaje)
+        finally:
+            control_carga.medir(time.monotonic() - t0)
+        return jsonify({"status": status}), 200
 
     except Exception as e:
-        print("❌ Error procesando mensaje:", e, flush=True)
+        log.exception("Error procesando mensaje: %s", e)
+        metricas.ERRORES.labels("webhook").inc()
         # Retornamos 200 para que WhatsApp no siga reintentando enviarnos el mismo mensaje
         return jsonify({"error": str(e)}), 200
 
+# ------------------ Catálogo de imágenes ------------------
 
-# ------------------ Webhook ------------------
-# @app.route("/webhook", methods=["GET", "POST"])
-# @app.route("/webhook/", methods=["GET", "POST"])
-# def webhook():
-#     if request.method == "GET":
-#         mode      = request.args.get('hub.mode')
-#         token     = request.args.get('hub.verify_token')
-#         challenge = request.args.get('hub.challenge')
-#         if mode == "subscribe" and token == WEBHOOK_VERIFY_TOKEN:
-#             print("✅ Webhook verificado exitosamente")
-#             return challenge, 200
-#         return "❌ Token inválido", 403
-
-#     # POST: mensaje entrante
-#     data = request.get_json()
-#     try:
-#         change = data['entry'][0]['changes'][0]['value']
-#         if 'messages' not in change:
-#             return jsonify({"status": "no messages"}), 200
-
-#         mensaje  = change['messages'][0]
-#         telefono = mensaje['from']
-#         tipo     = mensaje['type']
-
-#         # Texto (botón o normal)
-#         texto = ""
-#         if "interactive" in mensaje and mensaje["interactive"].get("type") == "button_reply":
-#             btn_title = mensaje["interactive"]["button_reply"]["title"].strip()
-#             texto     = btn_title
-#             tipo      = "text"
-#         elif "text" in mensaje and "body" in mensaje["text"]:
-#             texto = mensaje["text"]["body"].strip()
-#             tipo  = "text"
-
-#         #usuario = cargar_sesion(telefono)
-#         txt = (texto or "").strip().lower()
-
-        # ---------------- A) Reinicio con QUIERO PARTICIPAR ----------------
-        #if "QUIERO PARTICIPAR" in texto.upper():
-            #usuario = {"paso": 0, "respuestas": {}, "tickets": []}
-
-            # import re
-            # # Detectar directamente el código "VXXX" en el mensaje
-            # m = re.search(r"\bV\d{3}\b", texto.upper())
-            # vendedor_id = m.group(0) if m else None
-
-            # if vendedor_id:
-            #     vendedor_nombre = VENDEDORES.get(vendedor_id, vendedor_id)
-            # else:
-            #     vendedor_nombre = "Sin vendedor"
-
-            # usuario["respuestas"]["vendedor"] = vendedor_nombre
-            # guardar_sesion(telefono, usuario)
-
-            # dbg(f"🧾 Vendedor detectado para {telefono}: {vendedor_nombre}")
-
-            # Mensajes de bienvenida
-        #wsend(telefono, BIENVENIDA)
-            #wsend(telefono, PREGUNTAS[0])  # nombre
-        #return jsonify({"status": "inicio"}), 200
-
-        # ---------------- B) No hay sesión todavía ----------------
-    #     if not usuario:
-    #         wsend(telefono, BIENVENIDA)
-    #         return jsonify({"status": "esperando inicio"}), 200
-
-    #     # ---------------- C) Comando SALIR ----------------
-    #     if texto.upper() == "SALIR":
-    #         usuario["paso"] = -1
-    #         guardar_sesion(telefono, usuario)
-    #         wsend(telefono, "✅ Gracias, puedes volver más tarde escribiendo *QUIERO PARTICIPAR*.")
-    #         return jsonify({"status": "salir"}), 200
-
-    #     # ---------------- D) Paso 99: ¿Otro ticket? (Sí/No) ----------------
-    #     if usuario.get("paso") == 99:
-    #         if txt in ("sí", "si"):
-    #             # Conserva datos base (no se vuelven a pedir)
-    #             usuario["paso"] = TOTAL_CAMPOS  # directamente pedir foto del 2º ticket
-    #             guardar_sesion(telefono, usuario)
-    #             wsend(telefono, "📸 Perfecto, envía una *foto clara* de tu *2º ticket* de compra participante.")
-    #             return jsonify({"status": "esperando foto 2do ticket"}), 200
-
-    #         if txt in ("no", "n"):
-    #             usuario["paso"] = -1
-    #             guardar_sesion(telefono, usuario)
-    #             wsend(telefono, "🙌 ¡Gracias por participar en el *Buen Fin Indiana*! 🎁\nPronto recibirás noticias.")
-    #             eliminar_sesion(telefono)
-    #             return jsonify({"status": "fin"}), 200
-
-    #         wsend(telefono, "Responde *Sí* si tienes otro ticket o *No* para terminar.")
-    #         return jsonify({"status": "recordatorio paso 99"}), 200
-
-    #     # ---------------- E) Flujo de preguntas (texto/botones) -------------
-    #     if usuario.get("paso", 0) < TOTAL_CAMPOS:
-    #         idx = usuario["paso"]
-    #         campo = CAMPOS[idx]
-
-    #         # 0) nombre
-    #         if campo == "nombre":
-    #             usuario["respuestas"]["nombre"] = texto
-    #             usuario["paso"] += 1
-    #             guardar_sesion(telefono, usuario)
-    #             wsend(telefono, PREGUNTAS[1])  # Pregunta tienda
-    #             return jsonify({"status": "nombre ok"}), 200
-
-    #         # 1) tienda
-    #         if campo == "tienda":
-    #             usuario["respuestas"]["tienda"] = texto
-    #             usuario["paso"] += 1
-    #             guardar_sesion(telefono, usuario)
-    #             wsend(telefono, PREGUNTAS[2])  # Pregunta RFC
-    #             return jsonify({"status": "tienda ok"}), 200
-
-    #         # 2) rfc_nombre
-    #         if campo == "rfc_nombre":
-    #             usuario["respuestas"]["rfc_nombre"] = texto
-    #             usuario["paso"] += 1
-    #             guardar_sesion(telefono, usuario)
-    #             # CORRECCIÓN: Aquí pedimos el CORREO explícitamente
-    #             wsend(telefono, PREGUNTAS[3]) 
-    #             return jsonify({"status": "rfc_nombre ok"}), 200
-
-    #         # 3) correo electrónico
-    #         if campo == "correo":
-    #             # Validar correo con regex simple
-    #             import re
-    #             patron = r"^[\w\.-]+@[\w\.-]+\.\w+$"
-    #             if not re.match(patron, texto):
-    #                 wsend(telefono, "❌ El correo no parece válido.\nPor favor ingresa un *correo electrónico* válido (ejemplo: nombre@gmail.com).")
-    #                 return jsonify({"status": "correo inválido"}), 200
-
-    #             usuario["respuestas"]["correo"] = texto
-    #             usuario["paso"] += 1
-    #             guardar_sesion(telefono, usuario)
-
-    #             # AHORA SÍ: Pedimos la Ocupación con botones
-    #             wa.send_reply_button(
-    #                 recipient_id=telefono,
-    #                 button={
-    #                     "type": "button",
-    #                     "body": {"text": "¿Cuál es tu *ocupación principal*?"},
-    #                     "action": {
-    #                         "buttons": [
-    #                             {"type": "reply", "reply": {"id": "1", "title": "Electricista"}},
-    #                             {"type": "reply", "reply": {"id": "2", "title": "Contratista"}},
-    #                             {"type": "reply", "reply": {"id": "3", "title": "Otro"}},
-    #                         ]
-    #                     },
-    #                 },
-    #             )
-    #             return jsonify({"status": "correo ok"}), 200
-
-    #         # 4) ocupacion (botón)
-    #         if campo == "ocupacion":
-    #             usuario["respuestas"]["ocupacion"] = texto
-    #             usuario["paso"] += 1
-    #             guardar_sesion(telefono, usuario)
-
-    #             # Enviar mensaje con opciones numeradas para MEDIO
-    #             wsend(
-    #                 telefono,
-    #                 "📢 ¿Por qué medio te enteraste de la promoción?\n\n"
-    #                 "1️⃣ Radio\n"
-    #                 "2️⃣ Cartel publicitario\n"
-    #                 "3️⃣ En tienda\n"
-    #                 "4️⃣ Redes sociales\n\n"
-    #                 "Por favor, responde con el *número* de tu opción (1–4)."
-    #             )
-    #             return jsonify({"status": "ocupacion ok"}), 200
-
-    #         # 5) medio (validación numérica 1–4)
-    #         if campo == "medio":
-    #             validos = ["1", "2", "3", "4"]
-    #             if texto not in validos:
-    #                 wsend(telefono, "❌ Por favor escribe solo el número (1, 2, 3 o 4).")
-    #                 return jsonify({"status": "respuesta inválida (medio)"}), 200
-
-    #             opciones = {
-    #                 "1": "Radio",
-    #                 "2": "Cartel publicitario",
-    #                 "3": "En tienda",
-    #                 "4": "Redes sociales"
-    #             }
-
-    #             usuario["respuestas"]["medio"] = opciones[texto]
-    #             usuario["paso"] += 1
-    #             guardar_sesion(telefono, usuario)
-
-    #             # Pasamos a pedir la foto del ticket
-    #             wsend(
-    #                 telefono,
-    #                 "📸 ¡Genial!\nEnvía una *foto clara* de tu *ticket/factura* participante.\n"
-    #                 "Asegúrate que se vea: Folio, Fecha, Monto y Productos Indiana."
-    #             )
-    #             return jsonify({"status": "medio ok, pedir foto"}), 200
-
-    #     # ---------------- F) Esperando FOTO (TOTAL_CAMPOS) ------------------
-    #     if usuario and usuario.get("paso") == TOTAL_CAMPOS and tipo != "image":
-    #         if tipo == "document":
-    #             document = mensaje.get("document", {})
-    #             filename = document.get("filename", "archivo")
-    #             wsend(
-    #                 telefono,
-    #                 f"❌ Recibí un archivo ({filename}) pero necesito una *imagen* de tu ticket (JPG/PNG)."
-    #             )
-    #         elif tipo == "text":
-    #             wsend(telefono, "❌ Recibí texto, pero necesito una *imagen* de tu ticket (JPG/PNG).")
-    #         else:
-    #             wsend(telefono, "❌ Tipo de archivo no válido. Envíe una *imagen* (JPG/PNG).")
-    #         return jsonify({"status": f"archivo no válido: {tipo}"}), 200
-
-    #     # ---------------- G) Procesar FOTO, asignar premio y loguear --------
-    #     if tipo == "image" and usuario and usuario.get("paso") == TOTAL_CAMPOS:
-    #         media_id = mensaje["image"]["id"]
-    #         usuario["respuestas"]["ticket_photo"] = f"media:{media_id}"
-    #         usuario["respuestas"]["timestamp"] = datetime.now().isoformat()
-
-    #         # OCR / Validación
-    #         wsend(telefono, '⏳ Procesando tu ticket, por favor espera...')
-    #         resultado = validar_ticket_desde_media(media_id, token_facebook, telefono)
-    #         print("Resultado OCR:", resultado)
-
-    #         monto_ticket = resultado.get("monto")
-    #         path_ticket = resultado.get("nombre_archivo")
-    #         motivo_ocr  = resultado.get("motivo", "")
-
-    #         nuevo_ticket = usuario["respuestas"].copy()
-
-    #         if resultado.get("valido"):
-    #             wsend(
-    #                 telefono,
-    #                 "✅ Tu ticket fue recibido y leído correctamente. "
-    #                 "Será validado por nuestro equipo."
-    #             )
-    #             nuevo_ticket["premio"] = "Pendiente de validación"
-    #         else:
-    #             wsend(
-    #                 telefono,
-    #                 "❌ No pudimos leer correctamente tu ticket. "
-    #                 "Será revisado manualmente por nuestro equipo."
-    #             )
-    #             nuevo_ticket["premio"] = "Revisión manual"
-
-    #         wsend(telefono, VALIDACION_MSG)
-
-    #         # Datos para Sheets
-    #         datos_generales = {
-    #             "telefono": telefono,
-    #             "nombre": usuario["respuestas"].get("nombre", ""),
-    #             "tienda": usuario["respuestas"].get("tienda", ""),
-    #             "rfc_nombre": usuario["respuestas"].get("rfc_nombre", ""),
-    #             "correo": usuario["respuestas"].get("correo", ""),  # 👈 AGREGAR ESTO
-    #             "ocupacion": usuario["respuestas"].get("ocupacion", ""),
-    #             "medio": usuario["respuestas"].get("medio", ""),
-    #             "monto": monto_ticket,
-    #             "motivo": motivo_ocr,
-    #             "vendedor": usuario["respuestas"].get("vendedor", "Sin vendedor"),
-    #             "nombre_archivo": f"{URL_SERVER}/catalogo_img/{path_ticket}" if path_ticket else "",
-    #             "premio": nuevo_ticket.get("premio", "")
-    #         }
-    #         # Historial
-    #         usuario.setdefault("tickets", []).append(nuevo_ticket)
-    #         guardar_sesion(telefono, usuario)
-
-    #         # Log a Sheets
-    #         try:
-    #             registrar_ticket_en_sheets(datos_generales, nuevo_ticket)
-    #         except Exception as e:
-    #             print("❌ registrar_ticket_en_sheets error:", e, flush=True)
-
-    #         # Preguntar por otro ticket
-    #         usuario["paso"] = 99
-    #         guardar_sesion(telefono, usuario)
-    #         wsend(telefono, "¿Tienes *otro ticket*? (Sí / No)")
-    #         return jsonify({"status": "ticket recibido"}), 200
-
-    #     # Nada más que hacer
-    #     return jsonify({"status": "sin cambios"}), 200
-
-    # except Exception as e:
-    #     print("❌ Error procesando mensaje:", e, flush=True)
-    #     return jsonify({"error": str(e)}), 500
+PENDIENTES_POR_PAGINA = int(os.getenv("PENDIENTES_POR_PAGINA", "50"))
 
-# ------------------ Catálogo de imágenes ------------------
+def _float_arg(nombre):
+    try:
+        v = request.args.get(nombre, "")
+        return float(v) if v != "" else None
+    except ValueError:
+        return None
 
 @app.route("/tickets-pendientes")
+@dashboard_condicional
 def tickets_pendientes():
-    ws = open_worksheet()
-    rows = ws.get_all_records()
-    pendientes = []
-
-    for idx, r in enumerate(rows, start=2):
-        # normalizamos encabezados
-        row_norm = {k.strip().lower(): v for k, v in r.items()}
-        premio = (row_norm.get("premio") or "").strip().lower()
-
-        if premio in ("pendiente de validación", "revisión manual"):
-            pendientes.append({
-                "row_index": idx,
-                "timestamp": row_norm.get("timestamp", ""),
-                "nombre": row_norm.get("nombre", ""),
-                "telefono": row_norm.get("telefono", ""),
-                "tienda": row_norm.get("tienda", ""),
-                "monto_ocr": row_norm.get("monto", row_norm.get("cantidad detectada", "")),
-                "cantidad_detectada": row_norm.get("cantidad detectada", ""),
-                "premio": row_norm.get("premio", ""),
-                "ticket": row_norm.get("ticket", ""),
-            })
+    # Consulta SQL al almacén local; ?rebuild=1 trae antes los cambios manuales del Sheet
+    if request.args.get("rebuild") == "1":
+        importar_sheet(forzar=True)
+    else:
+        _asegurar_store()
+
+    try:
+        pagina = int(request.args.get("page", 1))
+    except ValueError:
+        pagina = 1
+    edad_h = _float_arg("max_age_h")
+    filtros = {
+        "tienda": request.args.get("tienda", "").strip(),
+        "monto_min": _float_arg("monto_min"),
+        "monto_max": _float_arg("monto_max"),
+        "max_age_h": edad_h,
+    }
+    lista, total = ticket_store.tickets_pendientes(
+        pagina=pagina, por_pagina=PENDIENTES_POR_PAGINA,
+        tienda=filtros["tienda"] or None,
+        monto_min=filtros["monto_min"], monto_max=filtros["monto_max"],
+        max_edad_s=int(edad_h * 3600) if edad_h else None,
+    )
+    paginas = max(1, (total + PENDIENTES_POR_PAGINA - 1) // PENDIENTES_POR_PAGINA)
 
     hora_actual = datetime.utcnow().strftime("%d/%m/%Y %H:%M:%S")
     ano_actual = datetime.utcnow().year
+    ctx = dict(tickets=lista, hora_actual=hora_actual, ano_actual=ano_actual,
+               page=pagina, pages=paginas, total=total, filtros=filtros)
     if request.args.get("ajax"):
-        return render_template("tickets_table.html", tickets=pendientes, hora_actual=hora_actual, ano_actual=ano_actual)
+        return render_template("tickets_table.html", **ctx)
 
-    return render_template("tickets.html", tickets=pendientes, hora_actual=hora_actual, ano_actual=ano_actual)
+    return render_template("tickets.html", **ctx)
+
+def mensaje_premio(nombre, premio):
+    return f"""
+    🎉 ¡Felicidades, {nombre}!
+
+    Tu participación en *El Buen Fin Indiana* ha sido validada con éxito ✅
+    Has ganado un *{premio}* 🏆
+
+    Si hubiera algún detalle con tu entrega, nuestro equipo se pondrá en contacto.
+    El tiempo de entrega de tu premio es de 5 a 7 días hábiles.
+    Mantente pendiente de tu WhatsApp 📱
+    Recuerda que entre más compres, ¡mayor puede ser tu recompensa! ⚡
+
+    🔗 Bases completas:
+    👉 www.buenfinindiana.com/bases
+    """
+
+def _publicar_asignaciones(asignados):
+    """Avisa a los dashboards abiertos: filas resueltas y nuevo stock de cada premio."""
+    premios = sorted({x["premio"] for x in asignados})
+    p = r.pipeline(transaction=False)
+    for premio in premios:
+        p.get(f"premio:{premio}")
+    stock = dict(zip(premios, p.execute()))
+    delta = {}
+    for x in asignados:
+        delta[x["premio"]] = delta.get(x["premio"], 0) - 1
+
+    p = r.pipeline(transaction=False)
+    http_cache.bump(r, pipe=p)
+    series.registrar(r, pipe=p, premios=len(asignados))
+    for x in asignados:
+        eventos.publicar(r, "premio_asignado",
+                         {"row_index": x["row_index"], "telefono": x["telefono"], "premio": x["premio"]}, pipe=p)
+    for premio in premios:
+        eventos.publicar(r, "inventario",
+                         {"premio": premio, "disponibles": int(stock[premio] or 0), "delta": delta[premio]}, pipe=p)
+    p.execute()
+
+def _solo_digitos(x):
+    return "".join(ch for ch in str(x or "") if ch.isdigit())
 
 @app.route("/asignar-premio", methods=["POST"])
 def asignar_premio():
@@ -657,58 +522,69 @@ def asignar_premio():
     if not telefono:
         return jsonify({"error": "Falta el número de teléfono"}), 400
 
-    # 1. Calcular premio según el monto detectado
-    premio, tipo_premio = obtener_premio_especial(r, cantidad_detectada)
-    if not premio:
-        return jsonify({"error": "Sin premio disponible"}), 400
-
-    # 2. Acceder a Google Sheets
-    ws = open_worksheet()
-    rows = ws.get_all_values()
-    headers = [h.strip().lower() for h in rows[0]]
-
-    idx_tel      = headers.index("telefono")
-    idx_premio   = headers.index("premio")
-    idx_nombre   = headers.index("nombre")
-    idx_cantidad = headers.index("cantidad detectada") if "cantidad detectada" in headers else None
-
-    # Validar row_index
-    if row_index <= 1 or row_index > len(rows):
+    if row_index <= 1:
         return jsonify({"error": "Índice de fila inválido"}), 400
 
-    # 3. Verificar estado actual
-    valor_actual = rows[row_index - 1][idx_premio].strip().lower()
-    if valor_actual not in ("pendiente de validación", "revisión manual", "pendiente"):
-        return jsonify({"error": "La fila no está pendiente"}), 400
-
-    # 4. Obtener nombre desde la fila
-    nombre = rows[row_index - 1][idx_nombre].strip()
-
-    # 5. Actualizar premio
-    ws.update_cell(row_index, idx_premio + 1, premio)
+    # 1. Leer sólo encabezados (cacheados) y la fila objetivo
+    ws = open_worksheet()
+    headers = header_map(ws)
+    if "premio" not in headers or "nombre" not in headers:
+        headers = header_map(ws, force=True)
+    idx_tel      = headers.get("telefono")
+    idx_premio   = headers["premio"]
+    idx_nombre   = headers["nombre"]
+    idx_cantidad = headers.get("cantidad detectada")
+
+    # Candado por fila ANTES de leerla: dos revisores no pueden asignar la misma
+    # fila a la vez, y la lectura/validación de abajo ya no puede quedar vieja
+    lock_key = f"asignando:{row_index}"
+    if not r.set(lock_key, telefono, nx=True, ex=30):
+        return jsonify({"error": "Otra persona está asignando este ticket"}), 409
 
-    # 6. Actualizar cantidad detectada si existe
-    if idx_cantidad is not None:
-        ws.update_cell(row_index, idx_cantidad + 1, cantidad_detectada)
+    try:
+        fila = ws.row_values(row_index)
+        if not fila:
+            return jsonify({"error": "Índice de fila inválido"}), 400
+
+        def celda(i):
+            return (fila[i] if i is not None and i < len(fila) else "").strip()
+
+        # 2. Compare-and-set: la fila debe seguir pendiente y ser del mismo teléfono
+        #    que vio el revisor (si se insertaron/borraron filas, row_index apunta a otra)
+        tel_fila = _solo_digitos(celda(idx_tel))
+        if tel_fila and tel_fila != _solo_digitos(telefono):
+            return jsonify({"error": "La fila cambió desde que se cargó; actualiza la tabla"}), 409
+        if not ticket_store.es_pendiente(celda(idx_premio)):
+            ticket_store.asignar_premio(row_index, celda(idx_premio))  # la copia local estaba desfasada
+            return jsonify({"error": "La fila no está pendiente"}), 400
+
+        # 3. Calcular premio según el monto detectado (decrementa inventario)
+        premio, tipo_premio = obtener_premio_especial(r, cantidad_detectada)
+        if not premio:
+            return jsonify({"error": "Sin premio disponible"}), 400
+
+        nombre = celda(idx_nombre)
+
+        # 4. Premio y cantidad detectada en UNA sola escritura
+        from gspread.utils import rowcol_to_a1  # gspread se importa al primer uso
+        cambios = [{"range": rowcol_to_a1(row_index, idx_premio + 1), "values": [[premio]]}]
+        if idx_cantidad is not None:
+            cambios.append({"range": rowcol_to_a1(row_index, idx_cantidad + 1), "values": [[cantidad_detectada]]})
+        try:
+            ws.batch_update(cambios, value_input_option="USER_ENTERED")
+        except Exception:
+            r.incr(f"premio:{premio}")  # devolver la unidad al inventario
+            raise
+        ticket_store.asignar_premio(row_index, premio)
+    finally:
+        r.delete(lock_key)
 
     # ✅ IMPORTANTE: marcar actualizado correctamente
     actualizado = True
+    _publicar_asignaciones([{"row_index": row_index, "telefono": telefono, "premio": premio}])
 
     # 7. Enviar mensaje al WhatsApp
-    msg = f"""
-    🎉 ¡Felicidades, {nombre}!
-
-    Tu participación en *El Buen Fin Indiana* ha sido validada con éxito ✅
-    Has ganado un *{premio}* 🏆
-
-    Si hubiera algún detalle con tu entrega, nuestro equipo se pondrá en contacto.
-    El tiempo de entrega de tu premio es de 5 a 7 días hábiles.
-    Mantente pendiente de tu WhatsApp 📱
-    Recuerda que entre más compres, ¡mayor puede ser tu recompensa! ⚡
-
-    🔗 Bases completas:
-    👉 www.buenfinindiana.com/bases
-    """
+    msg = mensaje_premio(nombre, premio)
     wsend(telefono, msg)
 
     return jsonify({
@@ -718,32 +594,197 @@ def asignar_premio():
         "monto": cantidad_detectada
     })
 
+ASIGNACION_LOTE_MAX = int(os.getenv("ASIGNACION_LOTE_MAX", "500"))
+
+@app.route("/asignar-premios", methods=["POST"])
+def asignar_premios_lote():
+    """
+    Asignación masiva: {"items": [{row_index, telefono, cantidad_detectada}, ...]}.
+    Una lectura de filas (batch_get), un reparto atómico de inventario, una
+    escritura (batch_update) y notificaciones encoladas. Responde por item.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("items") or []
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Faltan items"}), 400
+    if len(items) > ASIGNACION_LOTE_MAX:
+        return jsonify({"error": f"Máximo {ASIGNACION_LOTE_MAX} items por lote"}), 400
+
+    resultados = []
+    vistos = set()
+    for it in items:
+        res = {"row_index": it.get("row_index"), "telefono": str(it.get("telefono", "")).strip()}
+        try:
+            res["row_index"] = int(it.get("row_index", 0))
+            res["monto"] = float(it.get("cantidad_detectada", 0))
+        except (TypeError, ValueError):
+            res["error"] = "Datos inválidos"
+        if "error" not in res:
+            if not res["telefono"]:
+                res["error"] = "Falta el número de teléfono"
+            elif res["row_index"] <= 1:
+                res["error"] = "Índice de fila inválido"
+            elif res["row_index"] in vistos:
+                res["error"] = "Fila repetida en el lote"
+            else:
+                vistos.add(res["row_index"])
+        resultados.append(res)
+
+    vivos = [x for x in resultados if "error" not in x]
+    if not vivos:
+        return jsonify({"status": "ok", "asignados": 0, "items": resultados}), 200
+
+    # 1. Encabezados (cacheados) + todas las filas objetivo en una sola lectura
+    ws = open_worksheet()
+    headers = header_map(ws)
+    if "premio" not in headers or "nombre" not in headers:
+        headers = header_map(ws, force=True)
+    idx_tel, idx_premio = headers.get("telefono"), headers["premio"]
+    idx_nombre, idx_cantidad = headers["nombre"], headers.get("cantidad detectada")
+
+    # 2. Candados por fila primero; sólo las filas bloqueadas se leen (una sola
+    #    lectura) y se validan con compare-and-set
+    p = r.pipeline(transaction=False)
+    for x in vivos:
+        p.set(f"asignando:{x['row_index']}", x["telefono"], nx=True, ex=60)
+    for x, bloqueado in zip(vivos, p.execute()):
+        x["_lock"] = bool(bloqueado)
+        if not bloqueado:
+            x["error"] = "Otra persona está asignando este ticket"
+    bloqueados = [x for x in vivos if x["_lock"]]
+
+    candidatos = []
+    try:
+        filas = ws.batch_get([f"{x['row_index']}:{x['row_index']}" for x in bloqueados]) if bloqueados else []
+        for x, rango in zip(bloqueados, filas):
+            fila = rango[0] if rango else []
+            celda = lambda i: (fila[i] if i is not None and i < len(fila) else "").strip()
+            tel_fila = _solo_digitos(celda(idx_tel))
+            if not fila:
+                x["error"] = "Índice de fila inválido"
+            elif tel_fila and tel_fila != _solo_digitos(x["telefono"]):
+                x["error"] = "La fila cambió desde que se cargó"
+            elif not ticket_store.es_pendiente(celda(idx_premio)):
+                x["error"] = "La fila no está pendiente"
+                ticket_store.asignar_premio(x["row_index"], celda(idx_premio))
+            else:
+                x["nombre"] = celda(idx_nombre)
+                candidatos.append(x)
+
+        # 3. Reparto atómico de inventario para todo el lote
+        premios = obtener_premios_especiales(r, [x["monto"] for x in candidatos])
+        from gspread.utils import rowcol_to_a1
+        cambios, asignados = [], []
+        for x, premio in zip(candidatos, premios):
+            if not premio:
+                x["error"] = "Sin premio disponible"
+                continue
+            x["premio"] = premio
+            asignados.append(x)
+            cambios.append({"range": rowcol_to_a1(x["row_index"], idx_premio + 1), "values": [[premio]]})
+            if idx_cantidad is not None:
+                cambios.append({"range": rowcol_to_a1(x["row_index"], idx_cantidad + 1), "values": [[x["monto"]]]})
+
+        # 4. Todas las celdas en UNA escritura
+        if cambios:
+            try:
+                ws.batch_update(cambios, value_input_option="USER_ENTERED")
+            except Exception as e:
+                p = r.pipeline(transaction=False)
+                for x in asignados:
+                    p.incr(f"premio:{x.pop('premio')}")  # devolver inventario
+                    x["error"] = f"Error escribiendo en Sheets: {e}"
+                p.execute()
+                asignados = []
+
+        # 5. Actualizar la copia local y encolar notificaciones
+        if asignados:
+            p = r.pipeline(transaction=False)
+            for x in asignados:
+                x["status"] = "ok"
+                notificaciones.encolar(r, x["telefono"], mensaje_premio(x["nombre"], x["premio"]), pipe=p)
+            p.execute()
+            ticket_store.asignar_premios([(x["row_index"], x["premio"]) for x in asignados])
+            _publicar_asignaciones(asignados)
+            notificaciones.iniciar_worker(r_fondo, wsend)
+    finally:
+        locks = [f"asignando:{x['row_index']}" for x in vivos if x.get("_lock")]
+        if locks:
+            r.delete(*locks)
+
+    for x in resultados:
+        x.pop("_lock", None)
+        x.pop("nombre", None)
+    n_ok = sum(1 for x in resultados if x.get("status") == "ok")
+    return jsonify({"status": "ok", "asignados": n_ok, "items": resultados}), 200
+
+
+CATALOGO_POR_PAGINA = int(os.getenv("CATALOGO_POR_PAGINA", "48"))
+IMG_CACHE_MAX_AGE_S = int(os.getenv("IMG_CACHE_MAX_AGE_S", str(30 * 86400)))
+
+def _pagina_catalogo():
+    query = request.args.get("q", "").strip().lower()
+    try:
+        pagina = int(request.args.get("page", 1))
+    except ValueError:
+        pagina = 1
+    items, total = image_store.listar(query, pagina, CATALOGO_POR_PAGINA)
+    paginas = max(1, (total + CATALOGO_POR_PAGINA - 1) // CATALOGO_POR_PAGINA)
+    return query, pagina, paginas, total, items
 
 @app.route("/catalogo")
 def catalogo():
-    query = request.args.get("q", "").lower()
-    folder = "images_to_process"
-    if not os.path.exists(folder):
-        return "❌ Carpeta no encontrada", 404
-    imgs = [f for f in os.listdir(folder) if f.lower().endswith((".jpg", ".png", ".jpeg"))]
-    if query:
-        imgs = [f for f in imgs if query in f.lower()]
-    return render_template("catalogo.html", images=imgs, query=query)
+    query, pagina, paginas, total, items = _pagina_catalogo()
+    for it in items:
+        it["fecha"] = datetime.fromtimestamp(it["ts"]) if it.get("ts") else None
+    return render_template("catalogo.html", images=items, query=query,
+                           page=pagina, pages=paginas, total=total)
+
+@app.get("/catalogo.json")
+def catalogo_json():
+    query, pagina, paginas, total, items = _pagina_catalogo()
+    return jsonify({"q": query, "page": pagina, "pages": paginas, "total": total, "items": items}), 200
 
 @app.route("/catalogo_img/<filename>")
 def catalogo_img(filename):
-    return send_from_directory("images_to_process", filename)
+    if os.path.exists(os.path.join("images_to_process", filename)):
+        return send_from_directory("images_to_process", filename, max_age=IMG_CACHE_MAX_AGE_S)
+    # La vista pudo haberse compactado; el objeto sigue en el almacén por contenido
+    ruta = image_store.resolver(filename)
+    if not ruta:
+        return "❌ Imagen no encontrada", 404
+    return send_file(os.path.abspath(ruta), mimetype="image/jpeg", max_age=IMG_CACHE_MAX_AGE_S)
+
+@app.route("/catalogo_thumb/<filename>")
+def catalogo_thumb(filename):
+    try:
+        ancho = int(request.args.get("w", 320))
+    except ValueError:
+        ancho = 320
+    res = image_store.miniatura(filename, ancho)
+    if not res:
+        return "❌ Imagen no encontrada", 404
+    ruta, etag = res
+    # La miniatura depende sólo del hash del contenido: se puede cachear "para siempre"
+    resp = send_file(os.path.abspath(ruta), mimetype="image/jpeg", etag=etag, max_age=IMG_CACHE_MAX_AGE_S)
+    resp.cache_control.immutable = True
+    return resp
 
 # ------------------ Dashboard (inventario) ------------------
 @app.route("/inventario.json", methods=["GET"])
+@dashboard_condicional
 def inventario_json():
+    # ?sync=1 trae primero las ediciones manuales del Sheet al almacén local:
+    # el inventario en Redis se recalcula con esos datos ya frescos
+    if request.args.get("sync") == "1":
+        importar_sheet(forzar=True)
+
     # auto-sync (cada hora por defecto); forzar con ?sync=1
     if AUTO_SYNC_ON_DASHBOARD:
         auto_sync_from_sheets_if_stale(
             force=True,
             mode="available"
         )
-
     asignados_map, total_asignados = contar_premios_asignados()
     todos = sorted(set(DEFAULT_PREMIOS.keys()) | set(asignados_map.keys()), key=lambda x: x.lower())
 
@@ -774,13 +815,18 @@ def inventario_json():
     }), 200
 
 @app.route("/inventario", methods=["GET"])
+@dashboard_condicional
 def inventario_html():
+    # ?sync=1 trae primero las ediciones manuales del Sheet al almacén local:
+    # el inventario en Redis se recalcula con esos datos ya frescos
+    if request.args.get("sync") == "1":
+        importar_sheet(forzar=True)
+
     # auto-sync (cada hora por defecto); forzar con ?sync=1
     auto_sync_from_sheets_if_stale(
         force=True,
         mode="available"
     )
-
     asignados_map, total_asignados = contar_premios_asignados()
     todos = sorted(set(DEFAULT_PREMIOS.keys()) | set(asignados_map.keys()), key=lambda x: x.lower())
 
@@ -823,93 +869,278 @@ def inventario_html():
 
 # ------------------ Utilidades Sheets (opcionales) ------------------
 @app.get("/sheets/total-monto")
+@dashboard_condicional
 def total_monto():
+    _asegurar_store()
     try:
-        ws = open_worksheet()
-        rows = ws.get_all_values() or []
-        if not rows:
-            return jsonify({"total": 0.0})
-
-        headers = [h.strip().lower() for h in rows[0]]
-        posibles = ("monto", "total", "importe", "cantidad detectada")
-        idx = None
-        for i, h in enumerate(headers):
-            if any(p == h for p in posibles):
-                idx = i
-                break
-
-        if idx is None:
-            return jsonify({"total": 0.0, "error": "No se encontró la columna Monto/Total/Importe"})
-
-        valores = [row[idx] for row in rows[1:] if idx < len(row)]
-        total = round(sum(parse_money(v) for v in valores), 2)
-        return jsonify({"total": total})
+        return jsonify({"total": ticket_store.total_monto()})
     except Exception as e:
-        print("❌ /sheets/total-monto error:", e, flush=True)
+        log.error("/sheets/total-monto error: %s", e)
         return jsonify({"total": 0.0, "error": str(e)}), 500
 
-@app.get("/sheets/top-tiendas")
-def top_tiendas():
+def _args_leaderboard():
     try:
         limit = int(request.args.get("limit", 8))
     except Exception:
         limit = 8
+    periodo = (request.args.get("periodo") or "total").strip().lower()
+    if periodo not in leaderboards.PERIODOS:
+        periodo = "total"
+    _asegurar_store()
+    try:
+        leaderboards.asegurar(r, ticket_store.filas_leaderboard, forzar=request.args.get("rebuild") == "1")
+    except redis.RedisError as e:
+        log.error("leaderboards.asegurar: %s", e)
+    return limit, periodo
 
-    counts, total = contar_tiendas()
-    ordenadas = sorted(counts.items(), key=lambda x: x[1], reverse=True)
-    top = ordenadas[:max(0, limit)]
+@app.get("/sheets/top-tiendas")
+@dashboard_condicional
+def top_tiendas():
+    """
+    Tiendas con más registros desde el leaderboard de Redis (ZREVRANGE).
+    ?periodo=total|hoy|semana  ?limit=N  ?rebuild=1 (reconstruye desde el almacén local)
+    """
+    limit, periodo = _args_leaderboard()
+    try:
+        top, distintas, total = leaderboards.top(r, "tiendas", periodo, limit)
+    except redis.RedisError as e:
+        # Sin Redis se cuenta en SQL (sólo acumulado)
+        log.error("leaderboard tiendas: %s", e)
+        conteos, total = ticket_store.contar_tiendas()
+        top = sorted(conteos.items(), key=lambda kv: (-kv[1], kv[0].lower()))[:limit]
+        distintas, periodo = len(conteos), "total"
 
     return jsonify({
-        "total_tiendas": len(counts),
+        "periodo": periodo,
+        "total_tiendas": distintas,
         "total_registros": total,
         "items": [{"tienda": n, "registros": c} for n, c in top]
     }), 200
 
 @app.get("/sheets/top-vendedores")
+@dashboard_condicional
 def top_vendedores():
     """
-    Devuelve los vendedores con más registros, basado en la columna 'Vendedor' del Sheet.
+    Vendedores con más registros (columna 'Vendedor'). El acumulado de la
+    campaña es un GROUP BY indexado en el almacén local (incluye ediciones
+    manuales importadas del Sheet); hoy/semana salen del leaderboard de Redis.
+    Mismos parámetros que /sheets/top-tiendas.
     """
+    limit, periodo = _args_leaderboard()
     try:
-        limit = int(request.args.get("limit", 8))
-    except Exception:
-        limit = 8
-
-    ws = open_worksheet()
-    rows = ws.get_all_values() or []
-    if not rows:
-        return jsonify({"total_vendedores": 0, "total_registros": 0, "items": []}), 200
-
-    headers = [h.strip().lower() for h in rows[0]]
-    if "vendedor" not in headers:
-        return jsonify({"error": "Columna 'Vendedor' no encontrada"}), 400
-
-    idx_vendedor = headers.index("vendedor")
-
-    counts = {}
-    total = 0
-    for row in rows[1:]:
-        if idx_vendedor < len(row):
-            vendedor = (row[idx_vendedor] or "").strip()
-            if not vendedor:
-                continue
-            vendedor_norm = " ".join(vendedor.split())
-            counts[vendedor_norm] = counts.get(vendedor_norm, 0) + 1
-            total += 1
-
-    ordenadas = sorted(counts.items(), key=lambda x: x[1], reverse=True)
-    top = ordenadas[:max(0, limit)]
+        if periodo == "total":
+            top, distintos, total = ticket_store.top_vendedores(limit)
+        else:
+            top, distintos, total = leaderboards.top(r, "vendedores", periodo, limit)
+    except redis.RedisError as e:
+        log.error("leaderboard vendedores: %s", e)
+        (top, distintos, total), periodo = ticket_store.top_vendedores(limit), "total"
 
     return jsonify({
-        "total_vendedores": len(counts),
+        "periodo": periodo,
+        "total_vendedores": distintos,
         "total_registros": total,
         "items": [{"vendedor": n, "registros": c} for n, c in top]
     }), 200
 
+# ------------------ Exportación ------------------
+@app.get("/export/tickets")
+def exportar_tickets():
+    """
+    Descarga en streaming de todos los tickets (con premio y productos del OCR).
+    ?formato=csv|jsonl  ?desde=YYYY-MM-DD  ?hasta=YYYY-MM-DD  ?tienda=  ?premio=  ?por_producto=1
+    """
+    formato = (request.args.get("formato") or "csv").strip().lower()
+    if formato not in exportar.FORMATOS:
+        return jsonify({"error": f"formato inválido: {formato}"}), 400
+    filtros = {k: (request.args.get(k) or "").strip() or None for k in ("desde", "hasta", "tienda", "premio")}
+    try:
+        exportar.fecha(filtros["desde"]), exportar.fecha(filtros["hasta"])
+    except ValueError:
+        return jsonify({"error": "fechas en formato YYYY-MM-DD"}), 400
+
+    _asegurar_store()
+    lineas = exportar.stream(formato, request.args.get("por_producto") == "1", **filtros)
+    nombre = f"tickets_{datetime.now():%Y%m%d_%H%M}.{formato}"
+    resp = Response(stream_with_context(lineas),
+                    mimetype="text/csv" if formato == "csv" else "application/x-ndjson")
+    resp.headers["Content-Disposition"] = f'attachment; filename="{nombre}"'
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+# ------------------ Eventos en vivo (SSE) ------------------
+@app.get("/eventos")
+def eventos_stream():
+    """Canal Server-Sent Events para tickets.html / inventario.html."""
+    resp = Response(eventos.stream(r_pubsub), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # nginx: no bufferizar el stream
+    return resp
+
+# ------------------ Métricas ------------------
+@app.get("/metrics/ocr")
+def metrics_ocr():
+    """Latencia, tokens y costo estimado por tier de OCR (acumulado en este worker)."""
+    return jsonify(metricas_ocr()), 200
+
+@app.get("/metrics/timeseries")
+@dashboard_condicional
+def metrics_timeseries():
+    """
+    Series de tiempo incrementales (sin leer el Sheet).
+    ?res=min|hora|dia (default hora)  ?n=cubetas (default 24)
+    """
+    res = request.args.get("res", "hora")
+    if res not in series.RESOLUCIONES:
+        return jsonify({"error": f"res debe ser una de {list(series.RESOLUCIONES)}"}), 400
+    try:
+        n = int(request.args.get("n", 24))
+    except ValueError:
+        n = 24
+    return jsonify({
+        "res": res,
+        "paso_s": series.RESOLUCIONES[res][0],
+        "metricas": list(series.METRICAS),
+        "puntos": series.serie(r, res, n),
+    }), 200
+
+@app.get("/analytics/vendedores")
+def analytics_vendedores():
+    """Escaneos de QR, visitantes únicos (HyperLogLog) y conversión a WhatsApp por vendedor."""
+    items = qr_analytics.resumen(r)
+    for it in items:
+        it["nombre"] = registro_vendedores.nombre(r, it["vendedor_id"])
+    return jsonify({"total_vendedores": len(items), "items": items}), 200
+
+@app.get("/analytics/vendedores/<vendedor_id>")
+def analytics_vendedor(vendedor_id):
+    """Serie por hora (?horas=48) de escaneos y mensajes de un vendedor."""
+    try:
+        horas = int(request.args.get("horas", 48))
+    except ValueError:
+        horas = 48
+    vendedor_id = registro_vendedores.canonico(r, vendedor_id)
+    out = qr_analytics.detalle(r, vendedor_id, horas)
+    out["nombre"] = registro_vendedores.nombre(r, vendedor_id)
+    return jsonify(out), 200
+
+@app.get("/status/sesiones")
+def status_sesiones():
+    """Memoria de sesiones en Redis: ?telefono=... para una, si no una muestra (?n=200)."""
+    telefono = request.args.get("telefono")
+    if telefono:
+        return jsonify({"telefono": telefono, "bytes": sesiones.memoria(r, telefono)}), 200
+    try:
+        n = int(request.args.get("n", 200))
+    except ValueError:
+        n = 200
+    return jsonify(sesiones.memoria_muestra(r, max(1, min(n, 5000)))), 200
+
+@app.get("/status/dependencias")
+def status_dependencias():
+    """Circuit breakers (openai, graph, sheets), pools de Redis y control de carga en este worker."""
+    estados = estado_circuitos()
+    pools = redis_pool.estado()
+    degradado = any(e["estado"] != "cerrado" for e in estados.values()) or not all(p["ok"] for p in pools.values())
+    return jsonify({"degradado": degradado, "dependencias": estados, "redis": pools,
+                    "carga": control_carga.estado(r)}), 200
+
+@app.get("/metrics")
+def metrics():
+    """Formato Prometheus (latencias por ruta y dependencia, errores, colas); agrega todos los workers."""
+    cuerpo, tipo = metricas.exponer()
+    return Response(cuerpo, content_type=tipo)
+
+# ------------------ Profiler (admin) ------------------
+def _admin_profiler_ok():
+    # Sin PROFILER_TOKEN configurado la página queda cerrada (autorizado() da False)
+    return profiler.autorizado(request.headers.get(profiler.HEADER) or request.args.get("token"))
+
+@app.get("/admin/profiler.json")
+def admin_profiler_json():
+    if not _admin_profiler_ok():
+        return jsonify({"error": "no autorizado"}), 403
+    limit = request.args.get("limit", 20, type=int)
+    return jsonify({"muestreo_pct": profiler.PROFILER_MUESTREO, "rutas": profiler.resumen(r, limit)}), 200
+
+@app.get("/admin/profiler")
+def admin_profiler():
+    """Funciones más costosas por ruta (muestras de cProfile acumuladas en Redis)."""
+    if not _admin_profiler_ok():
+        return "No autorizado", 403
+    limit = request.args.get("limit", 15, type=int)
+    return render_template("profiler.html", rutas=profiler.resumen(r, limit),
+                           muestreo=profiler.PROFILER_MUESTREO, token=request.args.get("token", ""))
+
+@app.post("/admin/profiler/limpiar")
+def admin_profiler_limpiar():
+    if not _admin_profiler_ok():
+        return jsonify({"error": "no autorizado"}), 403
+    return jsonify({"borradas": profiler.limpiar(r)}), 200
+
 # ------------------ Raíz ------------------
 @app.route("/")
 def index():
     return "Chatbot Buen Fin Indiana 2025", 200
 
+# ------------------ Arranque (warm-up) ------------------
+_calentamiento = {"listo": False, "pasos": {}}
+
+def calentar():
+    """
+    Deja el worker listo antes de recibir tráfico: importa OpenAI/PIL, abre
+    los worksheets (auth de Google), sincroniza el catálogo de premios y
+    llena los caches (vendedores, almacén local, leaderboards). Cada paso es
+    best-effort y se mide; al terminar /status/listo responde 200.
+    Lo llama el servidor (post_worker_init de Gunicorn o __main__).
+    """
+    logs.configurar()  # idempotente; Gunicorn ya lo arrancó antes de importar app
+    pasos = [
+        ("redis",       lambda: (r.ping(), r_fondo.ping())),
+        ("whatsapp",    whatsapp),
+        ("ocr",         ticket_validator.precargar),
+        ("sheets",      lambda: header_map(open_worksheet())),
+        ("sheets_log",  sheets_logger.precargar),
+        ("premios",     auto_sync_from_sheets_if_stale),
+        ("vendedores",  lambda: registro_vendedores.registro(r)),
+        ("tickets",     lambda: ticket_store.asegurar(open_worksheet)),
+        ("leaderboards", lambda: leaderboards.asegurar(r_fondo, ticket_store.filas_leaderboard)),
+        ("replicador",  iniciar_replicador),
+        ("notificaciones", lambda: notificaciones.iniciar_worker(r_fondo, wsend)),
+    ]
+    for nombre, fn in pasos:
+        t0 = time.perf_counter()
+        try:
+            fn()
+            ok = True
+        except Exception as e:
+            log.warning("calentar %s: %s", nombre, e)
+            ok = False
+        _calentamiento["pasos"][nombre] = {"ok": ok, "ms": round(1000 * (time.perf_counter() - t0), 1)}
+    _calentamiento["listo"] = True
+    log.info("worker listo", extra={"pasos": _calentamiento["pasos"]})
+    return _calentamiento
+
+@app.get("/status/listo")
+def status_listo():
+    """Readiness: 503 hasta que terminó calentar()."""
+    return jsonify(_calentamiento), 200 if _calentamiento["listo"] else 503
+
+def apagar(timeout_s: float = 20):
+    """
+    Apagado ordenado del worker (worker_exit de Gunicorn): termina el ticket
+    que se está replicando y el mensaje que se está enviando; lo que queda
+    sigue en SQLite / Redis para el siguiente worker.
+    """
+    _calentamiento["listo"] = False
+    replicador_ok = ticket_store.detener_replicador(timeout_s)
+    notif_ok = notificaciones.detener_worker(timeout_s)
+    log.info("worker apagado", extra={"replicador_ok": replicador_ok, "notificaciones_ok": notif_ok})
+    redis_pool.cerrar()
+    logs.detener()
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5002, debug=True)
\ No newline at end of file
+    # Sólo desarrollo; en producción: gunicorn -c gunicorn.conf.py app:app
+    calentar()
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5002")),
+            debug=os.getenv("FLASK_DEBUG") == "1", threaded=True)
\ No newline at end of file
@@ -0,0 +1,97 @@
+# bench_arranque.py
+#!/usr/bin/env python3
+"""
+Benchmark de arranque del worker.
+
+Mide, cada vez en un intérprete nuevo (como un worker recién creado):
+  - import de app.py (mediana de --repeticiones)
+  - primera y segunda petición a cada ruta, sin calentar y después de
+    app.calentar(), para ver cuánto del costo se mueve al warm-up
+
+Usa la configuración real (.env, Redis, Google Sheets), así que correrlo
+contra el entorno de staging.
+
+  python bench_arranque.py
+  python bench_arranque.py --repeticiones 10 --rutas /inventario.json /sheets/top-tiendas
+  python bench_arranque.py --importtime     # los 15 módulos más caros al importar
+"""
+import sys, json, argparse, subprocess, statistics
+
+RUTAS = ["/inventario.json", "/sheets/top-tiendas", "/sheets/top-vendedores", "/sheets/total-monto",
+         "/tickets-pendientes"]
+
+_SCRIPT_IMPORT = """
+import time, json
+t0 = time.perf_counter()
+import app
+print(json.dumps({"import_ms": 1000 * (time.perf_counter() - t0)}))
+"""
+
+_SCRIPT_PETICIONES = """
+import time, json, sys
+calentar, rutas = sys.argv[1] == "1", sys.argv[2:]
+t0 = time.perf_counter()
+import app
+out = {"import_ms": 1000 * (time.perf_counter() - t0), "calentar_ms": 0, "rutas": {}}
+if calentar:
+    t0 = time.perf_counter()
+    app.calentar()
+    out["calentar_ms"] = 1000 * (time.perf_counter() - t0)
+c = app.app.test_client()
+for ruta in rutas:
+    tiempos = []
+    for _ in range(2):
+        t0 = time.perf_counter()
+        status = c.get(ruta).status_code
+        tiempos.append(1000 * (time.perf_counter() - t0))
+    out["rutas"][ruta] = {"status": status, "primera_ms": tiempos[0], "segunda_ms": tiempos[1]}
+print(json.dumps(out))
+"""
+
+
+def _correr(script: str, *args: str) -> dict:
+    res = subprocess.run([sys.executable, "-c", script, *args], capture_output=True, text=True)
+    if res.returncode != 0:
+        raise SystemExit(f"falló el subproceso:\n{res.stderr[-2000:]}")
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def importtime(top: int = 15):
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], capture_output=True, text=True)
+    filas = []
+    for linea in res.stderr.splitlines():
+        partes = linea.split("|")
+        if len(partes) == 3 and partes[1].strip().isdigit():
+            filas.append((int(partes[1]), partes[2].rstrip()))
+    for us, modulo in sorted(filas, reverse=True)[:top]:
+        print(f"{us / 1000:9.1f} ms  {modulo}")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark de arranque (import, warm-up, primera petición)")
+    ap.add_argument("--repeticiones", type=int, default=5)
+    ap.add_argument("--rutas", nargs="*", default=RUTAS)
+    ap.add_argument("--importtime", action="store_true")
+    args = ap.parse_args(argv)
+
+    if args.importtime:
+        importtime()
+        return 0
+
+    imports = [_correr(_SCRIPT_IMPORT)["import_ms"] for _ in range(args.repeticiones)]
+    print(f"import app: mediana {statistics.median(imports):.0f} ms "
+          f"(min {min(imports):.0f}, max {max(imports):.0f}, n={len(imports)})\n")
+
+    frio = _correr(_SCRIPT_PETICIONES, "0", *args.rutas)
+    tibio = _correr(_SCRIPT_PETICIONES, "1", *args.rutas)
+    print(f"calentar(): {tibio['calentar_ms']:.0f} ms\n")
+    print(f"{'ruta':28} {'sin calentar 1a/2a (ms)':>26} {'calentado 1a/2a (ms)':>24}")
+    for ruta in args.rutas:
+        f, t = frio["rutas"][ruta], tibio["rutas"][ruta]
+        print(f"{ruta:28} {f['primera_ms']:12.0f} /{f['segunda_ms']:8.0f}   "
+              f"{t['primera_ms']:12.0f} /{t['segunda_ms']:8.0f}   [{f['status']}/{t['status']}]")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# bench_carga.py
+#!/usr/bin/env python3
+"""
+Benchmark de carga: servidor de desarrollo vs perfiles de Gunicorn.
+
+Para cada modo levanta el servidor en un puerto libre, espera a que
+/status/listo responda 200 (warm-up terminado), manda tráfico concurrente
+durante --segundos y lo apaga con SIGTERM (midiendo cuánto tarda el
+apagado ordenado). Usa la configuración real (.env, Redis, Sheets).
+
+  python bench_carga.py
+  python bench_carga.py --modos gthread gevent --concurrencia 64 --rutas /inventario.json /webhook
+"""
+import os, sys, time, signal, socket, argparse, threading, statistics, subprocess
+
+import requests
+
+RUTAS = ["/inventario.json", "/sheets/top-tiendas", "/tickets-pendientes", "/sheets/total-monto"]
+
+MODOS = {
+    "dev":     lambda puerto: ([sys.executable, "app.py"], {"PORT": str(puerto)}),
+    "sync":    lambda puerto: (["gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+                               {"PORT": str(puerto), "GUNICORN_WORKER_CLASS": "sync"}),
+    "gthread": lambda puerto: (["gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+                               {"PORT": str(puerto), "GUNICORN_WORKER_CLASS": "gthread"}),
+    "gevent":  lambda puerto: (["gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+                               {"PORT": str(puerto), "GUNICORN_WORKER_CLASS": "gevent"}),
+}
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _esperar_listo(base: str, proc: subprocess.Popen, limite_s: float = 120) -> float:
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < limite_s:
+        if proc.poll() is not None:
+            raise RuntimeError("el servidor terminó antes de estar listo")
+        try:
+            if requests.get(f"{base}/status/listo", timeout=2).status_code == 200:
+                return time.monotonic() - t0
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("timeout esperando /status/listo")
+
+
+def _carga(base: str, rutas, concurrencia: int, segundos: float):
+    latencias, errores, lock = [], [0], threading.Lock()
+    fin = time.monotonic() + segundos
+
+    def cliente(i: int):
+        s = requests.Session()
+        n = i
+        while time.monotonic() < fin:
+            ruta = rutas[n % len(rutas)]
+            n += 1
+            t0 = time.perf_counter()
+            try:
+                ok = s.get(base + ruta, timeout=30).status_code < 500
+            except requests.RequestException:
+                ok = False
+            dur = time.perf_counter() - t0
+            with lock:
+                latencias.append(dur)
+                if not ok:
+                    errores[0] += 1
+
+    hilos = [threading.Thread(target=cliente, args=(i,)) for i in range(concurrencia)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return latencias, errores[0]
+
+
+def _percentil(valores, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))]
+
+
+def correr_modo(modo: str, rutas, concurrencia: int, segundos: float):
+    puerto = _puerto_libre()
+    cmd, env = MODOS[modo](puerto)
+    proc = subprocess.Popen(cmd, env={**os.environ, **env},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{puerto}"
+    try:
+        arranque = _esperar_listo(base, proc)
+        lat, errores = _carga(base, rutas, concurrencia, segundos)
+    finally:
+        t0 = time.monotonic()
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        apagado = time.monotonic() - t0
+    return {
+        "modo": modo, "arranque_s": arranque, "apagado_s": apagado,
+        "peticiones": len(lat), "rps": len(lat) / segundos, "errores": errores,
+        "p50_ms": 1000 * _percentil(lat, 50), "p95_ms": 1000 * _percentil(lat, 95),
+        "p99_ms": 1000 * _percentil(lat, 99), "media_ms": 1000 * statistics.mean(lat) if lat else 0,
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark de carga por modo de servidor")
+    ap.add_argument("--modos", nargs="*", default=["dev", "sync", "gthread", "gevent"], choices=list(MODOS))
+    ap.add_argument("--rutas", nargs="*", default=RUTAS)
+    ap.add_argument("--concurrencia", type=int, default=32)
+    ap.add_argument("--segundos", type=float, default=20)
+    args = ap.parse_args(argv)
+
+    print(f"{'modo':8} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errores':>8} {'arranque':>9} {'apagado':>8}")
+    for modo in args.modos:
+        if modo == "gevent":
+            try:
+                import gevent  # noqa: F401
+            except ImportError:
+                print(f"{modo:8} (omitido: pip install gevent)")
+                continue
+        try:
+            r = correr_modo(modo, args.rutas, args.concurrencia, args.segundos)
+        except RuntimeError as e:
+            print(f"{modo:8} (falló: {e})")
+            continue
+        print(f"{r['modo']:8} {r['rps']:8.1f} {r['p50_ms']:7.0f}ms {r['p95_ms']:7.0f}ms {r['p99_ms']:7.0f}ms "
+              f"{r['errores']:8d} {r['arranque_s']:8.1f}s {r['apagado_s']:7.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+# circuit_breaker.py
+import os, time, threading
+from functools import wraps
+from typing import Callable, Dict, Any, Optional
+
+import metricas
+import logs
+
+log = logs.obtener("circuit_breaker")
+
+FALLOS_MAX = int(os.getenv("CB_FALLOS_MAX", "5"))    # fallos seguidos para abrir el circuito
+RESET_S    = float(os.getenv("CB_RESET_S", "30"))    # segundos abierto antes de probar (half-open)
+
+CERRADO, ABIERTO, SEMI = "cerrado", "abierto", "semi_abierto"
+
+
+def _status_http(e: Exception) -> Optional[int]:
+    """Status HTTP de la excepción: openai (status_code), requests / gspread (response.status_code)."""
+    status = getattr(e, "status_code", None)
+    if status is None:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def es_falla_de_dependencia(e: Exception) -> bool:
+    """
+    Sólo cuenta para abrir el circuito lo que indica que la dependencia está
+    caída o saturada: 5xx, 429, timeouts y errores de red/conexión. Un 4xx
+    (imagen muy grande, bad request, política de contenido) o un JSON mal
+    formado es un problema de ESA petición: la dependencia respondió.
+    """
+    status = _status_http(e)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    # openai.APIConnectionError / APITimeoutError, httpx.ConnectError / ReadTimeout,
+    # requests.ConnectionError / Timeout, etc. (sin importar esas librerías aquí)
+    return any("Timeout" in c.__name__ or "Connection" in c.__name__ for c in type(e).__mro__)
+
+
+class CircuitoAbierto(Exception):
+    """Se lanza sin llamar a la dependencia cuando su circuito está abierto."""
+
+    def __init__(self, nombre: str, reintento_en: float):
+        super().__init__(f"Circuito '{nombre}' abierto; reintento en {reintento_en:.0f}s")
+        self.nombre = nombre
+        self.reintento_en = reintento_en
+
+
+class CircuitBreaker:
+    """
+    Circuito por dependencia (OpenAI, Graph API, Sheets).
+    - cerrado: las llamadas pasan; `fallos_max` errores seguidos lo abren.
+    - abierto: falla rápido con CircuitoAbierto durante `reset_s`.
+    - semi_abierto: deja pasar una sola llamada de prueba; si sale bien cierra,
+      si falla vuelve a abrir.
+    El estado vive en memoria del proceso (cada worker tiene el suyo).
+    """
+
+    def __init__(self, nombre: str, fallos_max: int = FALLOS_MAX, reset_s: float = RESET_S):
+        self.nombre = nombre
+        self.fallos_max = fallos_max
+        self.reset_s = reset_s
+        self._lock = threading.Lock()
+        self._estado = CERRADO
+        self._fallos = 0
+        self._abierto_desde = 0.0
+        self._probando = False
+        self._stats = {"llamadas": 0, "exitos": 0, "errores": 0, "errores_peticion": 0,
+                       "rechazadas": 0, "aperturas": 0}
+        self._ultimo_error = ""
+
+    # ---- transición de estados ----
+    def _antes(self):
+        with self._lock:
+            self._stats["llamadas"] += 1
+            if self._estado == ABIERTO:
+                restante = self.reset_s - (time.monotonic() - self._abierto_desde)
+                if restante > 0:
+                    self._stats["rechazadas"] += 1
+                    raise CircuitoAbierto(self.nombre, restante)
+                self._estado = SEMI
+                self._probando = False
+            if self._estado == SEMI:
+                if self._probando:
+                    self._stats["rechazadas"] += 1
+                    raise CircuitoAbierto(self.nombre, self.reset_s)
+                self._probando = True
+
+    def _exito(self, stat: str = "exitos"):
+        with self._lock:
+            self._stats[stat] += 1
+            self._fallos = 0
+            self._estado = CERRADO
+            self._probando = False
+
+    def _fallo(self, e: Exception):
+        with self._lock:
+            self._stats["errores"] += 1
+            self._ultimo_error = str(e)[:200]
+            self._fallos += 1
+            if self._estado == SEMI or self._fallos >= self.fallos_max:
+                if self._estado != ABIERTO:
+                    self._stats["aperturas"] += 1
+                    log.warning("circuito abierto", extra={"dependencia": self.nombre, "fallos": self._fallos,
+                                                           "error": self._ultimo_error})
+                self._estado = ABIERTO
+                self._abierto_desde = time.monotonic()
+                self._probando = False
+
+    # ---- API ----
+    def call(self, fn: Callable, *args, **kwargs):
+        operacion = getattr(fn, "__name__", "").lstrip("_")
+        operacion = "llamada" if not operacion or operacion == "<lambda>" else operacion
+        try:
+            self._antes()
+        except CircuitoAbierto as e:
+            metricas.observar(self.nombre, operacion, 0.0, e)
+            raise
+        t0 = time.perf_counter()
+        try:
+            res = fn(*args, **kwargs)
+        except Exception as e:
+            metricas.observar(self.nombre, operacion, time.perf_counter() - t0, e)
+            if es_falla_de_dependencia(e):
+                self._fallo(e)
+            else:
+                self._exito("errores_peticion")  # la dependencia respondió: cuenta como sana
+            raise
+        metricas.observar(self.nombre, operacion, time.perf_counter() - t0)
+        self._exito()
+        return res
+
+    def registrar_fallo(self, e: Exception):
+        """Para dependencias que no lanzan excepción (p. ej. HTTP 5xx devuelto como respuesta)."""
+        self._fallo(e)
+
+    def __call__(self, fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            return self.call(fn, *args, **kwargs)
+        return wrapper
+
+    @property
+    def abierto(self) -> bool:
+        with self._lock:
+            return self._estado == ABIERTO and (time.monotonic() - self._abierto_desde) < self.reset_s
+
+    def estado(self) -> Dict[str, Any]:
+        with self._lock:
+            estado = self._estado
+            reintento = 0.0
+            if estado == ABIERTO:
+                reintento = max(0.0, self.reset_s - (time.monotonic() - self._abierto_desde))
+                if reintento == 0.0:
+                    estado = SEMI
+            return {
+                "estado": estado,
+                "fallos_seguidos": self._fallos,
+                "reintento_en_s": round(reintento, 1),
+                "ultimo_error": self._ultimo_error,
+                **self._stats,
+            }
+
+
+_registro: Dict[str, CircuitBreaker] = {}
+_registro_lock = threading.Lock()
+
+
+def obtener(nombre: str, fallos_max: Optional[int] = None, reset_s: Optional[float] = None) -> CircuitBreaker:
+    """Devuelve (o crea) el circuito compartido de una dependencia."""
+    with _registro_lock:
+        cb = _registro.get(nombre)
+        if cb is None:
+            cb = CircuitBreaker(
+                nombre,
+                fallos_max=fallos_max if fallos_max is not None else FALLOS_MAX,
+                reset_s=reset_s if reset_s is not None else RESET_S,
+            )
+            _registro[nombre] = cb
+        return cb
+
+
+def estado_todos() -> Dict[str, Dict[str, Any]]:
+    with _registro_lock:
+        circuitos = list(_registro.values())
+    return {cb.nombre: cb.estado() for cb in circuitos}
+
+
+class Protegido:
+    """
+    Envuelve un objeto (p. ej. un gspread.Worksheet) para que todos sus
+    métodos pasen por el circuito indicado.
+    """
+
+    def __init__(self, obj, breaker: CircuitBreaker):
+        self._obj = obj
+        self._breaker = breaker
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        if callable(attr):
+            return lambda *a, **kw: self._breaker.call(attr, *a, **kw)
+        return attr
@@ -0,0 +1,170 @@
+# control_carga.py
+"""
+Control de carga del webhook (load shedding).
+
+Antes de atender un mensaje entrante se decide:
+  "viejo"     timestamp más viejo que MSG_DESCARTAR_S -> se descarta sin responder
+              (la cola de WhatsApp se atoró y contestar sólo haría spam)
+  "degradar"  más viejo que MSG_DEGRADAR_S -> respuesta fija barata, sin sesión/OCR
+  "limitado"  el teléfono agotó su token bucket (FLOOD_CAPACIDAD / FLOOD_TASA) -> se ignora,
+              con un aviso como máximo cada FLOOD_AVISO_S
+  "saturado"  la cola de notificaciones o la latencia del webhook pasan los límites
+              -> respuesta fija durante CARGA_ENFRIAMIENTO_S
+  "ok"        se procesa normal
+
+El token bucket vive en Redis (Lua, atómico entre workers). La latencia es
+un promedio móvil por proceso, en dos series: el OCR (tramo_ocr) se mide
+aparte con su propio límite (CARGA_MAX_LATENCIA_OCR_S) y se descuenta del
+resto del mensaje, porque una foto normal tarda más que CARGA_MAX_LATENCIA_S.
+Al entrar en modo saturado ambos promedios vuelven a cero: durante el
+enfriamiento no se atiende nada (no hay muestras nuevas), así que al terminar
+deciden los mensajes que se procesen después y no el que disparó el modo.
+"""
+import os, time, threading, contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+import notificaciones
+import logs
+
+log = logs.obtener("carga")
+
+MSG_DEGRADAR_S   = int(os.getenv("MSG_DEGRADAR_S", "120"))
+MSG_DESCARTAR_S  = int(os.getenv("MSG_DESCARTAR_S", "900"))
+FLOOD_CAPACIDAD  = float(os.getenv("FLOOD_CAPACIDAD", "10"))
+FLOOD_TASA       = float(os.getenv("FLOOD_TASA", "0.5"))      # tokens por segundo
+FLOOD_AVISO_S    = int(os.getenv("FLOOD_AVISO_S", "60"))
+CARGA_MAX_COLA   = int(os.getenv("CARGA_MAX_COLA", "500"))
+CARGA_MAX_LATENCIA_S  = float(os.getenv("CARGA_MAX_LATENCIA_S", "8"))       # mensaje sin contar el OCR
+CARGA_MAX_LATENCIA_OCR_S = float(os.getenv("CARGA_MAX_LATENCIA_OCR_S", "60"))
+CARGA_ENFRIAMIENTO_S  = int(os.getenv("CARGA_ENFRIAMIENTO_S", "30"))
+
+MENSAJE_SATURADO = ("⏳ Estamos recibiendo muchos mensajes en este momento. "
+                    "Por favor intenta de nuevo en unos minutos.")
+MENSAJE_LIMITADO = "✋ Estás enviando mensajes muy rápido. Espera un momento y vuelve a intentar."
+
+CONTADORES_KEY = "carga:decisiones"
+
+_LUA_TOKEN_BUCKET = """
+local cap   = tonumber(ARGV[1])
+local tasa  = tonumber(ARGV[2])
+local ahora = tonumber(ARGV[3])
+local b = redis.call('HMGET', KEYS[1], 't', 'ts')
+local tokens = tonumber(b[1]) or cap
+local ts = tonumber(b[2]) or ahora
+tokens = math.min(cap, tokens + math.max(0, ahora - ts) * tasa)
+local ok = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  ok = 1
+end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 'ts', tostring(ahora))
+redis.call('EXPIRE', KEYS[1], math.ceil(cap / tasa) + 60)
+return ok
+"""
+
+_lock = threading.Lock()
+_latencia_ewma = 0.0
+_latencia_ocr_ewma = 0.0
+_ocr_s: contextvars.ContextVar = contextvars.ContextVar("carga_ocr_s", default=0.0)  # OCR del mensaje en curso
+_saturado_hasta = 0.0
+_cola = (0.0, 0)  # (monotonic de la última lectura, profundidad)
+
+
+def tomar_token(redis_conn, telefono: str) -> bool:
+    return bool(redis_conn.eval(_LUA_TOKEN_BUCKET, 1, f"carga:tb:{telefono}",
+                                FLOOD_CAPACIDAD, FLOOD_TASA, time.time()))
+
+
+def _ewma(actual: float, muestra: float, alfa: float) -> float:
+    # Arranca en 0: un solo mensaje lento pesa `alfa`, no todo el promedio
+    return alfa * muestra + (1 - alfa) * actual
+
+
+@contextmanager
+def tramo_ocr():
+    """Marca el OCR del mensaje en curso: se mide aparte y medir() lo descuenta."""
+    t0 = time.monotonic()
+    try:
+        yield
+    finally:
+        _ocr_s.set(_ocr_s.get() + time.monotonic() - t0)
+
+
+def medir(duracion_s: float, alfa: float = 0.2):
+    """Registra cuánto tardó en atenderse un mensaje (promedio móvil exponencial), OCR aparte."""
+    global _latencia_ewma, _latencia_ocr_ewma
+    ocr_s = _ocr_s.get()
+    _ocr_s.set(0.0)  # el hilo atiende después otro mensaje
+    with _lock:
+        _latencia_ewma = _ewma(_latencia_ewma, max(0.0, duracion_s - ocr_s), alfa)
+        if ocr_s > 0:
+            _latencia_ocr_ewma = _ewma(_latencia_ocr_ewma, ocr_s, alfa)
+
+
+def _profundidad_cola(redis_conn) -> int:
+    # Se lee como máximo una vez por segundo por proceso
+    global _cola
+    leido, n = _cola
+    if time.monotonic() - leido >= 1.0:
+        n = notificaciones.pendientes(redis_conn)
+        _cola = (time.monotonic(), n)
+    return n
+
+
+def saturado(redis_conn) -> bool:
+    global _saturado_hasta, _latencia_ewma, _latencia_ocr_ewma
+    ahora = time.monotonic()
+    if ahora < _saturado_hasta:
+        return True
+    if (_profundidad_cola(redis_conn) > CARGA_MAX_COLA or _latencia_ewma > CARGA_MAX_LATENCIA_S
+            or _latencia_ocr_ewma > CARGA_MAX_LATENCIA_OCR_S):
+        _saturado_hasta = ahora + CARGA_ENFRIAMIENTO_S
+        log.warning("modo saturado", extra={"enfriamiento_s": CARGA_ENFRIAMIENTO_S, "cola": _cola[1],
+                                            "latencia_s": round(_latencia_ewma, 2),
+                                            "latencia_ocr_s": round(_latencia_ocr_ewma, 2)})
+        with _lock:
+            _latencia_ewma = _latencia_ocr_ewma = 0.0
+        return True
+    return False
+
+
+def evaluar(redis_conn, telefono: str, ts_mensaje: Optional[Any] = None) -> str:
+    """Decide qué hacer con un mensaje entrante (ver docstring del módulo)."""
+    decision = "ok"
+    try:
+        edad = time.time() - int(ts_mensaje) if ts_mensaje else 0
+    except (TypeError, ValueError):
+        edad = 0
+
+    try:
+        if edad > MSG_DESCARTAR_S:
+            decision = "viejo"
+        elif not tomar_token(redis_conn, telefono):
+            decision = "limitado"
+        elif edad > MSG_DEGRADAR_S:
+            decision = "degradar"
+        elif saturado(redis_conn):
+            decision = "saturado"
+
+        if decision != "ok":
+            redis_conn.hincrby(CONTADORES_KEY, decision, 1)
+    except Exception as e:
+        # Sin Redis no hay bucket ni cola que medir: se atiende normal (falla abierta)
+        log.warning("no se pudo evaluar la carga; se procesa el mensaje: %s", e)
+    return decision
+
+
+def avisar_limite(redis_conn, telefono: str) -> bool:
+    """True si toca mandarle el aviso de límite (uno por FLOOD_AVISO_S)."""
+    return bool(redis_conn.set(f"carga:aviso:{telefono}", 1, nx=True, ex=FLOOD_AVISO_S))
+
+
+def estado(redis_conn) -> Dict[str, Any]:
+    return {
+        "saturado": time.monotonic() < _saturado_hasta,
+        "latencia_ewma_s": round(_latencia_ewma, 3),
+        "latencia_ocr_ewma_s": round(_latencia_ocr_ewma, 3),
+        "cola_notificaciones": _profundidad_cola(redis_conn),
+        "decisiones": {k: int(v) for k, v in (redis_conn.hgetall(CONTADORES_KEY) or {}).items()},
+    }
@@ -38,31 +38,36 @@ def obtener_premio_disponible(redis_conn, prefix="premio:"):
         target -= qty
 
 
+# Definición de niveles y premios según rango de compra
+RANGOS_PREMIOS = [
+    (6000,   9999,   "Pelacables"),
+    (10000,  19999,  "Amazon $500"),
+    (20000,  39999,  "Electrodomésticos"),
+    (40000,  59999,  "Amazon $1500"),
+    (60000,  99999,  'Pantalla 40"'),
+    (100000, 149999, "Amazon $3500"),
+    (150000, 199999, "Smartphone"),
+    (200000, 299999, "Tablet premium"),
+    (300000, 499999, "Motoneta"),
+]
+
+
+def premio_para_monto(monto_factura):
+    """Nombre del premio que corresponde al monto, o None si no califica."""
+    for (minimo, maximo, nombre) in RANGOS_PREMIOS:
+        if minimo <= monto_factura <= maximo:
+            return nombre
+    return None
+
+
 def obtener_premio_especial(redis_conn, monto_factura):
     """
     Asigna premio según el rango de compra (MXN).
     Si no hay stock disponible para ese rango, devuelve (None, None).
     """
 
-    # Definición de niveles y premios según rango de compra
-    RANGOS_PREMIOS = [
-        (6000,   9999,   "Pelacables"),
-        (10000,  19999,  "Amazon $500"),
-        (20000,  39999,  "Electrodomésticos"),
-        (40000,  59999,  "Amazon $1500"),
-        (60000,  99999,  'Pantalla 40"'),
-        (100000, 149999, "Amazon $3500"),
-        (150000, 199999, "Smartphone"),
-        (200000, 299999, "Tablet premium"),
-        (300000, 499999, "Motoneta"),
-    ]
-
     # Buscar el rango correspondiente al monto de compra
-    premio = None
-    for (minimo, maximo, nombre) in RANGOS_PREMIOS:
-        if minimo <= monto_factura <= maximo:
-            premio = nombre
-            break
+    premio = premio_para_monto(monto_factura)
 
     # Si no entra en ningún rango, no califica
     if not premio:
@@ -84,4 +89,36 @@ def obtener_premio_especial(redis_conn, monto_factura):
         pass
 
     # Sin stock
-    return None, None
\ No newline at end of file
+    return None, None
+
+
+# Decrementa cada llave sólo si tiene stock; todo en una sola operación atómica.
+_LUA_DECR_LOTE = """
+local out = {}
+for i, k in ipairs(KEYS) do
+  local q = tonumber(redis.call('GET', k) or '0') or 0
+  if q > 0 then
+    redis.call('DECR', k)
+    out[i] = 1
+  else
+    out[i] = 0
+  end
+end
+return out
+"""
+
+
+def obtener_premios_especiales(redis_conn, montos):
+    """
+    Versión por lote de obtener_premio_especial: reparte premios para una
+    lista de montos en un solo paso atómico (script Lua), así dos lotes en
+    paralelo no pueden sobregirar el inventario.
+    Devuelve una lista alineada con `montos`: premio o None (sin rango o sin stock).
+    """
+    premios = [premio_para_monto(m) for m in montos]
+    keys = [f"premio:{p}" for p in premios if p]
+    if not keys:
+        return [None] * len(premios)
+
+    ok = iter(redis_conn.eval(_LUA_DECR_LOTE, len(keys), *keys))
+    return [p if (p and next(ok)) else None for p in premios]
@@ -0,0 +1,60 @@
+# eventos.py
+"""
+Eventos en vivo para los dashboards (Server-Sent Events sobre Redis pub/sub).
+
+Cualquier worker publica con publicar(); cada pestaña abierta mantiene una
+conexión a /eventos que sólo escucha el canal, así N pestañas no generan
+lecturas extra al Sheet.
+
+Tipos de evento:
+  inventario        {"premio", "disponibles", "delta"}
+  ticket_pendiente  {"row_index", "nombre", "telefono", "tienda", "monto_ocr", ...}
+  premio_asignado   {"row_index", "telefono", "premio"}
+"""
+import os, json, time
+from typing import Dict, Any, Iterator
+
+import logs
+
+log = logs.obtener("eventos")
+
+CANAL = os.getenv("EVENTOS_CANAL", "dashboard:eventos")
+HEARTBEAT_S = int(os.getenv("EVENTOS_HEARTBEAT_S", "15"))
+
+
+def publicar(redis_conn, tipo: str, data: Dict[str, Any], pipe=None):
+    """Publica un evento; nunca rompe el flujo que lo dispara."""
+    msg = json.dumps({"tipo": tipo, "data": data, "ts": int(time.time())}, ensure_ascii=False)
+    try:
+        (pipe if pipe is not None else redis_conn).publish(CANAL, msg)
+    except Exception as e:
+        log.error("no se pudo publicar: %s", e, extra={"tipo": tipo})
+
+
+def _sse(tipo: str, data: str) -> str:
+    return f"event: {tipo}\ndata: {data}\n\n"
+
+
+def stream(redis_conn) -> Iterator[str]:
+    """Generador SSE: reenvía los mensajes del canal y manda un ping cada HEARTBEAT_S."""
+    pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(CANAL)
+    try:
+        yield "retry: 5000\n\n"
+        ultimo = time.monotonic()
+        while True:
+            msg = pubsub.get_message(timeout=1.0)
+            if msg and msg.get("type") == "message":
+                raw = msg["data"]
+                try:
+                    tipo = json.loads(raw).get("tipo", "mensaje")
+                except ValueError:
+                    continue
+                yield _sse(tipo, raw)
+                ultimo = time.monotonic()
+            elif time.monotonic() - ultimo >= HEARTBEAT_S:
+                # Comentario SSE: mantiene viva la conexión a través de proxies
+                yield ": ping\n\n"
+                ultimo = time.monotonic()
+    finally:
+        pubsub.close()
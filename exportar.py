@@ -0,0 +1,120 @@
+# exportar.py
+#!/usr/bin/env python3
+"""
+Exportación de tickets en streaming (CSV o JSONL) desde el almacén local.
+
+Cada ticket sale con su premio asignado y, si existe, lo que leyó el OCR en
+images_processed/<archivo>.ai.json (total, confianza y renglones de
+productos). Las filas se generan de una en una (ticket_store.iterar lee por
+lotes), así que la memoria no crece con el número de tickets.
+
+Filtros: desde / hasta (YYYY-MM-DD, ambos incluidos), tienda, premio.
+Con por_producto, el CSV lleva un renglón por producto (los datos del
+ticket se repiten); en JSONL los productos van siempre como lista.
+
+CLI:
+  python exportar.py --formato csv --desde 2025-11-13 --hasta 2025-11-17 -o tickets.csv
+  python exportar.py --formato jsonl --tienda "Plaza Centro" --premio "Amazon $500"
+"""
+import os, io, csv, sys, json, argparse
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Iterable
+
+import ticket_store
+
+DIR_PROCESSED = "images_processed"
+FORMATOS = ("csv", "jsonl")
+
+CAMPOS = ["id", "timestamp", "telefono", "nombre", "tienda", "rfc_nombre", "correo", "ocupacion",
+          "medio", "vendedor", "monto", "monto_texto", "premio", "motivo", "archivo", "sheet_row",
+          "sync_estado", "ocr_total", "ocr_confianza", "ocr_productos"]
+CAMPOS_PRODUCTO = ["producto", "importe_linea"]
+
+
+def fecha(valor: Optional[str], fin: bool = False) -> Optional[float]:
+    """'YYYY-MM-DD' -> epoch local (con fin=True, el inicio del día siguiente)."""
+    if not valor:
+        return None
+    d = datetime.strptime(valor.strip(), "%Y-%m-%d")
+    return (d + timedelta(days=1) if fin else d).timestamp()
+
+
+def ocr(archivo: str) -> Dict[str, Any]:
+    vacio = {"ocr_total": None, "ocr_confianza": None, "productos": []}
+    # En el almacén `archivo` es la URL pública (https://.../catalogo_img/<nombre>.jpg);
+    # el .ai.json se guarda con el nombre de archivo pelón
+    nombre = (archivo or "").split("?", 1)[0].strip().rstrip("/").rsplit("/", 1)[-1]
+    if not nombre:
+        return vacio
+    try:
+        with open(os.path.join(DIR_PROCESSED, f"{nombre}.ai.json"), encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return vacio
+    productos = [{"descripcion": (p.get("description") or "").strip(), "importe": p.get("line_total")}
+                 for p in (data.get("products") or []) if isinstance(p, dict)]
+    return {"ocr_total": data.get("total"), "ocr_confianza": data.get("confidence_score"),
+            "productos": productos}
+
+
+def tickets(desde: Optional[str] = None, hasta: Optional[str] = None, tienda: Optional[str] = None,
+            premio: Optional[str] = None) -> Iterable[Dict[str, Any]]:
+    """Tickets filtrados con los datos del OCR, uno por uno."""
+    for t in ticket_store.iterar(fecha(desde), fecha(hasta, fin=True), tienda, premio):
+        o = ocr(t.get("archivo"))
+        t.update(ocr_total=o["ocr_total"], ocr_confianza=o["ocr_confianza"], productos=o["productos"])
+        yield t
+
+
+def _csv_linea(valores: List[Any]) -> str:
+    buf = io.StringIO()
+    csv.writer(buf).writerow(["" if v is None else v for v in valores])
+    return buf.getvalue()
+
+
+def csv_stream(filas: Iterable[Dict[str, Any]], por_producto: bool = False) -> Iterable[str]:
+    campos = CAMPOS[:-1] + CAMPOS_PRODUCTO if por_producto else CAMPOS
+    yield _csv_linea(campos)
+    for t in filas:
+        base = [t.get(k) for k in CAMPOS[:-1]]
+        if not por_producto:
+            yield _csv_linea(base + [" | ".join(f"{p['descripcion']}: {p['importe']}" for p in t["productos"])])
+            continue
+        for p in t["productos"] or [{"descripcion": "", "importe": None}]:
+            yield _csv_linea(base + [p["descripcion"], p["importe"]])
+
+
+def jsonl_stream(filas: Iterable[Dict[str, Any]]) -> Iterable[str]:
+    for t in filas:
+        yield json.dumps(t, ensure_ascii=False, default=str) + "\n"
+
+
+def stream(formato: str = "csv", por_producto: bool = False, **filtros) -> Iterable[str]:
+    filas = tickets(**filtros)
+    return jsonl_stream(filas) if formato == "jsonl" else csv_stream(filas, por_producto)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Exporta tickets (CSV/JSONL) desde el almacén local")
+    ap.add_argument("--formato", choices=FORMATOS, default="csv")
+    ap.add_argument("--desde", help="YYYY-MM-DD (incluido)")
+    ap.add_argument("--hasta", help="YYYY-MM-DD (incluido)")
+    ap.add_argument("--tienda")
+    ap.add_argument("--premio")
+    ap.add_argument("--por-producto", action="store_true", help="CSV: un renglón por producto del OCR")
+    ap.add_argument("-o", "--out", help="Archivo de salida (por defecto stdout)")
+    args = ap.parse_args(argv)
+
+    out = open(args.out, "w", encoding="utf-8", newline="") if args.out else sys.stdout
+    try:
+        for linea in stream(args.formato, args.por_producto, desde=args.desde, hasta=args.hasta,
+                            tienda=args.tienda, premio=args.premio):
+            out.write(linea)
+    finally:
+        if args.out:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
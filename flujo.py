@@ -0,0 +1,288 @@
+# flujo.py
+"""
+Máquina de estados de la conversación de registro (Buen Fin Indiana).
+
+Todo lo que cambia de campaña a campaña es DATO:
+  PASOS      preguntas en orden: campo, prompt (texto o botones), validador, error
+  MENSAJES   textos fijos (bienvenida, cierre, foto, otro ticket, ...)
+  CAMPANA_MODO=abierta|cerrada  (env) en lugar de comentar/descomentar el webhook
+
+Estados (el `paso` guardado en la sesión):
+  0..len(PASOS)-1   pregunta PASOS[paso]
+  FOTO              esperando la foto del ticket
+  OTRO_TICKET (99)  ¿tienes otro ticket? (Sí / No)
+  FIN (-1)          terminó o escribió SALIR
+
+Cada mensaje entrante se despacha en O(1) (dict estado -> handler) con
+validadores precompilados; las escrituras de sesión van en un pipeline.
+app.py sólo arma el Contexto con sus dependencias (WhatsApp, OCR, Sheets).
+"""
+import os, re
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import sesiones
+import registro_vendedores
+import logs
+
+log = logs.obtener("flujo")
+
+CAMPANA_MODO = os.getenv("CAMPANA_MODO", "cerrada").strip().lower()
+
+FIN = -1
+OTRO_TICKET = 99
+
+EMAIL_RE = re.compile(r"^[\w\.-]+@[\w\.-]+\.\w+$")
+
+
+# ------------------ Validadores ------------------
+# Reciben el texto y devuelven el valor a guardar, o None si no es válido.
+def texto_libre(texto: str) -> Optional[str]:
+    return texto or None
+
+def correo(texto: str) -> Optional[str]:
+    return texto if EMAIL_RE.match(texto) else None
+
+def opciones(mapa: Dict[str, str]) -> Callable[[str], Optional[str]]:
+    return mapa.get
+
+
+class Paso(NamedTuple):
+    campo: str
+    prompt: str
+    validador: Callable[[str], Optional[str]] = texto_libre
+    error: str = "❌ Respuesta no válida, intenta de nuevo."
+    botones: Tuple[str, ...] = ()
+
+
+MEDIOS = {"1": "Radio", "2": "Cartel publicitario", "3": "En tienda", "4": "Redes sociales"}
+
+PASOS: List[Paso] = [
+    Paso("nombre", "¡Listo! Por favor, escribe tu *nombre completo*."),
+    Paso("tienda", "Cuéntanos, ¿*en qué tienda* realizaste tu compra?"),
+    Paso("rfc_nombre",
+         "Ingresa el *RFC o Nombre completo* a quien está registrado el ticket o factura.\n"
+         "No importa si lo estás registrando con autorización de alguien más."),
+    Paso("correo", "Por favor ingresa tu *correo electrónico*.", correo,
+         "❌ El correo no parece válido.\nPor favor ingresa un *correo electrónico* válido (ejemplo: nombre@gmail.com)."),
+    Paso("ocupacion", "¿Cuál es tu *ocupación principal*?",
+         botones=("Electricista", "Contratista", "Otro")),
+    Paso("medio",
+         "📢 ¿Por qué medio te enteraste de la promoción?\n\n"
+         "1️⃣ Radio\n"
+         "2️⃣ Cartel publicitario\n"
+         "3️⃣ En tienda\n"
+         "4️⃣ Redes sociales\n\n"
+         "Por favor, responde con el *número* de tu opción (1–4).",
+         opciones(MEDIOS), "❌ Por favor escribe solo el número (1, 2, 3 o 4)."),
+]
+
+CAMPOS = [p.campo for p in PASOS]
+FOTO = TOTAL_CAMPOS = len(PASOS)  # cuando paso == TOTAL_CAMPOS, esperamos la foto
+
+MENSAJES = {
+    "bienvenida": "🎁 ¡Bienvenido a la promoción *Buen Fin Indiana*!\n"
+                  "Te haremos unas preguntas rápidas y después te pediremos la foto de tu ticket.",
+    "cierre": """La promoción Buen Fin Indiana 2025 ha llegado a su cierre oficial y queremos agradecer tu participación. Tu confianza y preferencia hicieron posible ¡el gran éxito de esta edición!.
+
+En los próximos días continuaremos con la validación final y la entrega de premios pendientes a clientes finales y ejecutivos.
+Gracias por elegir Indiana Wire & Cable
+
+¡Nos vemos en 2026!""",
+    "sin_sesion": "👋 Para registrarte escribe *QUIERO PARTICIPAR*.",
+    "salir": "✅ Gracias, puedes volver más tarde escribiendo *QUIERO PARTICIPAR*.",
+    "foto": "📸 ¡Genial!\nEnvía una *foto clara* de tu *ticket/factura* participante.\n"
+            "Asegúrate que se vea: Folio, Fecha, Monto y Productos Indiana.",
+    "foto_otro": "📸 Perfecto, envía una *foto clara* de tu *2º ticket* de compra participante.",
+    "foto_documento": "❌ Recibí un archivo ({filename}) pero necesito una *imagen* de tu ticket (JPG/PNG).",
+    "foto_texto": "❌ Recibí texto, pero necesito una *imagen* de tu ticket (JPG/PNG).",
+    "foto_otro_tipo": "❌ Tipo de archivo no válido. Envíe una *imagen* (JPG/PNG).",
+    "procesando": "⏳ Procesando tu ticket, por favor espera...",
+    "ocr_ok": "✅ Tu ticket fue recibido y leído correctamente. Será validado por nuestro equipo.",
+    "ocr_falla": "❌ No pudimos leer correctamente tu ticket. Será revisado manualmente por nuestro equipo.",
+    "validacion": "⏳ ¡Gracias! *Estamos validando tu ticket*.\n"
+                  "Nuestro equipo revisará tu compra y te contactará en un máximo de *24 horas*.\n"
+                  "Si tienes dudas, escríbenos al 📞 55 3478 4786 o 55 1954 2345.",
+    "otro_ticket": "¿Tienes *otro ticket*? (Sí / No)",
+    "otro_ticket_recordatorio": "Responde *Sí* si tienes otro ticket o *No* para terminar.",
+    "gracias": "🙌 ¡Gracias por participar en el *Buen Fin Indiana*! 🎁\nPronto recibirás noticias.",
+}
+
+SI = frozenset(("sí", "si", "s"))
+NO = frozenset(("no", "n"))
+CMD_INICIO = "QUIERO PARTICIPAR"
+CMD_SALIR = "SALIR"
+
+
+class Contexto(NamedTuple):
+    """Dependencias que pone app.py."""
+    redis: Any
+    enviar: Callable[[str, str], Any]                          # (telefono, texto)
+    enviar_botones: Callable[[str, str, Tuple[str, ...]], Any]  # (telefono, texto, titulos)
+    validar: Callable[[str, str], Dict[str, Any]]               # (media_id, telefono) -> resultado OCR
+    registrar: Callable[[Dict[str, Any], Dict[str, Any]], Any]  # (datos_generales, nuevo_ticket)
+    url_ticket: Callable[[str], str]                            # nombre_archivo -> URL pública
+
+
+class Entrada(NamedTuple):
+    telefono: str
+    tipo: str
+    texto: str
+    mensaje: Dict[str, Any]
+
+
+def entrada(mensaje: Dict[str, Any]) -> Entrada:
+    """Normaliza el mensaje de WhatsApp (texto normal o respuesta de botón)."""
+    tipo, texto = mensaje.get("type", ""), ""
+    interactivo = mensaje.get("interactive") or {}
+    if interactivo.get("type") == "button_reply":
+        texto, tipo = interactivo["button_reply"]["title"].strip(), "text"
+    elif "body" in (mensaje.get("text") or {}):
+        texto, tipo = mensaje["text"]["body"].strip(), "text"
+    return Entrada(mensaje["from"], tipo, texto, mensaje)
+
+
+def _preguntar(ctx: Contexto, telefono: str, paso: int):
+    if paso >= FOTO:
+        ctx.enviar(telefono, MENSAJES["foto"])
+        return
+    p = PASOS[paso]
+    if p.botones:
+        ctx.enviar_botones(telefono, p.prompt, p.botones)
+    else:
+        ctx.enviar(telefono, p.prompt)
+
+
+# ------------------ Handlers por estado ------------------
+def _pregunta(ctx: Contexto, e: Entrada, sesion: Dict[str, Any]) -> str:
+    idx = sesion["paso"]
+    p = PASOS[idx]
+    valor = p.validador(e.texto) if e.tipo == "text" else None
+    if valor is None:
+        ctx.enviar(e.telefono, p.error)
+        return f"respuesta inválida ({p.campo})"
+    sesiones.guardar(ctx.redis, e.telefono, paso=idx + 1, respuestas={p.campo: valor})
+    _preguntar(ctx, e.telefono, idx + 1)
+    return f"{p.campo} ok"
+
+
+def _otro_ticket(ctx: Contexto, e: Entrada, sesion: Dict[str, Any]) -> str:
+    txt = e.texto.lower()
+    if txt in SI:
+        # Conserva datos base (no se vuelven a pedir)
+        sesiones.guardar(ctx.redis, e.telefono, paso=FOTO)
+        ctx.enviar(e.telefono, MENSAJES["foto_otro"])
+        return "esperando foto 2do ticket"
+    if txt in NO:
+        sesiones.eliminar(ctx.redis, e.telefono)
+        ctx.enviar(e.telefono, MENSAJES["gracias"])
+        return "fin"
+    ctx.enviar(e.telefono, MENSAJES["otro_ticket_recordatorio"])
+    return "recordatorio paso 99"
+
+
+def _foto(ctx: Contexto, e: Entrada, sesion: Dict[str, Any]) -> str:
+    if e.tipo != "image":
+        if e.tipo == "document":
+            nombre = (e.mensaje.get("document") or {}).get("filename", "archivo")
+            ctx.enviar(e.telefono, MENSAJES["foto_documento"].format(filename=nombre))
+        elif e.tipo == "text":
+            ctx.enviar(e.telefono, MENSAJES["foto_texto"])
+        else:
+            ctx.enviar(e.telefono, MENSAJES["foto_otro_tipo"])
+        return f"archivo no válido: {e.tipo}"
+
+    media_id = e.mensaje["image"]["id"]
+    respuestas = dict(sesion["respuestas"])
+    respuestas["ticket_photo"] = f"media:{media_id}"
+    respuestas["timestamp"] = datetime.now().isoformat()
+
+    ctx.enviar(e.telefono, MENSAJES["procesando"])
+    resultado = ctx.validar(media_id, e.telefono)
+    # Sin el resultado completo: lleva datos del cliente (productos, RFC, etc.)
+    log.info("resultado OCR", extra={"telefono": e.telefono, "valido": bool(resultado.get("valido")),
+                                     "monto": resultado.get("monto"), "motivo": resultado.get("motivo", ""),
+                                     "archivo": resultado.get("nombre_archivo")})
+
+    nuevo_ticket = dict(respuestas)
+    if resultado.get("valido"):
+        ctx.enviar(e.telefono, MENSAJES["ocr_ok"])
+        nuevo_ticket["premio"] = "Pendiente de validación"
+    else:
+        ctx.enviar(e.telefono, MENSAJES["ocr_falla"])
+        nuevo_ticket["premio"] = "Revisión manual"
+    ctx.enviar(e.telefono, MENSAJES["validacion"])
+
+    path_ticket = resultado.get("nombre_archivo")
+    datos_generales = {campo: respuestas.get(campo, "") for campo in CAMPOS}
+    datos_generales.update({
+        "telefono": e.telefono,
+        "monto": resultado.get("monto"),
+        "motivo": resultado.get("motivo", ""),
+        "vendedor": respuestas.get("vendedor", "Sin vendedor"),
+        "nombre_archivo": ctx.url_ticket(path_ticket) if path_ticket else "",
+        "premio": nuevo_ticket["premio"],
+    })
+
+    # Historial (lista acotada aparte) + paso 99, en un solo pipeline
+    p = ctx.redis.pipeline(transaction=False)
+    sesiones.agregar_ticket(ctx.redis, e.telefono, nuevo_ticket, pipe=p)
+    sesiones.guardar(ctx.redis, e.telefono, paso=OTRO_TICKET, pipe=p)
+    p.execute()
+
+    try:
+        ctx.registrar(datos_generales, nuevo_ticket)
+    except Exception as ex:
+        log.exception("registrar_ticket error: %s", ex, extra={"telefono": e.telefono})
+
+    ctx.enviar(e.telefono, MENSAJES["otro_ticket"])
+    return "ticket recibido"
+
+
+def _fin(ctx: Contexto, e: Entrada, sesion: Dict[str, Any]) -> str:
+    ctx.enviar(e.telefono, MENSAJES["sin_sesion"])
+    return "sesión terminada"
+
+
+HANDLERS: Dict[int, Callable[[Contexto, Entrada, Dict[str, Any]], str]] = {
+    **{i: _pregunta for i in range(len(PASOS))},
+    FOTO: _foto,
+    OTRO_TICKET: _otro_ticket,
+    FIN: _fin,
+}
+
+
+# ------------------ Entrada principal ------------------
+def _iniciar(ctx: Contexto, e: Entrada) -> str:
+    vendedor = registro_vendedores.resolver_texto(ctx.redis, e.texto)
+    vendedor_nombre = vendedor.nombre if vendedor else "Sin vendedor"
+    sesiones.reemplazar(ctx.redis, e.telefono, 0, {"vendedor": vendedor_nombre})
+    log.info("vendedor detectado", extra={"telefono": e.telefono, "vendedor": vendedor_nombre})
+    ctx.enviar(e.telefono, MENSAJES["bienvenida"])
+    _preguntar(ctx, e.telefono, 0)
+    return "inicio"
+
+
+def procesar(ctx: Contexto, mensaje: Dict[str, Any], modo: Optional[str] = None) -> str:
+    """Atiende un mensaje entrante y devuelve el status para la respuesta del webhook."""
+    e = entrada(mensaje)
+    if (modo or CAMPANA_MODO) != "abierta":
+        # Campaña cerrada: no leemos sesión, no validamos texto, no procesamos fotos
+        ctx.enviar(e.telefono, MENSAJES["cierre"])
+        return "mensaje de cierre enviado"
+
+    comando = e.texto.upper()
+    if CMD_INICIO in comando:
+        return _iniciar(ctx, e)
+
+    sesion = sesiones.cargar(ctx.redis, e.telefono)
+    if not sesion:
+        ctx.enviar(e.telefono, MENSAJES["sin_sesion"])
+        return "esperando inicio"
+
+    if comando == CMD_SALIR:
+        sesiones.guardar(ctx.redis, e.telefono, paso=FIN)
+        ctx.enviar(e.telefono, MENSAJES["salir"])
+        return "salir"
+
+    return HANDLERS.get(sesion["paso"], _fin)(ctx, e, sesion)
@@ -0,0 +1,63 @@
+# gunicorn.conf.py
+"""
+Perfil de producción:  gunicorn -c gunicorn.conf.py app:app
+
+El trabajo es casi todo espera de red (Graph API, OpenAI, Sheets, Redis),
+así que cada worker atiende muchas peticiones a la vez:
+  GUNICORN_WORKER_CLASS=gthread (default)  hilos por worker (GUNICORN_THREADS)
+  GUNICORN_WORKER_CLASS=gevent             greenlets (pip install gevent;
+                                           GUNICORN_WORKER_CONNECTIONS)
+Ojo: cada cliente de /eventos (SSE) ocupa un hilo mientras está conectado.
+
+Ciclo de vida del worker:
+  post_worker_init  arranca el logging (logs.configurar) y app.calentar()
+                    antes de aceptar tráfico (/status/listo)
+  worker_exit       app.apagar(): termina la replicación / envío en curso
+  child_exit        limpia sus métricas (PROMETHEUS_MULTIPROC_DIR)
+"""
+import os, shutil, multiprocessing
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '5002')}")
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.getenv("GUNICORN_WORKERS", str(max(2, multiprocessing.cpu_count() * 2))))
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "200"))
+
+# El webhook hace el OCR en línea (OPENAI_TIMEOUT x reintentos)
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Reciclar workers de vez en cuando (fugas de memoria de clientes HTTP)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "500"))
+
+preload_app = False  # cada worker importa y calienta lo suyo (clientes, sockets, hilos)
+accesslog = os.getenv("GUNICORN_ACCESSLOG") or None  # las métricas ya cubren latencia/status
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+# Métricas agregadas entre workers: tiene que estar en el entorno antes de importar prometheus_client
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join("data", "prometheus"))
+
+
+def on_starting(server):
+    d = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(d, ignore_errors=True)  # restos de un arranque anterior
+    os.makedirs(d, exist_ok=True)
+
+
+def post_worker_init(worker):
+    import logs
+    logs.configurar()  # antes de importar app: también sus logs de arranque van por la cola
+    import app
+    app.calentar()
+
+
+def worker_exit(server, worker):
+    import app
+    app.apagar(timeout_s=max(1, graceful_timeout - 5))
+
+
+def child_exit(server, worker):
+    import metricas
+    metricas.proceso_terminado(worker.pid)
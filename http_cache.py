@@ -0,0 +1,129 @@
+# http_cache.py
+"""
+Respuestas condicionales (ETag / Last-Modified -> 304) y compresión
+gzip/brotli para los endpoints del dashboard.
+
+La versión de los datos del dashboard es:
+  dashboard:version   contador que se incrementa (bump) cada vez que cambia
+                      algo que muestran (ticket registrado, premio asignado,
+                      sync de inventario)
+  premio_sync:last_ts última sincronización Redis <- Sheets
+más una ventana de tiempo (ETAG_VENTANA_S) para que ediciones manuales al
+Sheet se reflejen aunque el bot no haya escrito nada.
+
+El 304 se decide ANTES de ejecutar la vista, así un refresh sin cambios no
+toca Google Sheets.
+"""
+import os, gzip, time, hashlib
+from functools import wraps
+from email.utils import parsedate_to_datetime
+
+from flask import request, make_response, Response
+
+try:  # opcional: si no está instalado sólo usamos gzip
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+VERSION_KEY    = "dashboard:version"
+CAMBIO_TS_KEY  = "dashboard:changed_ts"
+SYNC_TS_KEY    = "premio_sync:last_ts"
+ETAG_VENTANA_S = int(os.getenv("DASHBOARD_ETAG_VENTANA_S", "60"))
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "512"))
+COMPRESS_TIPOS = ("text/html", "application/json", "text/css", "text/javascript",
+                  "application/javascript", "text/csv", "text/plain")
+
+
+def bump(redis_conn, pipe=None):
+    """Marca que los datos del dashboard cambiaron."""
+    p = pipe if pipe is not None else redis_conn.pipeline(transaction=False)
+    p.incr(VERSION_KEY)
+    p.set(CAMBIO_TS_KEY, int(time.time()))
+    if pipe is None:
+        p.execute()
+
+
+def version_actual(redis_conn):
+    """(etag_base, last_modified_ts) de los datos del dashboard."""
+    try:
+        version, cambio_ts, sync_ts = redis_conn.mget(VERSION_KEY, CAMBIO_TS_KEY, SYNC_TS_KEY)
+    except Exception:
+        return None, None
+    ventana = int(time.time() // ETAG_VENTANA_S) if ETAG_VENTANA_S > 0 else 0
+    base = f"{version or 0}|{sync_ts or 0}|{ventana}"
+    last_mod = max(int(cambio_ts or 0), int(sync_ts or 0)) or None
+    return base, last_mod
+
+
+def _etag(base: str) -> str:
+    return hashlib.sha1(f"{base}|{request.full_path}".encode("utf-8")).hexdigest()[:24]
+
+
+def _no_modificado(etag: str, last_mod) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    ims = request.headers.get("If-Modified-Since")
+    if ims and last_mod:
+        # Clientes sin ETag: sólo ven cambios hechos por el bot (tickets, asignaciones, syncs)
+        try:
+            return int(parsedate_to_datetime(ims).timestamp()) >= last_mod
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def condicional(redis_conn):
+    """
+    Decorador para vistas del dashboard: responde 304 sin ejecutar la vista
+    si el cliente ya tiene la versión actual. Las respuestas 200 llevan un
+    ETag débil (válido para cualquier codificación) y Last-Modified.
+    """
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            base, last_mod = version_actual(redis_conn)
+            if base is None:  # Redis caído: sin caché condicional
+                return fn(*args, **kwargs)
+
+            etag = _etag(base)
+            if _no_modificado(etag, last_mod):
+                resp = Response(status=304)
+                resp.set_etag(etag, weak=True)
+                resp.cache_control.no_cache = True
+                return resp
+
+            resp = make_response(fn(*args, **kwargs))
+            if resp.status_code == 200:
+                # La vista pudo haber sincronizado (cambia la versión): etiquetamos con la nueva
+                base, last_mod = version_actual(redis_conn)
+                resp.set_etag(_etag(base or ""), weak=True)
+                if last_mod:
+                    resp.last_modified = last_mod
+                resp.cache_control.no_cache = True  # siempre revalidar, pero con 304 barato
+            return resp
+        return wrapper
+    return deco
+
+
+def comprimir(resp):
+    """after_request: comprime con brotli o gzip según Accept-Encoding."""
+    if (resp.status_code != 200 or resp.direct_passthrough or resp.is_streamed
+            or "Content-Encoding" in resp.headers
+            or not (resp.mimetype or "").startswith(COMPRESS_TIPOS)):
+        return resp
+    aceptadas = request.accept_encodings
+    data = resp.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return resp
+
+    if brotli is not None and aceptadas["br"]:
+        resp.set_data(brotli.compress(data, quality=5))
+        resp.headers["Content-Encoding"] = "br"
+    elif aceptadas["gzip"]:
+        resp.set_data(gzip.compress(data, compresslevel=6))
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        return resp
+    resp.vary.add("Accept-Encoding")
+    return resp
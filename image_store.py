@@ -0,0 +1,334 @@
+# image_store.py
+#!/usr/bin/env python3
+"""
+Almacén de imágenes direccionado por contenido.
+
+Cada imagen se guarda UNA sola vez en objects/<aa>/<bb>/<sha256>.jpg y las
+carpetas que usa la app (images_to_process para /catalogo_img,
+images_processed para auditoría) sólo contienen hardlinks a ese objeto,
+así que no se duplica disco ni I/O. El nombre visible es
+<sha256[:32]>_<telefono>.jpg: la misma foto enviada dos veces por el mismo
+teléfono cae en el mismo archivo.
+
+Un índice SQLite pequeño mapea nombre_archivo/teléfono/media_id -> hash y
+guarda el monto OCR; es la base del catálogo paginado (/catalogo). Las
+miniaturas se generan bajo demanda en thumbs/<sha256>_<ancho>.jpg.
+
+CLI:
+  python image_store.py migrar                 # importa imágenes viejas (UUID) al almacén
+  python image_store.py compactar --retencion-dias 120
+  python image_store.py stats
+"""
+import os, json, time, shutil, sqlite3, hashlib, argparse
+from typing import Optional, Dict, Any, List, Tuple
+
+STORE_DIR   = os.getenv("IMAGE_STORE_DIR", "image_store")
+OBJECTS_DIR = os.path.join(STORE_DIR, "objects")
+THUMBS_DIR  = os.path.join(STORE_DIR, "thumbs")
+INDEX_PATH  = os.path.join(STORE_DIR, "index.sqlite3")
+ANCHOS_MINIATURA = (160, 320, 640)
+# compactar() no toca objetos más nuevos que esto: guardar() pudo escribirlos
+# y todavía no insertar su fila en el índice
+COMPACTAR_GRACIA_S = int(os.getenv("IMAGE_COMPACTAR_GRACIA_S", "3600"))
+
+DIR_TO_PROCESS = "images_to_process"
+DIR_PROCESSED  = "images_processed"
+EXTENSIONES    = (".jpg", ".jpeg", ".png")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS imagenes (
+    nombre_archivo TEXT PRIMARY KEY,
+    sha256         TEXT NOT NULL,
+    telefono       TEXT,
+    media_id       TEXT,
+    ts             INTEGER NOT NULL,
+    monto_ocr      REAL
+);
+CREATE INDEX IF NOT EXISTS idx_imagenes_sha ON imagenes(sha256);
+CREATE INDEX IF NOT EXISTS idx_imagenes_ts ON imagenes(ts);
+CREATE INDEX IF NOT EXISTS idx_imagenes_tel ON imagenes(telefono);
+CREATE INDEX IF NOT EXISTS idx_imagenes_media ON imagenes(media_id);
+"""
+
+_schema_listo = False
+
+def _conn() -> sqlite3.Connection:
+    global _schema_listo
+    os.makedirs(STORE_DIR, exist_ok=True)
+    c = sqlite3.connect(INDEX_PATH, timeout=10)
+    c.row_factory = sqlite3.Row
+    if not _schema_listo:
+        c.execute("PRAGMA journal_mode=WAL")
+        # Índices creados antes de monto_ocr: agregamos la columna antes del schema
+        cols = {row[1] for row in c.execute("PRAGMA table_info(imagenes)")}
+        if cols and "monto_ocr" not in cols:
+            c.execute("ALTER TABLE imagenes ADD COLUMN monto_ocr REAL")
+        c.executescript(_SCHEMA)
+        _schema_listo = True
+    return c
+
+# -------------------------------
+# Objetos
+# -------------------------------
+def ruta_objeto(sha: str) -> str:
+    return os.path.join(OBJECTS_DIR, sha[:2], sha[2:4], f"{sha}.jpg")
+
+def _escribir_objeto(contenido: bytes) -> str:
+    sha = hashlib.sha256(contenido).hexdigest()
+    ruta = ruta_objeto(sha)
+    if not os.path.exists(ruta):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        tmp = f"{ruta}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(contenido)
+        os.replace(tmp, ruta)  # atómico: nunca queda un objeto a medias
+    else:
+        try:
+            os.utime(ruta)  # reusado: que compactar() lo vea como nuevo hasta que esté indexado
+        except OSError:
+            pass
+    return sha
+
+def _hash_archivo(ruta: str) -> str:
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+def vincular(origen: str, carpeta: str, nombre: Optional[str] = None) -> str:
+    """
+    Crea `carpeta/nombre` como hardlink de `origen` (copia si el sistema de
+    archivos no soporta hardlinks). Devuelve la ruta creada.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    destino = os.path.join(carpeta, nombre or os.path.basename(origen))
+    if os.path.exists(destino):
+        if os.path.samefile(origen, destino):
+            return destino
+        os.remove(destino)
+    try:
+        os.link(origen, destino)
+    except OSError:
+        shutil.copy2(origen, destino)
+    return destino
+
+# -------------------------------
+# API pública
+# -------------------------------
+def nombre_para(sha: str, telefono: str) -> str:
+    return f"{sha[:32]}_{telefono}.jpg"
+
+def guardar(contenido: bytes, telefono: str, media_id: str = "") -> Dict[str, Any]:
+    """
+    Guarda la imagen y expone su vista en images_to_process.
+    Devuelve {nombre_archivo, ruta, sha256, duplicado}.
+    """
+    sha = _escribir_objeto(contenido)
+    nombre = nombre_para(sha, telefono)
+    with _conn() as c:
+        previo = c.execute("SELECT 1 FROM imagenes WHERE sha256 = ? LIMIT 1", (sha,)).fetchone()
+        # Reenvío de la misma foto por el mismo teléfono: se conservan ts y monto_ocr
+        c.execute(
+            "INSERT INTO imagenes (nombre_archivo, sha256, telefono, media_id, ts) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(nombre_archivo) DO UPDATE SET media_id = excluded.media_id",
+            (nombre, sha, telefono, media_id, int(time.time())),
+        )
+    ruta = vincular(ruta_objeto(sha), DIR_TO_PROCESS, nombre)
+    return {"nombre_archivo": nombre, "ruta": ruta, "sha256": sha, "duplicado": previo is not None}
+
+def resolver(nombre_archivo: str) -> Optional[str]:
+    """Ruta del objeto para un nombre visible (sirve aunque la vista se haya borrado)."""
+    with _conn() as c:
+        row = c.execute("SELECT sha256 FROM imagenes WHERE nombre_archivo = ?", (nombre_archivo,)).fetchone()
+    if not row:
+        return None
+    ruta = ruta_objeto(row["sha256"])
+    return ruta if os.path.exists(ruta) else None
+
+def actualizar_monto(nombre_archivo: str, monto: Optional[float]) -> None:
+    with _conn() as c:
+        c.execute("UPDATE imagenes SET monto_ocr = ? WHERE nombre_archivo = ?", (monto, nombre_archivo))
+
+def listar(q: str = "", pagina: int = 1, por_pagina: int = 48) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Página del catálogo (más recientes primero). `q` busca dentro del
+    teléfono o al inicio del nombre de archivo. Devuelve (items, total).
+    """
+    pagina = max(1, pagina)
+    por_pagina = max(1, min(por_pagina, 200))
+    where, params = "", []
+    if q:
+        where = "WHERE telefono LIKE ? OR nombre_archivo LIKE ?"
+        params = [f"%{q}%", f"{q}%"]
+    with _conn() as c:
+        total = c.execute(f"SELECT COUNT(*) FROM imagenes {where}", params).fetchone()[0]
+        rows = c.execute(
+            f"SELECT nombre_archivo, sha256, telefono, ts, monto_ocr FROM imagenes {where} "
+            "ORDER BY ts DESC LIMIT ? OFFSET ?",
+            params + [por_pagina, (pagina - 1) * por_pagina],
+        ).fetchall()
+    return [dict(r) for r in rows], total
+
+def info(nombre_archivo: str) -> Optional[Dict[str, Any]]:
+    with _conn() as c:
+        row = c.execute("SELECT * FROM imagenes WHERE nombre_archivo = ?", (nombre_archivo,)).fetchone()
+    return dict(row) if row else None
+
+def miniatura(nombre_archivo: str, ancho: int = 320) -> Optional[Tuple[str, str]]:
+    """
+    Devuelve (ruta, etag) de la miniatura; la genera y cachea en disco la
+    primera vez. El ancho se ajusta al más cercano de ANCHOS_MINIATURA.
+    """
+    from PIL import Image  # sólo quien pide miniaturas paga el import
+
+    meta = info(nombre_archivo)
+    if not meta:
+        return None
+    sha = meta["sha256"]
+    ancho = min(ANCHOS_MINIATURA, key=lambda a: abs(a - ancho))
+    ruta = os.path.join(THUMBS_DIR, sha[:2], f"{sha}_{ancho}.jpg")
+    etag = f"{sha[:32]}-{ancho}"
+    if os.path.exists(ruta):
+        return ruta, etag
+
+    origen = ruta_objeto(sha)
+    if not os.path.exists(origen):
+        return None
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with Image.open(origen) as im:
+        im = im.convert("RGB")
+        im.thumbnail((ancho, ancho * 4))
+        tmp = f"{ruta}.{os.getpid()}.tmp"
+        im.save(tmp, format="JPEG", quality=80, optimize=True)
+    os.replace(tmp, ruta)
+    return ruta, etag
+
+def buscar(telefono: Optional[str] = None, media_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    q, params = "SELECT * FROM imagenes WHERE 1=1", []
+    if telefono:
+        q += " AND telefono = ?"; params.append(telefono)
+    if media_id:
+        q += " AND media_id = ?"; params.append(media_id)
+    with _conn() as c:
+        return [dict(r) for r in c.execute(q + " ORDER BY ts DESC", params)]
+
+# -------------------------------
+# Mantenimiento
+# -------------------------------
+def migrar(carpeta: str = DIR_TO_PROCESS) -> Dict[str, int]:
+    """
+    Importa imágenes legadas (UUID_telefono.jpg) al almacén y reemplaza el
+    archivo por un hardlink al objeto. Conserva el nombre original para que
+    las URLs /catalogo_img/<nombre> ya registradas en el Sheet sigan vivas;
+    la copia en images_processed (si existe) también pasa a ser hardlink.
+    """
+    stats = {"importadas": 0, "ya_vinculadas": 0, "bytes_liberados": 0}
+    if not os.path.isdir(carpeta):
+        return stats
+    with _conn() as c:
+        for e in os.scandir(carpeta):
+            if not (e.is_file() and e.name.lower().endswith(EXTENSIONES)):
+                continue
+            sha = _hash_archivo(e.path)
+            obj = ruta_objeto(sha)
+            if os.path.exists(obj) and os.path.samefile(obj, e.path):
+                stats["ya_vinculadas"] += 1
+                continue
+            if not os.path.exists(obj):
+                os.makedirs(os.path.dirname(obj), exist_ok=True)
+                try:
+                    os.link(e.path, obj)
+                except OSError:
+                    shutil.copy2(e.path, obj)
+            else:
+                stats["bytes_liberados"] += e.stat().st_size
+            vincular(obj, carpeta, e.name)
+            procesada = os.path.join(DIR_PROCESSED, e.name)
+            if os.path.exists(procesada) and not os.path.samefile(obj, procesada):
+                stats["bytes_liberados"] += os.path.getsize(procesada)
+                vincular(obj, DIR_PROCESSED, e.name)
+            telefono = e.name.rsplit(".", 1)[0].rsplit("_", 1)[-1]
+            c.execute(
+                "INSERT OR IGNORE INTO imagenes (nombre_archivo, sha256, telefono, media_id, ts, monto_ocr) "
+                "VALUES (?, ?, ?, '', ?, ?)",
+                (e.name, sha, telefono, int(e.stat().st_mtime), _monto_ai_json(e.name)),
+            )
+            stats["importadas"] += 1
+    return stats
+
+def _monto_ai_json(nombre_archivo: str) -> Optional[float]:
+    try:
+        with open(os.path.join(DIR_PROCESSED, f"{nombre_archivo}.ai.json"), encoding="utf-8") as f:
+            return json.load(f).get("total")
+    except (OSError, ValueError):
+        return None
+
+def compactar(retencion_dias: int = 0, dry_run: bool = False) -> Dict[str, int]:
+    """
+    - Con retencion_dias > 0 borra del índice y de las carpetas de vista las
+      imágenes más viejas que eso (y su .ai.json).
+    - Borra objetos (y sus miniaturas) que ya no referencia ninguna fila del
+      índice, salvo los de menos de COMPACTAR_GRACIA_S (guardar() en curso).
+    """
+    stats = {"vencidas": 0, "objetos_borrados": 0, "bytes_liberados": 0}
+    with _conn() as c:
+        if retencion_dias > 0:
+            corte = int(time.time()) - retencion_dias * 86400
+            viejas = c.execute("SELECT nombre_archivo FROM imagenes WHERE ts < ?", (corte,)).fetchall()
+            for row in viejas:
+                nombre = row["nombre_archivo"]
+                for ruta in (os.path.join(DIR_TO_PROCESS, nombre),
+                             os.path.join(DIR_PROCESSED, nombre),
+                             os.path.join(DIR_PROCESSED, f"{nombre}.ai.json")):
+                    if os.path.exists(ruta) and not dry_run:
+                        os.remove(ruta)
+                stats["vencidas"] += 1
+            if not dry_run:
+                c.execute("DELETE FROM imagenes WHERE ts < ?", (corte,))
+
+        vivos = {row["sha256"] for row in c.execute("SELECT DISTINCT sha256 FROM imagenes")}
+
+    limite = time.time() - COMPACTAR_GRACIA_S
+    for raiz, _, archivos in list(os.walk(OBJECTS_DIR)) + list(os.walk(THUMBS_DIR)):
+        for a in archivos:
+            sha = a.split(".", 1)[0].split("_", 1)[0]
+            if sha in vivos:
+                continue
+            ruta = os.path.join(raiz, a)
+            try:
+                if os.path.getmtime(ruta) > limite:
+                    continue
+            except FileNotFoundError:
+                continue
+            stats["objetos_borrados"] += 1
+            stats["bytes_liberados"] += os.path.getsize(ruta)
+            if not dry_run:
+                os.remove(ruta)
+    return stats
+
+def stats() -> Dict[str, int]:
+    with _conn() as c:
+        filas = c.execute("SELECT COUNT(*) FROM imagenes").fetchone()[0]
+        unicos = c.execute("SELECT COUNT(DISTINCT sha256) FROM imagenes").fetchone()[0]
+    total_bytes = 0
+    for raiz, _, archivos in os.walk(OBJECTS_DIR):
+        total_bytes += sum(os.path.getsize(os.path.join(raiz, a)) for a in archivos)
+    return {"imagenes": filas, "objetos_unicos": unicos, "bytes_objetos": total_bytes}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Mantenimiento del almacén de imágenes")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("migrar")
+    p_comp = sub.add_parser("compactar")
+    p_comp.add_argument("--retencion-dias", type=int, default=int(os.getenv("IMAGE_RETENCION_DIAS", "0")))
+    p_comp.add_argument("--dry-run", action="store_true")
+    sub.add_parser("stats")
+    args = ap.parse_args()
+
+    if args.cmd == "migrar":
+        print(migrar())
+    elif args.cmd == "compactar":
+        print(compactar(args.retencion_dias, dry_run=args.dry_run))
+    else:
+        print(stats())
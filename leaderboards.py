@@ -0,0 +1,145 @@
+# leaderboards.py
+"""
+Leaderboards de tiendas y vendedores en sorted sets de Redis.
+
+Claves (tipo = "tiendas" | "vendedores"):
+  lb:<tipo>:total               ZSET  nombre_normalizado -> registros (campaña completa)
+  lb:<tipo>:dia:<YYYYMMDD>      ZSET  idem, por día (expira LB_TTL_DIA_S)
+  lb:<tipo>:semana:<YYYYWW>     ZSET  idem, por semana ISO (expira LB_TTL_SEMANA_S)
+  lb:<tipo>:nombres             HASH  nombre_normalizado -> nombre para mostrar
+  lb:<tipo>:registros:<periodo> STR   total de registros del periodo
+  lb:built                            marca de reconstrucción desde ticket_store
+
+Se actualizan con ZINCRBY al registrar cada ticket; el top-N es un
+ZREVRANGE (O(log n + k)) en lugar de contar todos los tickets.
+
+reconstruir() arma los leaderboards en claves temporales (lbtmp_<id>:...)
+por lotes de LB_LOTE filas y al final las pone en su lugar con RENAME en una
+sola transacción: Redis no se bloquea con todos los tickets en un MULTI y los
+lectores nunca ven un leaderboard a medio llenar. Se reconstruye al arrancar,
+con ?rebuild=1 y cuando importar_desde_sheet trae filas nuevas o cambia
+tienda/vendedor de alguna (ediciones manuales en el Sheet).
+"""
+import os, time, uuid, unicodedata
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+PERIODOS = ("total", "hoy", "semana")
+BUILT_KEY = "lb:built"
+
+LB_TTL_DIA_S    = int(os.getenv("LB_TTL_DIA_S", str(40 * 86400)))
+LB_TTL_SEMANA_S = int(os.getenv("LB_TTL_SEMANA_S", str(120 * 86400)))
+LB_LOTE         = int(os.getenv("LB_LOTE", "1000"))  # filas por pipeline al reconstruir
+
+
+def normalizar(nombre: str) -> str:
+    """'  Home  Depót ' -> 'home depot' (espacios colapsados, sin acentos, minúsculas)."""
+    s = " ".join((nombre or "").split())
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return s.casefold()
+
+
+def _sufijos(ts: float) -> Dict[str, str]:
+    d = datetime.fromtimestamp(ts)
+    iso = d.isocalendar()
+    return {"dia": d.strftime("%Y%m%d"), "semana": f"{iso[0]}{iso[1]:02d}"}
+
+
+def _key(tipo: str, periodo: str, ts: Optional[float] = None, prefijo: str = "lb") -> str:
+    if periodo == "total":
+        return f"{prefijo}:{tipo}:total"
+    suf = _sufijos(ts if ts is not None else time.time())
+    if periodo in ("hoy", "dia"):
+        return f"{prefijo}:{tipo}:dia:{suf['dia']}"
+    return f"{prefijo}:{tipo}:semana:{suf['semana']}"
+
+
+def _registros_key(key: str) -> str:
+    # lb:tiendas:dia:20261119 -> lb:tiendas:registros:dia:20261119
+    prefijo, tipo, resto = key.split(":", 2)
+    return f"{prefijo}:{tipo}:registros:{resto}"
+
+
+def registrar(redis_conn, tienda: str = "", vendedor: str = "", ts: Optional[float] = None, pipe=None,
+              prefijo: str = "lb"):
+    """Suma un registro a los leaderboards (total, día y semana) de tienda y vendedor."""
+    ts = ts if ts is not None else time.time()
+    p = pipe if pipe is not None else redis_conn.pipeline(transaction=False)
+    for tipo, nombre in (("tiendas", tienda), ("vendedores", vendedor)):
+        norm = normalizar(nombre)
+        if not norm:
+            continue
+        p.hsetnx(f"{prefijo}:{tipo}:nombres", norm, " ".join(nombre.split()))
+        for periodo, ttl in (("total", None), ("dia", LB_TTL_DIA_S), ("semana", LB_TTL_SEMANA_S)):
+            if ttl and time.time() - ts > ttl:
+                continue  # cubeta que ya habría expirado (reconstrucción de filas viejas)
+            key = _key(tipo, periodo, ts, prefijo)
+            p.zincrby(key, 1, norm)
+            p.incr(_registros_key(key))
+            if ttl:
+                p.expire(key, ttl)
+                p.expire(_registros_key(key), ttl)
+    if pipe is None:
+        p.execute()
+
+
+def top(redis_conn, tipo: str, periodo: str = "total", limit: int = 8) -> Tuple[List[Tuple[str, int]], int, int]:
+    """
+    Devuelve ([(nombre, registros), ...], total_distintos, total_registros)
+    para el periodo pedido ("total", "hoy" o "semana").
+    """
+    key = _key(tipo, periodo)
+    p = redis_conn.pipeline(transaction=False)
+    p.zrevrange(key, 0, max(0, limit) - 1, withscores=True)
+    p.zcard(key)
+    p.get(_registros_key(key))
+    filas, distintos, registros = p.execute()
+    if limit <= 0:
+        filas = []
+
+    nombres = redis_conn.hmget(f"lb:{tipo}:nombres", [n for n, _ in filas]) if filas else []
+    items = [(disp or norm, int(score)) for (norm, score), disp in zip(filas, nombres)]
+    return items, int(distintos or 0), int(registros or 0)
+
+
+def reconstruir(redis_conn, filas: Iterable[Tuple[str, str, float]], lote: int = LB_LOTE) -> int:
+    """Reconstruye todos los leaderboards desde (tienda, vendedor, ts). Devuelve filas contadas."""
+    tmp = f"lbtmp_{uuid.uuid4().hex[:12]}"
+    n = 0
+    try:
+        p = redis_conn.pipeline(transaction=False)
+        for tienda, vendedor, ts in filas:
+            if not tienda.strip() and not vendedor.strip():
+                continue
+            registrar(redis_conn, tienda, vendedor, ts=ts, pipe=p, prefijo=tmp)
+            n += 1
+            if n % max(1, lote) == 0:
+                p.execute()
+        p.execute()
+
+        nuevas = list(redis_conn.scan_iter(f"{tmp}:*", count=500))
+        viejas = [k for k in redis_conn.scan_iter("lb:*", count=500) if k != BUILT_KEY]
+        p = redis_conn.pipeline(transaction=True)
+        destinos = {"lb" + k[len(tmp):] for k in nuevas}
+        sobran = [k for k in viejas if k not in destinos]
+        if sobran:
+            p.delete(*sobran)
+        for k in nuevas:
+            p.rename(k, "lb" + k[len(tmp):])
+        p.set(BUILT_KEY, int(time.time()))
+        p.execute()
+    except Exception:
+        huerfanas = list(redis_conn.scan_iter(f"{tmp}:*", count=500))
+        if huerfanas:
+            redis_conn.delete(*huerfanas)
+        raise
+    return n
+
+
+def asegurar(redis_conn, obtener_filas: Callable[[], Iterable[Tuple[str, str, float]]], forzar: bool = False) -> bool:
+    """Reconstruye sólo si no existen (o si se fuerza). True si se reconstruyó."""
+    if not forzar and redis_conn.exists(BUILT_KEY):
+        return False
+    reconstruir(redis_conn, obtener_filas())
+    return True
@@ -0,0 +1,146 @@
+# logs.py
+"""
+Logging estructurado (una línea JSON por evento) sin bloquear al que loguea.
+
+- Los handlers del root se reemplazan por un QueueHandler; un solo hilo
+  (QueueListener) formatea y escribe a stdout, así las peticiones no esperan
+  el write() y las líneas de un worker no se mezclan entre sí.
+- Cada línea lleva el id de correlación vigente (`cid`): el id del mensaje de
+  WhatsApp en el webhook, X-Request-ID (o uno nuevo) en las demás peticiones.
+  Se propaga al OCR y a la replicación a Sheets con `correlacion(cid)`.
+- Eventos de alto volumen se muestrean: extra={"muestra": 0.05} deja pasar ~5%.
+- Campos extra: log.info("ticket registrado", extra={"tienda": t, "monto": m}).
+
+El listener no arranca al importar: obtener() sólo regresa el logger y el
+proceso llama configurar() al iniciar (post_worker_init de Gunicorn,
+app.calentar() o el main() de cada CLI). Antes de eso rige el logging por
+omisión de Python.
+
+Config: LOG_LEVEL (INFO), LOG_FORMATO (json | texto), LOG_COLA_MAX (10000).
+"""
+import os, sys, json, uuid, queue, random, atexit, logging, contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_LEVEL   = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMATO = os.getenv("LOG_FORMATO", "json").lower()
+LOG_COLA_MAX = int(os.getenv("LOG_COLA_MAX", "10000"))
+
+_cid: contextvars.ContextVar = contextvars.ContextVar("cid", default="")
+_listener: Optional[QueueListener] = None
+
+# Atributos estándar de LogRecord: todo lo demás se considera campo extra
+_ESTANDAR = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "muestra", "cid"}
+
+
+def cid() -> str:
+    return _cid.get()
+
+
+def nuevo_cid() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def fijar_cid(valor: Optional[str]) -> str:
+    valor = (valor or "").strip()[:64] or nuevo_cid()
+    _cid.set(valor)
+    return valor
+
+
+@contextmanager
+def correlacion(valor: Optional[str]):
+    """Usa `valor` como cid dentro del bloque (hilos de fondo, replicador...)."""
+    token = _cid.set((valor or "").strip()[:64] or nuevo_cid())
+    try:
+        yield
+    finally:
+        _cid.reset(token)
+
+
+class _Contexto(logging.Filter):
+    """Agrega el cid y aplica el muestreo ANTES de encolar (en el hilo que loguea)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        muestra = getattr(record, "muestra", None)
+        if muestra is not None and random.random() >= float(muestra):
+            return False
+        record.cid = _cid.get()
+        return True
+
+
+class FormatoJSON(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        evento = {
+            "ts": round(record.created, 3),
+            "nivel": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "cid": getattr(record, "cid", ""),
+            "pid": record.process,
+        }
+        for k, v in record.__dict__.items():
+            if k not in _ESTANDAR and not k.startswith("_"):
+                evento[k] = v
+        if record.exc_info:
+            evento["exc"] = self.formatException(record.exc_info)
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+class FormatoTexto(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(cid)s] %(message)s")
+
+
+class _ColaSinBloqueo(QueueHandler):
+    """Si la cola está llena se pierde la línea (y se cuenta) en vez de frenar la petición."""
+    descartados = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _ColaSinBloqueo.descartados += 1
+
+
+def configurar(nivel: Optional[str] = None, formato: Optional[str] = None) -> None:
+    """Idempotente. Reemplaza los handlers del root por la cola + listener."""
+    global _listener
+    if _listener is not None:
+        return
+    salida = logging.StreamHandler(sys.stdout)
+    salida.setFormatter(FormatoTexto() if (formato or LOG_FORMATO) == "texto" else FormatoJSON())
+
+    cola: queue.Queue = queue.Queue(maxsize=LOG_COLA_MAX)
+    entrada = _ColaSinBloqueo(cola)
+    entrada.addFilter(_Contexto())
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(entrada)
+    root.setLevel(nivel or LOG_LEVEL)
+    # Librerías muy habladoras en INFO
+    for ruido in ("urllib3", "httpx", "openai", "gspread"):
+        logging.getLogger(ruido).setLevel(max(logging.WARNING, root.level))
+
+    _listener = QueueListener(cola, salida, respect_handler_level=False)
+    _listener.start()
+    atexit.register(detener)
+
+
+def detener() -> None:
+    """Vacía la cola (al apagar el proceso)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def obtener(nombre: str) -> logging.Logger:
+    """Sin efectos: no configura handlers ni arranca hilos (ver configurar)."""
+    return logging.getLogger(nombre)
+
+
+def descartados() -> int:
+    return _ColaSinBloqueo.descartados
@@ -0,0 +1,158 @@
+# metricas.py
+"""
+Métricas en formato Prometheus (GET /metrics).
+
+  buenfin_http_segundos{ruta,metodo}                     histograma por ruta (regla de Flask)
+  buenfin_http_peticiones_total{ruta,metodo,status}
+  buenfin_dependencia_segundos{dependencia,operacion}    graph / openai / sheets (cada llamada
+                                                         que pasa por circuit_breaker) y redis
+  buenfin_dependencia_errores_total{dependencia,operacion,tipo}
+  buenfin_errores_total{origen}                          excepciones no atrapadas (http, webhook)
+  buenfin_cola_profundidad{cola}                         se lee al momento del scrape
+
+Con varios workers de Gunicorn cada proceso escribe sus contadores en
+PROMETHEUS_MULTIPROC_DIR (tiene que existir y estar vacío al arrancar) y
+/metrics los suma todos; el master debe llamar a proceso_terminado(pid) en
+child_exit. Sin esa variable se usa el registro normal del proceso.
+"""
+import os, time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from prometheus_client import (CollectorRegistry, Counter, Histogram, REGISTRY,
+                               CONTENT_TYPE_LATEST, generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+
+import logs
+
+log = logs.obtener("metricas")
+
+PREFIJO = "buenfin"
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+_BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_BUCKETS_DEP  = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 60)
+
+HTTP_SEGUNDOS = Histogram(f"{PREFIJO}_http_segundos", "Latencia por ruta",
+                          ["ruta", "metodo"], buckets=_BUCKETS_HTTP)
+HTTP_PETICIONES = Counter(f"{PREFIJO}_http_peticiones", "Peticiones atendidas",
+                          ["ruta", "metodo", "status"])
+DEP_SEGUNDOS = Histogram(f"{PREFIJO}_dependencia_segundos", "Duración de llamadas a dependencias",
+                         ["dependencia", "operacion"], buckets=_BUCKETS_DEP)
+DEP_ERRORES = Counter(f"{PREFIJO}_dependencia_errores", "Llamadas a dependencias que fallaron",
+                      ["dependencia", "operacion", "tipo"])
+ERRORES = Counter(f"{PREFIJO}_errores", "Excepciones no atrapadas", ["origen"])
+
+_colas: Dict[str, Callable[[], int]] = {}
+
+
+# -------------------------------
+# Dependencias
+# -------------------------------
+def observar(dependencia: str, operacion: str, segundos: float, error: Optional[BaseException] = None):
+    DEP_SEGUNDOS.labels(dependencia, operacion).observe(segundos)
+    if error is not None:
+        DEP_ERRORES.labels(dependencia, operacion, type(error).__name__).inc()
+
+
+@contextmanager
+def medir(dependencia: str, operacion: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        observar(dependencia, operacion, time.perf_counter() - t0, e)
+        raise
+    observar(dependencia, operacion, time.perf_counter() - t0)
+
+
+def instrumentar_redis(redis_conn):
+    """Mide cada comando (por nombre) y cada pipeline de esta conexión."""
+    ejecutar = redis_conn.execute_command
+    crear_pipeline = redis_conn.pipeline
+
+    def execute_command(*args, **kwargs):
+        with medir("redis", str(args[0]).lower() if args else "?"):
+            return ejecutar(*args, **kwargs)
+
+    def pipeline(*args, **kwargs):
+        p = crear_pipeline(*args, **kwargs)
+        ejecutar_p = p.execute
+
+        def execute(*a, **kw):
+            with medir("redis", "pipeline"):
+                return ejecutar_p(*a, **kw)
+        p.execute = execute
+        return p
+
+    redis_conn.execute_command = execute_command
+    redis_conn.pipeline = pipeline
+    return redis_conn
+
+
+# -------------------------------
+# HTTP (Flask)
+# -------------------------------
+def instrumentar_app(app, excluir: Tuple[str, ...] = ("/metrics", "/eventos")):
+    """Histograma de latencia y contador de status por regla de ruta (no por URL)."""
+    from flask import g, request
+
+    @app.before_request
+    def _metricas_inicio():
+        g._metricas_t0 = time.perf_counter()
+
+    @app.after_request
+    def _metricas_fin(resp):
+        t0 = g.pop("_metricas_t0", None)
+        ruta = request.url_rule.rule if request.url_rule is not None else "<sin_ruta>"
+        if t0 is not None and ruta not in excluir:
+            HTTP_SEGUNDOS.labels(ruta, request.method).observe(time.perf_counter() - t0)
+            HTTP_PETICIONES.labels(ruta, request.method, str(resp.status_code)).inc()
+        return resp
+
+    @app.teardown_request
+    def _metricas_error(exc):
+        if exc is not None:
+            ERRORES.labels("http").inc()
+
+
+# -------------------------------
+# Colas (gauges al momento del scrape)
+# -------------------------------
+def registrar_cola(nombre: str, profundidad: Callable[[], int]):
+    _colas[nombre] = profundidad
+
+
+class _ColectorColas:
+    def collect(self):
+        g = GaugeMetricFamily(f"{PREFIJO}_cola_profundidad", "Elementos pendientes por cola", labels=["cola"])
+        for nombre, fn in list(_colas.items()):
+            try:
+                g.add_metric([nombre], float(fn()))
+            except Exception as e:
+                log.error("no se pudo medir la cola: %s", e, extra={"cola": nombre})
+        yield g
+
+
+_colector_colas = _ColectorColas()
+if not MULTIPROC_DIR:
+    REGISTRY.register(_colector_colas)
+
+
+# -------------------------------
+# Exposición
+# -------------------------------
+def exponer() -> Tuple[bytes, str]:
+    """(cuerpo, content_type) para /metrics."""
+    if MULTIPROC_DIR:
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        registro.register(_colector_colas)
+        return generate_latest(registro), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def proceso_terminado(pid: int):
+    """Hook child_exit de Gunicorn: limpia los archivos del worker que terminó."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
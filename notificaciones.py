@@ -0,0 +1,165 @@
+# notificaciones.py
+"""
+Cola de mensajes de WhatsApp para entrega asíncrona.
+
+Los endpoints encolan en Redis (LPUSH) y un hilo de fondo los envía. El hilo
+toma cada mensaje con BLMOVE a su lista de "en proceso"
+(notificaciones:procesando:<host>:<pid>) y lo quita de ahí (ack) sólo cuando
+terminó: si el proceso muere a medio envío, otro worker ve que su latido
+(notificaciones:latido:<id>, expira NOTIF_LATIDO_S) ya no existe y regresa
+esos mensajes a la cola.
+
+Si el envío falla (excepción, None o un payload de error de Graph) el
+mensaje se agenda en un ZSET por hora de reintento (backoff 2^n, tope 30 s)
+en lugar de dormir en el hilo: los demás mensajes siguen saliendo. Tras
+MAX_INTENTOS queda en la lista de fallidos para revisión.
+"""
+import os, json, time, socket, threading
+from typing import Callable, Optional
+
+import logs
+
+log = logs.obtener("notificaciones")
+
+COLA_KEY       = "notificaciones:cola"
+REINTENTOS_KEY = "notificaciones:reintentos"   # ZSET item -> ts en que toca reintentar
+PROCESANDO_KEY = "notificaciones:procesando"   # + ":<worker>", LIST
+LATIDO_KEY     = "notificaciones:latido"       # + ":<worker>", STR con TTL
+FALLIDAS_KEY   = "notificaciones:fallidas"
+MAX_INTENTOS   = int(os.getenv("NOTIF_MAX_INTENTOS", "3"))
+LATIDO_S       = int(os.getenv("NOTIF_LATIDO_S", "60"))
+
+# Pasa a la cola (por el extremo de salida) los reintentos que ya vencieron
+_LUA_VENCIDOS = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, item in ipairs(items) do
+  redis.call('ZREM', KEYS[1], item)
+  redis.call('RPUSH', KEYS[2], item)
+end
+return #items
+"""
+
+_worker_lock = threading.Lock()
+_worker: Optional[threading.Thread] = None
+_detener = threading.Event()
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def encolar(redis_conn, telefono: str, texto: str, pipe=None):
+    item = json.dumps({"telefono": telefono, "texto": texto, "intentos": 0, "ts": int(time.time())},
+                      ensure_ascii=False)
+    (pipe if pipe is not None else redis_conn).lpush(COLA_KEY, item)
+
+
+def pendientes(redis_conn) -> int:
+    """Mensajes por enviar: en cola más los que esperan reintento."""
+    p = redis_conn.pipeline(transaction=False)
+    p.llen(COLA_KEY)
+    p.zcard(REINTENTOS_KEY)
+    return sum(int(n or 0) for n in p.execute())
+
+
+def entregado(resp) -> bool:
+    """Graph contesta 200 con {"error": {...}} en muchos rechazos: eso no es entrega."""
+    return resp is not None and not (isinstance(resp, dict) and resp.get("error"))
+
+
+def mover_vencidos(redis_conn, ahora: Optional[float] = None) -> int:
+    return int(redis_conn.eval(_LUA_VENCIDOS, 2, REINTENTOS_KEY, COLA_KEY,
+                               ahora if ahora is not None else time.time()) or 0)
+
+
+def recuperar_huerfanos(redis_conn) -> int:
+    """
+    Regresa a la cola lo que quedó en proceso en workers sin latido (murieron
+    a medio envío). Incluye la lista propia de una encarnación anterior con
+    el mismo host:pid: se llama antes de que este hilo tome nada.
+    """
+    propio = worker_id()
+    n = 0
+    for key in redis_conn.scan_iter(f"{PROCESANDO_KEY}:*", count=100):
+        wid = key[len(PROCESANDO_KEY) + 1:]
+        if wid != propio and redis_conn.exists(f"{LATIDO_KEY}:{wid}"):
+            continue
+        while redis_conn.lmove(key, COLA_KEY, "RIGHT", "RIGHT") is not None:
+            n += 1
+    if n:
+        log.warning("mensajes recuperados de workers caídos", extra={"n": n})
+    return n
+
+
+def procesar_uno(redis_conn, enviar: Callable[[str, str], object], timeout: int = 5) -> bool:
+    """Envía un mensaje de la cola. Devuelve False si la cola estaba vacía."""
+    wid = worker_id()
+    procesando = f"{PROCESANDO_KEY}:{wid}"
+    redis_conn.set(f"{LATIDO_KEY}:{wid}", int(time.time()), ex=LATIDO_S)
+    mover_vencidos(redis_conn)
+    raw = redis_conn.blmove(COLA_KEY, procesando, timeout, "RIGHT", "LEFT")
+    if raw is None:
+        return False
+    item = json.loads(raw)
+    ok = False
+    try:
+        resp = enviar(item["telefono"], item["texto"])
+        ok = entregado(resp)
+        if not ok:
+            log.error("envío rechazado", extra={"telefono": item.get("telefono"), "intentos": item["intentos"],
+                                                "respuesta": str(resp)[:200]})
+    except Exception as e:
+        log.error("error enviando: %s", e, extra={"telefono": item.get("telefono"), "intentos": item["intentos"]})
+
+    p = redis_conn.pipeline(transaction=True)
+    p.lrem(procesando, 1, raw)  # ack
+    if not ok:
+        item["intentos"] += 1
+        nuevo = json.dumps(item, ensure_ascii=False)
+        if item["intentos"] < MAX_INTENTOS:
+            # Se agenda; el hilo sigue con los demás mensajes en lugar de dormir
+            p.zadd(REINTENTOS_KEY, {nuevo: time.time() + min(2 ** item["intentos"], 30)})
+        else:
+            p.lpush(FALLIDAS_KEY, nuevo)
+    p.execute()
+    return True
+
+
+def _loop(redis_conn, enviar):
+    ultimo_rescate = 0.0
+    while not _detener.is_set():
+        try:
+            if time.monotonic() - ultimo_rescate >= LATIDO_S:
+                ultimo_rescate = time.monotonic()
+                recuperar_huerfanos(redis_conn)
+            procesar_uno(redis_conn, enviar, timeout=1)
+        except Exception as e:
+            log.exception("worker: %s", e)
+            _detener.wait(1)
+    try:
+        redis_conn.delete(f"{LATIDO_KEY}:{worker_id()}")
+    except Exception:
+        pass
+
+
+def iniciar_worker(redis_conn, enviar: Callable[[str, str], object]):
+    """Arranca (una sola vez por proceso) el hilo que vacía la cola."""
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return _worker
+        _detener.clear()
+        _worker = threading.Thread(target=_loop, args=(redis_conn, enviar),
+                                   name="notificaciones", daemon=True)
+        _worker.start()
+        return _worker
+
+
+def detener_worker(timeout: float = 10) -> bool:
+    """Apagado ordenado: termina el envío en curso y no toma más de la cola (queda en Redis)."""
+    _detener.set()
+    w = _worker
+    if w is not None and w.is_alive():
+        w.join(timeout)
+        return not w.is_alive()
+    return True
@@ -0,0 +1,151 @@
+# profiler.py
+"""
+Profiler por muestreo para producción (opt-in).
+
+Se perfila con cProfile:
+  - PROFILER_MUESTREO % de las peticiones (0 = apagado, el default), o
+  - las que traen el header X-Profile: <PROFILER_TOKEN>.
+
+Con el profiler apagado y sin el header, el costo por petición es una
+comparación en before_request.
+
+Por cada petición perfilada se suman en Redis las funciones más costosas
+(PROFILER_TOP por tiempo propio y por tiempo acumulado):
+  prof:rutas                      ZSET  "<METODO> <regla>" -> muestras
+  prof:<ruta>:propio              ZSET  "archivo:línea(función)" -> segundos propios
+  prof:<ruta>:acumulado           ZSET  "archivo:línea(función)" -> segundos acumulados
+  prof:<ruta>:llamadas            ZSET  "archivo:línea(función)" -> llamadas
+  prof:<ruta>:segundos            STRING duración total perfilada
+Cada ZSET se recorta a PROFILER_MAX_FUNCIONES y todo expira en PROFILER_TTL_S.
+
+Se consulta en /admin/profiler con el mismo token (sin PROFILER_TOKEN la página
+responde 403).
+"""
+import os, time, random, cProfile, pstats
+from typing import Dict, Any, List, Optional
+
+import logs
+
+log = logs.obtener("profiler")
+
+PROFILER_MUESTREO = float(os.getenv("PROFILER_MUESTREO", "0"))   # porcentaje 0-100
+PROFILER_TOKEN    = os.getenv("PROFILER_TOKEN", "")
+PROFILER_TOP      = int(os.getenv("PROFILER_TOP", "25"))
+PROFILER_MAX_FUNCIONES = int(os.getenv("PROFILER_MAX_FUNCIONES", "200"))
+PROFILER_TTL_S    = int(os.getenv("PROFILER_TTL_S", str(7 * 86400)))
+HEADER = "X-Profile"
+
+RUTAS_KEY = "prof:rutas"
+EXCLUIR = ("/metrics", "/eventos", "/admin/profiler")  # prefijos
+
+
+def _key(ruta: str, tipo: str) -> str:
+    return f"prof:{ruta}:{tipo}"
+
+
+def autorizado(token: Optional[str]) -> bool:
+    return bool(PROFILER_TOKEN) and token == PROFILER_TOKEN
+
+
+def _funcion(clave) -> str:
+    archivo, linea, nombre = clave
+    if archivo == "~":  # built-ins: ('~', 0, "<method 'execute' of ...>")
+        return nombre
+    return f"{os.path.basename(archivo)}:{linea}({nombre})"
+
+
+def guardar(redis_conn, ruta: str, perfil: cProfile.Profile, duracion_s: float):
+    stats = pstats.Stats(perfil).stats  # {(archivo, línea, función): (cc, nc, propio, acumulado, callers)}
+    filas = [(_funcion(k), nc, tt, ct) for k, (cc, nc, tt, ct, _) in stats.items()]
+    top_propio = sorted(filas, key=lambda f: f[2], reverse=True)[:PROFILER_TOP]
+    top_acum   = sorted(filas, key=lambda f: f[3], reverse=True)[:PROFILER_TOP]
+
+    p = redis_conn.pipeline(transaction=False)
+    p.zincrby(RUTAS_KEY, 1, ruta)
+    p.incrbyfloat(_key(ruta, "segundos"), duracion_s)
+    for nombre, nc, tt, _ in top_propio:
+        p.zincrby(_key(ruta, "propio"), tt, nombre)
+        p.zincrby(_key(ruta, "llamadas"), nc, nombre)
+    for nombre, _, _, ct in top_acum:
+        p.zincrby(_key(ruta, "acumulado"), ct, nombre)
+    for tipo in ("propio", "acumulado", "llamadas"):
+        p.zremrangebyrank(_key(ruta, tipo), 0, -PROFILER_MAX_FUNCIONES - 1)
+        p.expire(_key(ruta, tipo), PROFILER_TTL_S)
+    p.expire(_key(ruta, "segundos"), PROFILER_TTL_S)
+    p.expire(RUTAS_KEY, PROFILER_TTL_S)
+    p.execute()
+
+
+def resumen(redis_conn, limit: int = 20) -> List[Dict[str, Any]]:
+    """Rutas perfiladas (más muestras primero) con sus funciones más costosas."""
+    rutas = redis_conn.zrevrange(RUTAS_KEY, 0, -1, withscores=True)
+    if not rutas:
+        return []
+    p = redis_conn.pipeline(transaction=False)
+    for ruta, _ in rutas:
+        p.get(_key(ruta, "segundos"))
+        p.zrevrange(_key(ruta, "propio"), 0, limit - 1, withscores=True)
+        p.zrevrange(_key(ruta, "acumulado"), 0, limit - 1, withscores=True)
+    res = p.execute()
+
+    p = redis_conn.pipeline(transaction=False)
+    for i, (ruta, _) in enumerate(rutas):
+        for nombre, _ in res[3 * i + 1]:
+            p.zscore(_key(ruta, "llamadas"), nombre)
+    llamadas = iter(p.execute())
+
+    out = []
+    for i, (ruta, muestras) in enumerate(rutas):
+        segundos, propio, acumulado = float(res[3 * i] or 0), res[3 * i + 1], res[3 * i + 2]
+        muestras = int(muestras)
+        out.append({
+            "ruta": ruta,
+            "muestras": muestras,
+            "promedio_ms": round(1000 * segundos / muestras, 1) if muestras else 0,
+            "propio": [{"funcion": n, "ms_por_muestra": round(1000 * s / muestras, 2),
+                        "llamadas_por_muestra": round(float(next(llamadas) or 0) / muestras, 1)}
+                       for n, s in propio],
+            "acumulado": [{"funcion": n, "ms_por_muestra": round(1000 * s / muestras, 2)}
+                          for n, s in acumulado],
+        })
+    return out
+
+
+def limpiar(redis_conn) -> int:
+    claves = [RUTAS_KEY]
+    for ruta in redis_conn.zrange(RUTAS_KEY, 0, -1):
+        claves += [_key(ruta, t) for t in ("propio", "acumulado", "llamadas", "segundos")]
+    return int(redis_conn.delete(*claves) or 0)
+
+
+def instrumentar_app(app, redis_conn):
+    """Registra los hooks de Flask que deciden qué peticiones perfilar."""
+    from flask import g, request
+
+    @app.before_request
+    def _profiler_inicio():
+        if PROFILER_MUESTREO <= 0 and HEADER not in request.headers:
+            return
+        if not (autorizado(request.headers.get(HEADER)) or random.random() * 100 < PROFILER_MUESTREO):
+            return
+        if request.path.startswith(EXCLUIR):
+            return
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:  # otro profiler activo en este hilo
+            return
+        g._profiler = (perfil, time.perf_counter())
+
+    @app.teardown_request
+    def _profiler_fin(exc):
+        actual = g.pop("_profiler", None)
+        if actual is None:
+            return
+        perfil, t0 = actual
+        perfil.disable()
+        ruta = f"{request.method} {request.url_rule.rule if request.url_rule is not None else '<sin_ruta>'}"
+        try:
+            guardar(redis_conn, ruta, perfil, time.perf_counter() - t0)
+        except Exception as e:
+            log.error("no se pudo guardar el perfil: %s", e, extra={"ruta": ruta})
@@ -0,0 +1,163 @@
+# qr_analytics.py
+"""
+Analítica de los QR de vendedores (escaneos -> mensaje de WhatsApp).
+
+Claves:
+  qr:scans                      ZSET  vendedor -> escaneos totales
+  qr:conversiones               ZSET  vendedor -> teléfonos que escribieron con su código
+  qr:<vid>:h:<YYYYMMDDHH>       HASH  {"scans", "mensajes"} por hora (expira QR_RETENCION_H)
+  qr:<vid>:uv                   HLL   visitantes únicos (hash de IP + user agent)
+  qr:<vid>:uv:<YYYYMMDD>        HLL   visitantes únicos del día (expira QR_RETENCION_H)
+  qr:<vid>:abiertos             ZSET  visitante -> ts de escaneos que aún no convierten
+                                      (ventana QR_VENTANA_CONVERSION_S)
+  qr:telefono_vendedor          HASH  telefono -> primer vendedor que lo trajo
+
+Los vendedores se agregan por código canónico (registro_vendedores); los
+códigos que no están en el registro (QR viejos, parámetros inventados o
+scrapeados) se cuentan todos bajo DESCONOCIDO, así no crean claves sin fin.
+
+Una conversión es un primer mensaje con código de vendedor que consume un
+escaneo abierto de ese vendedor: quien escribe el código sin haber escaneado
+(o ya fuera de la ventana) no infla la tasa de conversión.
+Cada escaneo es UN round trip (pipeline). Las cubetas por hora son ventanas
+fijas por nombre de clave: el EXPIRE sólo limpia, no reinicia el conteo.
+"""
+import os, time, hashlib
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+import registro_vendedores
+
+SCANS_KEY = "qr:scans"
+CONV_KEY  = "qr:conversiones"
+ATRIB_KEY = "qr:telefono_vendedor"
+QR_RETENCION_H = int(os.getenv("QR_RETENCION_H", str(30 * 24)))
+QR_VENTANA_CONVERSION_S = int(os.getenv("QR_VENTANA_CONVERSION_S", "3600"))
+DESCONOCIDO = "desconocido"
+
+# Atómico: sólo el primer mensaje del teléfono, y sólo si hay un escaneo abierto que consumir
+_LUA_CONVERSION = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+  return 0
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[3])
+local escaneo = redis.call('ZPOPMIN', KEYS[2])
+if #escaneo == 0 then
+  return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return 1
+"""
+
+
+def _hora(ts: float) -> str:
+    return datetime.fromtimestamp(ts).strftime("%Y%m%d%H")
+
+def _dia(ts: float) -> str:
+    return datetime.fromtimestamp(ts).strftime("%Y%m%d")
+
+def visitante(ip: str, user_agent: str) -> str:
+    """Identificador anónimo del visitante (no guardamos IP ni UA en claro)."""
+    return hashlib.sha1(f"{ip}|{user_agent}".encode("utf-8")).hexdigest()[:16]
+
+
+def vendedor_de_qr(redis_conn, codigo: str) -> str:
+    """Código canónico si el vendedor está registrado; DESCONOCIDO si no."""
+    v = registro_vendedores.buscar(redis_conn, codigo)
+    return v.canonico if v else DESCONOCIDO
+
+
+def registrar_escaneo(redis_conn, vendedor_id: str, visitante_id: str, ts: Optional[float] = None):
+    ts = ts if ts is not None else time.time()
+    ttl = QR_RETENCION_H * 3600
+    hora_key = f"qr:{vendedor_id}:h:{_hora(ts)}"
+    uv_dia_key = f"qr:{vendedor_id}:uv:{_dia(ts)}"
+    p = redis_conn.pipeline(transaction=False)
+    p.zincrby(SCANS_KEY, 1, vendedor_id)
+    p.hincrby(hora_key, "scans", 1)
+    p.expire(hora_key, ttl)
+    p.pfadd(f"qr:{vendedor_id}:uv", visitante_id)
+    p.pfadd(uv_dia_key, visitante_id)
+    p.expire(uv_dia_key, ttl)
+    if vendedor_id != DESCONOCIDO:
+        abiertos = f"qr:{vendedor_id}:abiertos"
+        p.zadd(abiertos, {visitante_id: ts})
+        p.expire(abiertos, QR_VENTANA_CONVERSION_S)
+    p.execute()
+
+
+def registrar_mensaje(redis_conn, telefono: str, vendedor_id: str, ts: Optional[float] = None) -> bool:
+    """
+    Cuenta la conversión si es el primer mensaje de ese teléfono con código
+    de vendedor (atribución al primer vendedor) y hubo un escaneo de ese
+    vendedor en la ventana, que queda consumido. True si se contó.
+    """
+    ts = ts if ts is not None else time.time()
+    if not redis_conn.eval(_LUA_CONVERSION, 2, ATRIB_KEY, f"qr:{vendedor_id}:abiertos",
+                           telefono, vendedor_id, ts - QR_VENTANA_CONVERSION_S):
+        return False  # ya atribuido antes o sin escaneo abierto
+    hora_key = f"qr:{vendedor_id}:h:{_hora(ts)}"
+    p = redis_conn.pipeline(transaction=False)
+    p.zincrby(CONV_KEY, 1, vendedor_id)
+    p.hincrby(hora_key, "mensajes", 1)
+    p.expire(hora_key, QR_RETENCION_H * 3600)
+    p.execute()
+    return True
+
+
+def resumen(redis_conn) -> List[Dict[str, Any]]:
+    """Escaneos, visitantes únicos, conversiones y tasa por vendedor (más escaneos primero)."""
+    p = redis_conn.pipeline(transaction=False)
+    p.zrevrange(SCANS_KEY, 0, -1, withscores=True)
+    p.zrange(CONV_KEY, 0, -1, withscores=True)
+    orden, convs = p.execute()
+    scans, convs = dict(orden), dict(convs)
+    vendedores = [v for v, _ in orden] + [v for v in convs if v not in scans]
+
+    p = redis_conn.pipeline(transaction=False)
+    for v in vendedores:
+        p.pfcount(f"qr:{v}:uv")
+    unicos = p.execute()
+
+    out = []
+    for v, uv in zip(vendedores, unicos):
+        conv = int(convs.get(v, 0))
+        out.append({
+            "vendedor_id": v,
+            "scans": int(scans.get(v, 0)),
+            "visitantes_unicos": int(uv or 0),
+            "conversiones": conv,
+            "tasa_conversion": round(conv / uv, 4) if uv else None,
+        })
+    return out
+
+
+def detalle(redis_conn, vendedor_id: str, horas: int = 48, hasta: Optional[float] = None) -> Dict[str, Any]:
+    """Serie por hora (scans / mensajes) y visitantes únicos por día de un vendedor."""
+    horas = max(1, min(horas, QR_RETENCION_H))
+    hasta = hasta if hasta is not None else time.time()
+    base = datetime.fromtimestamp(hasta).replace(minute=0, second=0, microsecond=0)
+    marcas = [base - timedelta(hours=i) for i in range(horas - 1, -1, -1)]
+    dias = sorted({m.strftime("%Y%m%d") for m in marcas})
+
+    p = redis_conn.pipeline(transaction=False)
+    for m in marcas:
+        p.hgetall(f"qr:{vendedor_id}:h:{m.strftime('%Y%m%d%H')}")
+    for d in dias:
+        p.pfcount(f"qr:{vendedor_id}:uv:{d}")
+    p.zscore(SCANS_KEY, vendedor_id)
+    p.zscore(CONV_KEY, vendedor_id)
+    p.pfcount(f"qr:{vendedor_id}:uv")
+    res = p.execute()
+
+    cubetas, uv_dias, (scans, conv, uv) = res[:len(marcas)], res[len(marcas):-3], res[-3:]
+    return {
+        "vendedor_id": vendedor_id,
+        "scans": int(scans or 0),
+        "conversiones": int(conv or 0),
+        "visitantes_unicos": int(uv or 0),
+        "por_hora": [{"hora": m.strftime("%Y-%m-%d %H:00"),
+                      "scans": int(c.get("scans", 0)), "mensajes": int(c.get("mensajes", 0))}
+                     for m, c in zip(marcas, cubetas)],
+        "unicos_por_dia": dict(zip(dias, (int(x or 0) for x in uv_dias))),
+    }
@@ -0,0 +1,162 @@
+# redis_pool.py
+"""
+Conexiones a Redis configurables, con pools separados por tipo de trabajo.
+
+  "hot"    lo que contesta al usuario: webhook (sesiones, control de carga,
+           inventario de premios), dashboard. Timeouts cortos.
+  "fondo"  hilos y tareas de fondo: envío de notificaciones (BRPOP),
+           replicador, importaciones, profiler. Timeouts largos.
+  "pubsub" suscripciones de /eventos (una conexión por dashboard abierto).
+Así una importación lenta, un BRPOP o muchos dashboards abiertos no dejan
+sin conexiones al webhook.
+
+Config (env):
+  REDIS_URL                 redis://[:pass@]host:6379/0, rediss://..., unix:///run/redis.sock?db=0
+                            (sin URL: REDIS_HOST / REDIS_PORT / REDIS_DB, default localhost:6379/0)
+  REDIS_POOL_MAX            conexiones máx. del pool hot (50)
+  REDIS_POOL_MAX_FONDO      conexiones máx. del pool fondo (10)
+  REDIS_POOL_MAX_PUBSUB     conexiones máx. del pool pubsub (100)
+  REDIS_POOL_ESPERA_S       cuánto espera una petición por una conexión libre (2)
+  REDIS_SOCKET_TIMEOUT      timeout de lectura hot (2) / REDIS_SOCKET_TIMEOUT_FONDO (15)
+  REDIS_CONNECT_TIMEOUT     timeout de conexión (1)
+  REDIS_REINTENTOS          reintentos si se cae la conexión, backoff exponencial con jitter (3).
+                            Un timeout de lectura NO se reintenta: el servidor pudo ya haber
+                            ejecutado el comando (DECR del inventario, INCR, LPUSH de
+                            notificaciones) y repetirlo daría premios o mensajes dobles.
+  REDIS_BACKOFF_BASE_S / REDIS_BACKOFF_MAX_S   (0.05 / 1)
+  REDIS_HEALTH_CHECK_S      PING antes de usar una conexión ociosa más de N s (30)
+
+Métricas: buenfin_redis_pool_conexiones{pool,estado} y buenfin_redis_pool_espera_segundos{pool}.
+"""
+import os, time, threading
+from typing import Dict, Any
+
+import redis
+from redis.backoff import EqualJitterBackoff
+from redis.retry import Retry
+from redis.exceptions import ConnectionError as RedisConnectionError
+from prometheus_client import Gauge, Histogram
+
+import metricas
+
+REDIS_URL = os.getenv("REDIS_URL", "")
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_DB   = int(os.getenv("REDIS_DB", "0"))
+
+POOL_MAX        = int(os.getenv("REDIS_POOL_MAX", "50"))
+POOL_MAX_FONDO  = int(os.getenv("REDIS_POOL_MAX_FONDO", "10"))
+POOL_MAX_PUBSUB = int(os.getenv("REDIS_POOL_MAX_PUBSUB", "100"))
+POOL_ESPERA_S   = float(os.getenv("REDIS_POOL_ESPERA_S", "2"))
+SOCKET_TIMEOUT       = float(os.getenv("REDIS_SOCKET_TIMEOUT", "2"))
+SOCKET_TIMEOUT_FONDO = float(os.getenv("REDIS_SOCKET_TIMEOUT_FONDO", "15"))  # > timeout de BRPOP
+CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "1"))
+REINTENTOS      = int(os.getenv("REDIS_REINTENTOS", "3"))
+BACKOFF_BASE_S  = float(os.getenv("REDIS_BACKOFF_BASE_S", "0.05"))
+BACKOFF_MAX_S   = float(os.getenv("REDIS_BACKOFF_MAX_S", "1"))
+HEALTH_CHECK_S  = int(os.getenv("REDIS_HEALTH_CHECK_S", "30"))
+
+POOLS = {
+    "hot":   {"max_connections": POOL_MAX,       "socket_timeout": SOCKET_TIMEOUT},
+    "fondo": {"max_connections": POOL_MAX_FONDO, "socket_timeout": SOCKET_TIMEOUT_FONDO},
+    "pubsub": {"max_connections": POOL_MAX_PUBSUB, "socket_timeout": SOCKET_TIMEOUT_FONDO},
+}
+
+POOL_CONEXIONES = Gauge(f"{metricas.PREFIJO}_redis_pool_conexiones", "Conexiones del pool por estado",
+                        ["pool", "estado"], multiprocess_mode="livesum")
+POOL_ESPERA = Histogram(f"{metricas.PREFIJO}_redis_pool_espera_segundos", "Espera por una conexión libre",
+                        ["pool"], buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2, 5))
+
+
+class PoolMedido(redis.BlockingConnectionPool):
+    """
+    BlockingConnectionPool que lleva la cuenta de conexiones en uso y cuánto
+    se espera por una libre. Al llegar a max_connections la petición espera
+    (hasta POOL_ESPERA_S) en lugar de abrir sockets sin límite.
+    """
+
+    def __init__(self, *args, nombre: str = "hot", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.nombre = nombre
+        self._uso_lock = threading.Lock()
+        self.en_uso = 0
+        POOL_CONEXIONES.labels(nombre, "max").set(self.max_connections)
+
+    def get_connection(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        conn = super().get_connection(*args, **kwargs)
+        POOL_ESPERA.labels(self.nombre).observe(time.perf_counter() - t0)
+        with self._uso_lock:
+            self.en_uso += 1
+            self._publicar()
+        return conn
+
+    def release(self, connection):
+        super().release(connection)
+        with self._uso_lock:
+            self.en_uso = max(0, self.en_uso - 1)
+            self._publicar()
+
+    def _publicar(self):
+        POOL_CONEXIONES.labels(self.nombre, "en_uso").set(self.en_uso)
+        POOL_CONEXIONES.labels(self.nombre, "abiertas").set(len(self._connections))
+
+    def estado(self) -> Dict[str, int]:
+        return {"max": self.max_connections, "abiertas": len(self._connections), "en_uso": self.en_uso}
+
+
+def _crear_pool(nombre: str) -> PoolMedido:
+    opciones = dict(
+        nombre=nombre,
+        timeout=POOL_ESPERA_S,
+        socket_connect_timeout=CONNECT_TIMEOUT,
+        health_check_interval=HEALTH_CHECK_S,
+        # Sólo errores de conexión (sin TimeoutError / socket.timeout); ver REDIS_REINTENTOS
+        retry=Retry(EqualJitterBackoff(cap=BACKOFF_MAX_S, base=BACKOFF_BASE_S), REINTENTOS,
+                    supported_errors=(RedisConnectionError,)),
+        decode_responses=True,
+        **POOLS[nombre],
+    )
+    if REDIS_URL:
+        return PoolMedido.from_url(REDIS_URL, **opciones)
+    return PoolMedido(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, **opciones)
+
+
+_clientes: Dict[str, redis.Redis] = {}
+_lock = threading.Lock()
+
+
+def cliente(nombre: str = "hot") -> redis.Redis:
+    """Cliente (uno por pool y proceso) con cada comando medido en /metrics."""
+    with _lock:
+        c = _clientes.get(nombre)
+        if c is None:
+            c = metricas.instrumentar_redis(redis.Redis(connection_pool=_crear_pool(nombre)))
+            _clientes[nombre] = c
+        return c
+
+
+def estado() -> Dict[str, Any]:
+    """PING (con latencia) y uso de cada pool creado en este proceso."""
+    out = {}
+    for nombre, c in list(_clientes.items()):
+        t0 = time.perf_counter()
+        try:
+            c.ping()
+            info: Dict[str, Any] = {"ok": True, "ping_ms": round(1000 * (time.perf_counter() - t0), 2)}
+        except Exception as e:
+            info = {"ok": False, "error": str(e)[:200]}
+        pool = c.connection_pool
+        if isinstance(pool, PoolMedido):
+            info.update(pool.estado())
+        out[nombre] = info
+    return out
+
+
+def cerrar():
+    """Cierra los sockets de todos los pools (apagado del worker)."""
+    for c in list(_clientes.values()):
+        try:
+            c.connection_pool.disconnect()
+        except Exception:
+            pass
@@ -0,0 +1,172 @@
+# registro_vendedores.py
+"""
+Registro de vendedores con recarga en caliente.
+
+Fuente (la primera que tenga datos):
+  1. Redis   vendedores:registro  HASH  codigo -> nombre   (+ vendedores:version)
+  2. Archivo VENDEDORES_FILE (JSON {"V001": "Nombre", ...})
+  3. vendedores.VENDEDORES (lo que viene en el deploy)
+
+El registro se guarda en memoria y sólo se revisa si cambió cada
+VENDEDORES_RECHECK_S (un GET a Redis o un stat del archivo), así resolver un
+código por mensaje es un dict lookup.
+
+Varios códigos pueden ser la misma persona (V006/V019, V009/V020): todos
+apuntan al código canónico (el menor con el mismo nombre normalizado), que es
+el que se usa para agregar escaneos, conversiones, etc.
+
+CLI:
+  python registro_vendedores.py cargar vendedores.json   # sube a Redis y recarga workers
+  python registro_vendedores.py duplicados
+"""
+import os, re, sys, json, time, threading
+from typing import Dict, Optional, NamedTuple
+
+from vendedores import VENDEDORES
+from leaderboards import normalizar
+import logs
+
+log = logs.obtener("vendedores")
+
+REGISTRO_KEY = "vendedores:registro"
+VERSION_KEY  = "vendedores:version"
+VENDEDORES_FILE = os.getenv("VENDEDORES_FILE", "")
+RECHECK_S = float(os.getenv("VENDEDORES_RECHECK_S", "30"))
+
+CODIGO_RE = re.compile(r"\bV\d{3}\b", re.IGNORECASE)
+
+
+class Vendedor(NamedTuple):
+    codigo: str
+    canonico: str
+    nombre: str
+
+
+class _Snapshot(NamedTuple):
+    fuente: str
+    version: str
+    vendedores: Dict[str, Vendedor]
+
+
+_lock = threading.Lock()
+_snap: Optional[_Snapshot] = None
+_revisado = 0.0
+
+
+def _construir(nombres: Dict[str, str], fuente: str, version: str) -> _Snapshot:
+    canon: Dict[str, str] = {}
+    for codigo in sorted(nombres):
+        canon.setdefault(normalizar(nombres[codigo]) or codigo, codigo)
+    vendedores = {}
+    for codigo, nombre in nombres.items():
+        limpio = " ".join(nombre.split())
+        vendedores[codigo.upper()] = Vendedor(codigo.upper(), canon[normalizar(nombre) or codigo].upper(), limpio)
+    return _Snapshot(fuente, version, vendedores)
+
+
+def _version_fuente(redis_conn) -> str:
+    if redis_conn is not None:
+        try:
+            v = redis_conn.get(VERSION_KEY)
+            if v:
+                return f"redis:{v}"
+        except Exception as e:
+            log.warning("Redis no disponible, uso respaldo: %s", e)
+    if VENDEDORES_FILE and os.path.exists(VENDEDORES_FILE):
+        return f"file:{os.stat(VENDEDORES_FILE).st_mtime_ns}"
+    return "static"
+
+
+def _cargar(redis_conn, version: str) -> _Snapshot:
+    if version.startswith("redis:"):
+        nombres = redis_conn.hgetall(REGISTRO_KEY)
+        if nombres:
+            return _construir(nombres, "redis", version)
+    if version.startswith("file:"):
+        with open(VENDEDORES_FILE, "r", encoding="utf-8") as f:
+            return _construir(json.load(f), "file", version)
+    return _construir(VENDEDORES, "static", "static")
+
+
+def registro(redis_conn=None, forzar: bool = False) -> _Snapshot:
+    """Snapshot vigente; recarga si la versión de la fuente cambió."""
+    global _snap, _revisado
+    ahora = time.monotonic()
+    if not forzar and _snap is not None and ahora - _revisado < RECHECK_S:
+        return _snap
+    with _lock:
+        if not forzar and _snap is not None and ahora - _revisado < RECHECK_S:
+            return _snap
+        version = _version_fuente(redis_conn)
+        if forzar or _snap is None or _snap.version != version:
+            try:
+                _snap = _cargar(redis_conn, version)
+                log.info("registro cargado", extra={"fuente": _snap.fuente, "codigos": len(_snap.vendedores)})
+            except Exception as e:
+                log.error("error recargando registro: %s", e)
+                if _snap is None:
+                    _snap = _construir(VENDEDORES, "static", "static")
+        _revisado = ahora
+        return _snap
+
+
+def buscar(redis_conn, codigo: str) -> Optional[Vendedor]:
+    return registro(redis_conn).vendedores.get((codigo or "").strip().upper())
+
+
+def canonico(redis_conn, codigo: str) -> str:
+    """Código canónico para agregar; los códigos desconocidos se quedan igual."""
+    v = buscar(redis_conn, codigo)
+    return v.canonico if v else (codigo or "").strip().upper()
+
+
+def nombre(redis_conn, codigo: str, default: str = "") -> str:
+    v = buscar(redis_conn, codigo)
+    return v.nombre if v else default
+
+
+def resolver_texto(redis_conn, texto: str) -> Optional[Vendedor]:
+    """Primer código de vendedor registrado que aparezca en el mensaje."""
+    if not texto:
+        return None
+    vendedores = registro(redis_conn).vendedores
+    for m in CODIGO_RE.finditer(texto):
+        v = vendedores.get(m.group(0).upper())
+        if v:
+            return v
+    return None
+
+
+def cargar_en_redis(redis_conn, nombres: Dict[str, str]) -> int:
+    """Reemplaza el registro en Redis; los workers lo toman en <= RECHECK_S."""
+    nombres = {k.strip().upper(): v for k, v in nombres.items() if CODIGO_RE.fullmatch(k.strip())}
+    p = redis_conn.pipeline(transaction=True)
+    p.delete(REGISTRO_KEY)
+    if nombres:
+        p.hset(REGISTRO_KEY, mapping=nombres)
+    p.incr(VERSION_KEY)
+    p.execute()
+    return len(nombres)
+
+
+def duplicados(redis_conn=None) -> Dict[str, list]:
+    """{codigo_canonico: [codigos que apuntan a él]} sólo para los que tienen alias."""
+    grupos: Dict[str, list] = {}
+    for v in registro(redis_conn).vendedores.values():
+        grupos.setdefault(v.canonico, []).append(v.codigo)
+    return {k: sorted(v) for k, v in sorted(grupos.items()) if len(v) > 1}
+
+
+if __name__ == "__main__":
+    import redis_pool
+    logs.configurar()
+    conn = redis_pool.cliente("fondo")
+    if len(sys.argv) >= 3 and sys.argv[1] == "cargar":
+        with open(sys.argv[2], "r", encoding="utf-8") as f:
+            print(f"{cargar_en_redis(conn, json.load(f))} vendedores cargados en Redis")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "duplicados":
+        for canon, codigos in duplicados(conn).items():
+            print(f"{canon}: {', '.join(codigos)}  ({nombre(conn, canon)})")
+    else:
+        print(__doc__)
+        sys.exit(1)
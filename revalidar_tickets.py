@@ -0,0 +1,485 @@
+# revalidar_tickets.py
+#!/usr/bin/env python3
+"""
+Re-validación masiva (offline) de los tickets guardados.
+
+Recorre images_to_process/ e images_processed/, omite las imágenes cuyo
+.ai.json ya corresponde al prompt/modelo actual y manda el resto a OpenAI
+Vision en paralelo. Cada resultado se anexa a un checkpoint JSONL, así que
+el proceso puede interrumpirse y retomarse con --resume (lo que quedó en
+el checkpoint con error se vuelve a intentar). Si el circuito de OpenAI se
+abre a media corrida, se deja de mandar imágenes: las que faltan no se
+marcan como error y se retoman con --resume.
+
+Al final escribe:
+  - <out>/resultados.json : consolidado {archivo: resultado}
+  - <out>/diff_sheet.csv  : montos OCR vs. montos registrados en el Sheet
+
+También vacía la cola de OCR pendiente (images_processed/ocr_pendientes.jsonl)
+que deja el modo degradado cuando OpenAI está caído: esas imágenes se
+procesan primero (aun con --limit) y las que no se pudieron resolver
+vuelven a la cola para la siguiente corrida. Cuando el OCR diferido sí
+encuentra el total, el ticket que quedó en "Revisión manual" pasa a
+"Pendiente de validación" con su monto (SQLite y Sheet), igual que si el OCR
+hubiera funcionado al recibir la foto, y entra a la cola de asignación de
+premios del dashboard. Con --no-sheet sólo se actualizan los tickets que aún
+no se replican; los demás se quedan en la cola.
+
+Para probar sin gastar tokens, apunta --base-url (u OPENAI_BASE_URL) a un
+stand-in local compatible con /v1/chat/completions.
+
+Uso:
+  python revalidar_tickets.py --workers 8 --out revalidacion/
+  python revalidar_tickets.py --resume --out revalidacion/
+  python revalidar_tickets.py --force --base-url http://127.0.0.1:8080/v1
+"""
+import os, csv, json, argparse, threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import image_store
+import ticket_store
+import ticket_validator as tv
+from circuit_breaker import CircuitoAbierto
+from ticket_validator import DIR_TO_PROCESS, DIR_PROCESSED, PROMPT_VERSION
+import logs
+
+log = logs.obtener("revalidar")
+
+EXTENSIONES = (".jpg", ".jpeg", ".png")
+
+# -------------------------------
+# Descubrimiento de imágenes
+# -------------------------------
+def listar_imagenes(carpetas: Iterable[str] = (DIR_TO_PROCESS, DIR_PROCESSED)) -> Dict[str, str]:
+    """
+    Devuelve {nombre_archivo: ruta}. Si la imagen está en ambas carpetas
+    se prefiere la primera (el original en images_to_process).
+    """
+    out: Dict[str, str] = {}
+    for carpeta in carpetas:
+        if not os.path.isdir(carpeta):
+            continue
+        with os.scandir(carpeta) as it:
+            for e in it:
+                if e.is_file() and e.name.lower().endswith(EXTENSIONES) and e.name not in out:
+                    out[e.name] = e.path
+    return out
+
+def ai_json_vigente(nombre_archivo: str, ruta_imagen: str) -> bool:
+    """True si el .ai.json existe, es del prompt actual y no es más viejo que la imagen."""
+    ruta_json = tv.ruta_ai_json(nombre_archivo)
+    try:
+        if os.path.getmtime(ruta_json) < os.path.getmtime(ruta_imagen):
+            return False
+        with open(ruta_json, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return data.get("prompt_version") == PROMPT_VERSION
+
+# -------------------------------
+# Cola de OCR pendiente (modo degradado)
+# -------------------------------
+def tomar_cola_ocr(ruta: str = tv.COLA_OCR_PENDIENTE) -> List[Dict[str, Any]]:
+    """
+    Toma la cola completa: la renombra a <ruta>.procesando (lo que el bot
+    encole mientras tanto va a un archivo nuevo) y devuelve sus items. Si una
+    corrida anterior se cortó, su .procesando se toma también.
+    """
+    en_proceso = ruta + ".procesando"
+    if os.path.exists(ruta):
+        if os.path.exists(en_proceso):
+            with open(ruta, encoding="utf-8") as src, open(en_proceso, "a", encoding="utf-8") as dst:
+                dst.write(src.read())
+            os.remove(ruta)
+        else:
+            os.replace(ruta, en_proceso)
+    if not os.path.exists(en_proceso):
+        return []
+    items: Dict[str, Dict[str, Any]] = {}
+    with open(en_proceso, encoding="utf-8") as f:
+        for linea in f:
+            try:
+                item = json.loads(linea)
+            except ValueError:
+                continue  # línea truncada
+            if item.get("archivo"):
+                items[item["archivo"]] = item  # la misma imagen encolada dos veces cuenta una
+    return list(items.values())
+
+def devolver_cola_ocr(items: Iterable[Dict[str, Any]], ruta: str = tv.COLA_OCR_PENDIENTE) -> None:
+    """Regresa a la cola los items no resueltos y descarta el .procesando."""
+    items = list(items)
+    if items:
+        with open(ruta, "a", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    try:
+        os.remove(ruta + ".procesando")
+    except FileNotFoundError:
+        pass
+
+PREMIO_OCR_OK = "Pendiente de validación"  # lo mismo que pone flujo._foto cuando el OCR lee el total
+
+def _solo_digitos(s: str) -> str:
+    return "".join(ch for ch in (s or "") if ch.isdigit())
+
+def _escribir_en_sheet(ws, redis_conn, sheet_row: int, telefono: str, monto: float, motivo: str) -> bool:
+    """
+    Monto/Premio/Motivo en la fila del Sheet, con el mismo candado por fila que
+    /asignar-premio y compare-and-set: la fila debe seguir en revisión manual y
+    ser del mismo teléfono. False si no se pudo (se reintenta en otra corrida).
+    """
+    from gspread.utils import rowcol_to_a1
+    from sheets_utils import header_map
+
+    headers = header_map(ws, force=True)
+    if "premio" not in headers:
+        return False
+    lock_key = f"asignando:{sheet_row}"
+    if not redis_conn.set(lock_key, "revalidar", nx=True, ex=30):
+        return False  # un revisor está asignando esta fila
+    try:
+        fila = ws.row_values(sheet_row)
+
+        def celda(campo):
+            i = headers.get(campo)
+            return (fila[i] if i is not None and i < len(fila) else "").strip()
+
+        tel = _solo_digitos(celda("telefono") or celda("teléfono"))
+        if celda("premio").lower() not in ticket_store.EN_REVISION or (tel and tel != _solo_digitos(telefono)):
+            return False
+        valores = {"premio": PREMIO_OCR_OK, "monto": monto, "motivo": motivo, "cantidad detectada": monto}
+        cambios = [{"range": rowcol_to_a1(sheet_row, headers[campo] + 1), "values": [[valor]]}
+                   for campo, valor in valores.items() if campo in headers]
+        ws.batch_update(cambios, value_input_option="USER_ENTERED")
+        return True
+    finally:
+        redis_conn.delete(lock_key)
+
+def aplicar_ocr_a_tickets(items: Iterable[Dict[str, Any]], resultados: Dict[str, Dict[str, Any]],
+                          ws=None, redis_conn=None) -> List[Dict[str, Any]]:
+    """
+    Escribe en el ticket (ticket_store y, si ya se replicó, el Sheet) el total
+    que encontró el OCR diferido. Devuelve los items que no se pudieron
+    aplicar todavía (sin Sheet/Redis, fila bloqueada o error) para regresarlos a la cola.
+    """
+    sin_aplicar: List[Dict[str, Any]] = []
+    for it in items:
+        res = resultados.get(it["archivo"]) or {}
+        if res.get("total") is None:
+            continue  # el OCR tampoco encontró el total: se queda en revisión manual
+        monto = float(res["total"])
+        motivo = f"Monto detectado: ${monto:,.2f}"
+        try:
+            pendiente = False
+            for t in ticket_store.en_revision_por_archivo(it["archivo"]):
+                if t["sheet_row"] is not None:
+                    if ws is None or redis_conn is None or not _escribir_en_sheet(
+                            ws, redis_conn, t["sheet_row"], t["telefono"], monto, motivo):
+                        pendiente = True
+                        continue
+                if not ticket_store.actualizar_ocr(t["id"], monto, motivo, PREMIO_OCR_OK):
+                    pendiente = pendiente or t["sync_estado"] == "enviando"
+                    continue
+                log.info("ticket actualizado con el OCR diferido",
+                         extra={"archivo": it["archivo"], "ticket_id": t["id"], "sheet_row": t["sheet_row"],
+                                "monto": monto})
+        except Exception as e:
+            log.error("no se pudo actualizar el ticket: %s", e, extra={"archivo": it["archivo"]})
+            pendiente = True
+        if pendiente:
+            sin_aplicar.append(it)
+    return sin_aplicar
+
+# -------------------------------
+# Checkpoint (JSONL, append-only)
+# -------------------------------
+def cargar_checkpoint(ruta: str) -> Dict[str, Dict[str, Any]]:
+    hechos: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(ruta):
+        return hechos
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                item = json.loads(linea)
+            except ValueError:
+                continue  # línea truncada por un corte; se reprocesa
+            hechos[item["archivo"]] = item
+    return hechos
+
+class Checkpoint:
+    def __init__(self, ruta: str):
+        self._lock = threading.Lock()
+        self._f = open(ruta, "a", encoding="utf-8")
+
+    def escribir(self, item: Dict[str, Any]) -> None:
+        with self._lock:
+            self._f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            self._f.flush()
+
+    def close(self) -> None:
+        self._f.close()
+
+# -------------------------------
+# Procesamiento de una imagen
+# -------------------------------
+def procesar_imagen(client, nombre_archivo: str, ruta: str, guardar_json: bool = True) -> Dict[str, Any]:
+    item: Dict[str, Any] = {"archivo": nombre_archivo, "ok": False, "total": None, "error": ""}
+    try:
+        b64 = tv.img_to_b64(Path(ruta))
+        data = tv.extraer_ticket(client, b64)
+    except CircuitoAbierto:
+        raise  # no es error de la imagen: revalidar() detiene la corrida
+    except Exception as e:
+        item["error"] = str(e)
+        return item
+
+    item.update({
+        "ok": data.get("total") is not None,
+        "total": data.get("total"),
+        "confidence_score": data.get("confidence_score"),
+        "products": data.get("products") or [],
+        "tier": data.get("tier"),
+    })
+    if guardar_json:
+        try:
+            tv.guardar_ai_json(nombre_archivo, data)
+            image_store.actualizar_monto(nombre_archivo, data.get("total"))
+        except Exception as e:
+            log.error("no se pudo guardar .ai.json: %s", e, extra={"archivo": nombre_archivo})
+    return item
+
+def revalidar(pendientes: Dict[str, str], checkpoint: Checkpoint, workers: int = 4,
+              base_url: Optional[str] = None, guardar_json: bool = True) -> Dict[str, Dict[str, Any]]:
+    """
+    Procesa `pendientes` en paralelo. Si el circuito de OpenAI se abre, cancela
+    lo que no ha empezado y devuelve sólo lo procesado (lo demás no entra al
+    checkpoint, así que --resume lo retoma).
+    """
+    client = tv.nuevo_cliente(base_url)
+    resultados: Dict[str, Dict[str, Any]] = {}
+    total = len(pendientes)
+    circuito: Optional[CircuitoAbierto] = None
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futuros = {
+            pool.submit(procesar_imagen, client, nombre, ruta, guardar_json): nombre
+            for nombre, ruta in pendientes.items()
+        }
+        for n, fut in enumerate(as_completed(futuros), start=1):
+            if fut.cancelled():
+                continue
+            try:
+                item = fut.result()
+            except CircuitoAbierto as e:
+                if circuito is None:
+                    circuito = e
+                    for f in futuros:
+                        f.cancel()
+                continue
+            resultados[item["archivo"]] = item
+            checkpoint.escribir(item)
+            if n % 50 == 0 or n == total:
+                print(f"[revalidar] {n}/{total}", flush=True)
+    if circuito is not None:
+        log.warning("corrida detenida: %s", circuito,
+                    extra={"procesadas": len(resultados), "faltantes": total - len(resultados)})
+    return resultados
+
+# -------------------------------
+# Montos registrados en el Sheet
+# -------------------------------
+def montos_desde_sheet() -> Dict[str, float]:
+    """
+    Devuelve {nombre_archivo: monto} leyendo la columna del ticket (URL
+    .../catalogo_img/<archivo>) y la columna de monto del Sheet.
+    """
+    from sheets_utils import open_worksheet, parse_money
+
+    rows = open_worksheet().get_all_values() or []
+    if not rows:
+        return {}
+    headers = [h.strip().lower() for h in rows[0]]
+
+    def _idx(posibles):
+        for p in posibles:
+            if p in headers:
+                return headers.index(p)
+        return None
+
+    idx_archivo = _idx(("ticket", "archivo", "nombre_archivo"))
+    idx_monto   = _idx(("cantidad detectada", "monto", "total", "importe"))
+    if idx_archivo is None or idx_monto is None:
+        print("[montos_desde_sheet] No se encontraron columnas de ticket/monto", flush=True)
+        return {}
+
+    out: Dict[str, float] = {}
+    for row in rows[1:]:
+        if idx_archivo < len(row) and idx_monto < len(row):
+            archivo = (row[idx_archivo] or "").strip().rstrip("/").rsplit("/", 1)[-1]
+            if archivo:
+                out[archivo] = parse_money(row[idx_monto])
+    return out
+
+def escribir_diff(ruta: str, resultados: Dict[str, Dict[str, Any]], montos: Dict[str, float],
+                  tolerancia: float = 0.01) -> int:
+    """Escribe CSV con las diferencias; devuelve cuántas filas difieren."""
+    difieren = 0
+    with open(ruta, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["archivo", "monto_sheet", "monto_ocr", "diferencia", "estado"])
+        for archivo in sorted(set(resultados) | set(montos)):
+            res = resultados.get(archivo)
+            ocr = res.get("total") if res else None
+            sheet = montos.get(archivo)
+            if res is None:
+                estado = "sin_imagen"
+            elif sheet is None:
+                estado = "sin_registro"
+            elif ocr is None:
+                estado = "sin_total_ocr"
+            elif abs(float(ocr) - sheet) <= tolerancia:
+                estado = "igual"
+            else:
+                estado = "difiere"
+            diff = round(float(ocr) - sheet, 2) if (ocr is not None and sheet is not None) else ""
+            if estado != "igual":
+                difieren += 1
+            w.writerow([archivo, "" if sheet is None else sheet, "" if ocr is None else ocr, diff, estado])
+    return difieren
+
+def resultado_desde_ai_json(nombre_archivo: str) -> Dict[str, Any]:
+    with open(tv.ruta_ai_json(nombre_archivo), encoding="utf-8") as f:
+        data = json.load(f)
+    return {
+        "archivo": nombre_archivo,
+        "ok": data.get("total") is not None,
+        "total": data.get("total"),
+        "confidence_score": data.get("confidence_score"),
+        "products": data.get("products") or [],
+        "error": "",
+    }
+
+def _sheet_y_redis():
+    """(worksheet, redis) para escribir en tickets ya replicados; (None, None) si no hay."""
+    try:
+        import redis_pool
+        from sheets_utils import open_worksheet
+        return open_worksheet(), redis_pool.cliente("fondo")
+    except Exception as e:
+        log.error("sin Sheet/Redis; sólo se actualizan tickets no replicados: %s", e)
+        return None, None
+
+# -------------------------------
+# CLI
+# -------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Re-validación masiva de tickets con OpenAI Vision")
+    ap.add_argument("--out", default="revalidacion", help="Carpeta de salida (checkpoint y resultados)")
+    ap.add_argument("--workers", type=int, default=int(os.getenv("REVALIDAR_WORKERS", "4")))
+    ap.add_argument("--resume", action="store_true", help="Retoma desde el checkpoint existente")
+    ap.add_argument("--force", action="store_true", help="Reprocesa aunque el .ai.json esté vigente")
+    ap.add_argument("--limit", type=int, default=0, help="Procesa como máximo N imágenes")
+    ap.add_argument("--base-url", default=None, help="Endpoint compatible con OpenAI (stand-in local)")
+    ap.add_argument("--no-sheet", action="store_true", help="No lee el Sheet (omite el diff)")
+    ap.add_argument("--dry-run", action="store_true", help="Solo lista lo que se procesaría")
+    args = ap.parse_args(argv)
+    logs.configurar()
+
+    if not tv.API_KEY and not (args.base_url or tv.BASE_URL):
+        print("Falta OPENAI_API_KEY", flush=True)
+        return 2
+
+    os.makedirs(args.out, exist_ok=True)
+    ruta_ckpt = os.path.join(args.out, "checkpoint.jsonl")
+    if not args.resume and os.path.exists(ruta_ckpt):
+        os.remove(ruta_ckpt)
+    # Lo que terminó con error en la corrida anterior se vuelve a intentar
+    previos = {nombre: it for nombre, it in cargar_checkpoint(ruta_ckpt).items()
+               if not it.get("error")} if args.resume else {}
+
+    imagenes = listar_imagenes()
+    resultados: Dict[str, Dict[str, Any]] = dict(previos)
+    pendientes: Dict[str, str] = {}
+    vigentes = 0
+
+    # Lo que encoló el modo degradado va primero (y --limit no lo deja fuera)
+    cola = [] if args.dry_run else tomar_cola_ocr()
+    sin_imagen = [it for it in cola if it["archivo"] not in imagenes]
+    for it in sin_imagen:
+        log.warning("imagen de la cola de OCR no encontrada; se descarta", extra={"archivo": it["archivo"]})
+    for it in cola:
+        nombre = it["archivo"]
+        if nombre in imagenes and nombre not in previos and nombre not in pendientes:
+            if not args.force and ai_json_vigente(nombre, imagenes[nombre]):
+                resultados[nombre] = resultado_desde_ai_json(nombre)
+                vigentes += 1
+            else:
+                pendientes[nombre] = imagenes[nombre]
+    n_cola = len(pendientes)
+
+    for nombre, ruta in sorted(imagenes.items()):
+        if nombre in resultados or nombre in pendientes:
+            continue
+        if nombre in previos:
+            continue
+        if not args.force and ai_json_vigente(nombre, ruta):
+            resultados[nombre] = resultado_desde_ai_json(nombre)
+            vigentes += 1
+            continue
+        pendientes[nombre] = ruta
+    if args.limit > 0:
+        pendientes = dict(list(pendientes.items())[:max(args.limit, n_cola)])
+
+    print(f"[revalidar] imágenes={len(imagenes)} vigentes={vigentes} checkpoint={len(previos)} "
+          f"cola_ocr={n_cola} a_procesar={len(pendientes)}", flush=True)
+    if args.dry_run:
+        return 0
+
+    ckpt = Checkpoint(ruta_ckpt)
+    nuevos: Dict[str, Dict[str, Any]] = {}
+    cola = [it for it in cola if it["archivo"] in imagenes]
+    sin_aplicar: List[Dict[str, Any]] = []
+    try:
+        nuevos = revalidar(pendientes, ckpt, workers=args.workers, base_url=args.base_url)
+        resultados.update(nuevos)
+        resueltos = [it for it in cola if it["archivo"] in resultados and not resultados[it["archivo"]].get("error")]
+        if resueltos:
+            ws, redis_conn = (None, None) if args.no_sheet else _sheet_y_redis()
+            sin_aplicar = aplicar_ocr_a_tickets(resueltos, resultados, ws, redis_conn)
+    finally:
+        ckpt.close()
+        # Sale de la cola lo que ya tiene resultado sin error y quedó escrito en su ticket
+        devolver_cola_ocr([it for it in cola if it["archivo"] not in resultados
+                           or resultados[it["archivo"]].get("error")] + sin_aplicar)
+
+    with open(os.path.join(args.out, "resultados.json"), "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+    if not args.no_sheet:
+        try:
+            montos = montos_desde_sheet()
+            n = escribir_diff(os.path.join(args.out, "diff_sheet.csv"), resultados, montos)
+            print(f"[revalidar] diff: {n} filas con diferencias", flush=True)
+        except Exception as e:
+            print(f"[revalidar] No se pudo generar el diff contra el Sheet: {e}", flush=True)
+
+    errores = sum(1 for it in resultados.values() if it.get("error"))
+    print(f"[revalidar] listo: {len(resultados)} resultados, {errores} errores", flush=True)
+    for tier, m in tv.metricas_ocr().items():
+        print(f"[revalidar] tier={tier} model={m['model']} llamadas={m['llamadas']} "
+              f"escalados={m['escalados']} lat_prom={m['latencia_prom_s']}s costo=${m['costo_usd']}", flush=True)
+    faltantes = len(pendientes) - len(nuevos)
+    if faltantes:
+        print(f"[revalidar] circuito de OpenAI abierto: {faltantes} imágenes sin procesar; "
+              f"retoma con --resume", flush=True)
+        return 3
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
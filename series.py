@@ -0,0 +1,87 @@
+# series.py
+"""
+Series de tiempo del bot en Redis (registros, OCR válidos, monto, premios).
+
+Cada evento suma en las tres resoluciones a la vez (minuto, hora y día), así
+que las vistas por hora/día ya están agregadas y nunca se recorre el Sheet:
+
+  ts:<res>:<inicio_cubeta>  HASH  metrica -> valor   (expira según RESOLUCIONES)
+
+Las cubetas de minuto viven poco (detalle fino de las últimas horas); las de
+hora y día guardan el histórico de la campaña.
+"""
+import os, time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+METRICAS = ("tickets", "ocr_validos", "monto", "premios")
+
+# res -> (segundos por cubeta, retención en segundos)
+RESOLUCIONES = {
+    "min":  (60,    int(os.getenv("TS_RETENCION_MIN_S",  str(2 * 86400)))),
+    "hora": (3600,  int(os.getenv("TS_RETENCION_HORA_S", str(35 * 86400)))),
+    "dia":  (86400, int(os.getenv("TS_RETENCION_DIA_S",  str(400 * 86400)))),
+}
+
+
+def _inicio(ts: float, res: str) -> int:
+    paso = RESOLUCIONES[res][0]
+    if res == "dia":  # medianoche local, no UTC
+        d = datetime.fromtimestamp(ts)
+        return int(datetime(d.year, d.month, d.day).timestamp())
+    return int(ts - ts % paso)
+
+
+def _key(res: str, inicio: int) -> str:
+    return f"ts:{res}:{inicio}"
+
+
+def registrar(redis_conn, ts: Optional[float] = None, pipe=None, **valores):
+    """registrar(r, tickets=1, monto=850.0) -> suma en las cubetas de cada resolución."""
+    valores = {k: v for k, v in valores.items() if k in METRICAS and v}
+    if not valores:
+        return
+    ts = ts if ts is not None else time.time()
+    p = pipe if pipe is not None else redis_conn.pipeline(transaction=False)
+    for res, (paso, retencion) in RESOLUCIONES.items():
+        key = _key(res, _inicio(ts, res))
+        for metrica, v in valores.items():
+            if isinstance(v, float):
+                p.hincrbyfloat(key, metrica, v)
+            else:
+                p.hincrby(key, metrica, int(v))
+        p.expire(key, paso + retencion)
+    if pipe is None:
+        p.execute()
+
+
+def _inicios(res: str, n: int, hasta: float) -> List[int]:
+    """Inicio de las últimas n cubetas (la más vieja primero)."""
+    ultimo = _inicio(hasta, res)
+    if res == "dia":
+        d = datetime.fromtimestamp(ultimo)
+        return [int((d - timedelta(days=i)).timestamp()) for i in range(n - 1, -1, -1)]
+    paso = RESOLUCIONES[res][0]
+    return [ultimo - i * paso for i in range(n - 1, -1, -1)]
+
+
+def serie(redis_conn, res: str = "hora", n: int = 24, hasta: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Últimas n cubetas de la resolución pedida, con ceros donde no hubo eventos:
+    [{"t": epoch_inicio, "tickets": 3, "ocr_validos": 2, "monto": 2540.5, "premios": 1}, ...]
+    """
+    paso, retencion = RESOLUCIONES[res]
+    n = max(1, min(n, retencion // paso))
+    inicios = _inicios(res, n, hasta if hasta is not None else time.time())
+
+    p = redis_conn.pipeline(transaction=False)
+    for inicio in inicios:
+        p.hgetall(_key(res, inicio))
+    puntos = []
+    for inicio, cubeta in zip(inicios, p.execute()):
+        punto = {"t": inicio}
+        for m in METRICAS:
+            v = float(cubeta.get(m) or 0)
+            punto[m] = round(v, 2) if m == "monto" else int(v)
+        puntos.append(punto)
+    return puntos
@@ -0,0 +1,147 @@
+# sesiones.py
+"""
+Sesiones de conversación en Redis, compactas y con escrituras por campo.
+
+Claves:
+  sesion:<telefono>          HASH  paso, r:<campo> -> respuesta
+  sesion:<telefono>:tickets  LIST  historial de tickets (JSON, más reciente primero,
+                                   recortado a SESION_MAX_TICKETS)
+
+Antes la sesión completa (con todo el historial de tickets) era un JSON en
+chatbot:<telefono> que se reescribía en cada paso. Ahora cada paso sólo
+escribe los campos que cambian, y todas las operaciones de un mensaje van
+en un solo pipeline (pasar `pipe`). Las sesiones viejas se migran al leerlas.
+"""
+import os, json
+from typing import Dict, Any, List, Optional
+
+SESION_TTL_S       = int(os.getenv("SESION_TTL_S", "86400"))
+SESION_MAX_TICKETS = int(os.getenv("SESION_MAX_TICKETS", "20"))
+LEGADO_PREFIX = "chatbot:"
+
+
+def _key(telefono: str) -> str:
+    return f"sesion:{telefono}"
+
+def _tickets_key(telefono: str) -> str:
+    return f"sesion:{telefono}:tickets"
+
+
+def _campos(paso: Optional[int], respuestas: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    campos = {f"r:{k}": "" if v is None else str(v) for k, v in (respuestas or {}).items()}
+    if paso is not None:
+        campos["paso"] = str(paso)
+    return campos
+
+
+def cargar(redis_conn, telefono: str, con_tickets: bool = False) -> Optional[Dict[str, Any]]:
+    """{"paso", "respuestas"[, "tickets"]} o None si no hay sesión. Un round trip."""
+    p = redis_conn.pipeline(transaction=False)
+    p.hgetall(_key(telefono))
+    if con_tickets:
+        p.lrange(_tickets_key(telefono), 0, -1)
+    res = p.execute()
+    h = res[0]
+    if not h:
+        return _migrar_legado(redis_conn, telefono, con_tickets)
+
+    sesion = {
+        "paso": int(h.get("paso") or 0),
+        "respuestas": {k[2:]: v for k, v in h.items() if k.startswith("r:")},
+    }
+    if con_tickets:
+        sesion["tickets"] = [json.loads(t) for t in res[1]]
+    return sesion
+
+
+def guardar(redis_conn, telefono: str, paso: Optional[int] = None,
+            respuestas: Optional[Dict[str, Any]] = None, pipe=None):
+    """Escribe SÓLO los campos dados (paso y/o respuestas) y renueva el TTL."""
+    campos = _campos(paso, respuestas)
+    p = pipe if pipe is not None else redis_conn.pipeline(transaction=False)
+    if campos:
+        p.hset(_key(telefono), mapping=campos)
+    p.expire(_key(telefono), SESION_TTL_S)
+    if pipe is None:
+        p.execute()
+
+
+def reemplazar(redis_conn, telefono: str, paso: int = 0,
+               respuestas: Optional[Dict[str, Any]] = None, pipe=None):
+    """Reinicia la sesión (paso + respuestas) sin tocar el historial de tickets."""
+    p = pipe if pipe is not None else redis_conn.pipeline(transaction=False)
+    p.delete(_key(telefono))
+    p.hset(_key(telefono), mapping=_campos(paso, respuestas))
+    p.expire(_key(telefono), SESION_TTL_S)
+    if pipe is None:
+        p.execute()
+
+
+def agregar_ticket(redis_conn, telefono: str, ticket: Dict[str, Any], pipe=None):
+    p = pipe if pipe is not None else redis_conn.pipeline(transaction=False)
+    p.lpush(_tickets_key(telefono), json.dumps(ticket, ensure_ascii=False))
+    p.ltrim(_tickets_key(telefono), 0, SESION_MAX_TICKETS - 1)
+    p.expire(_tickets_key(telefono), SESION_TTL_S)
+    if pipe is None:
+        p.execute()
+
+
+def tickets(redis_conn, telefono: str) -> List[Dict[str, Any]]:
+    return [json.loads(t) for t in redis_conn.lrange(_tickets_key(telefono), 0, -1)]
+
+
+def eliminar(redis_conn, telefono: str, pipe=None):
+    p = pipe if pipe is not None else redis_conn.pipeline(transaction=False)
+    p.delete(_key(telefono), _tickets_key(telefono), LEGADO_PREFIX + telefono)
+    if pipe is None:
+        p.execute()
+
+
+def _migrar_legado(redis_conn, telefono: str, con_tickets: bool) -> Optional[Dict[str, Any]]:
+    raw = redis_conn.get(LEGADO_PREFIX + telefono)
+    if not raw:
+        return None
+    datos = json.loads(raw)
+    historial = datos.get("tickets") or []
+    p = redis_conn.pipeline(transaction=True)
+    reemplazar(redis_conn, telefono, datos.get("paso", 0), datos.get("respuestas"), pipe=p)
+    for t in historial[-SESION_MAX_TICKETS:]:
+        agregar_ticket(redis_conn, telefono, t, pipe=p)
+    p.delete(LEGADO_PREFIX + telefono)
+    p.execute()
+    return cargar(redis_conn, telefono, con_tickets)
+
+
+def _claves(telefono: str):
+    return (_key(telefono), _tickets_key(telefono), LEGADO_PREFIX + telefono)
+
+
+def memoria(redis_conn, telefono: str) -> Dict[str, int]:
+    """Bytes que ocupa la sesión en Redis (MEMORY USAGE de cada clave)."""
+    p = redis_conn.pipeline(transaction=False)
+    for k in _claves(telefono):
+        p.memory_usage(k)
+    sesion, historial, legado = (int(x or 0) for x in p.execute())
+    return {"sesion": sesion, "tickets": historial, "legado": legado,
+            "total": sesion + historial + legado}
+
+
+def memoria_muestra(redis_conn, n: int = 200) -> Dict[str, Any]:
+    """Promedio de bytes por sesión sobre una muestra de hasta n sesiones (SCAN)."""
+    telefonos = []
+    for k in redis_conn.scan_iter(match="sesion:*", count=1000):
+        if k.count(":") == 1:
+            telefonos.append(k.split(":", 1)[1])
+            if len(telefonos) >= n:
+                break
+    if not telefonos:
+        return {"muestra": 0, "promedio_bytes": 0, "max_bytes": 0}
+
+    p = redis_conn.pipeline(transaction=False)
+    for t in telefonos:
+        for k in _claves(t):
+            p.memory_usage(k)
+    usos = [int(x or 0) for x in p.execute()]
+    totales = [sum(usos[i:i + 3]) for i in range(0, len(usos), 3)]
+    return {"muestra": len(totales), "promedio_bytes": sum(totales) // len(totales),
+            "max_bytes": max(totales)}
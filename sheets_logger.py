@@ -1,16 +1,20 @@
 # sheets_logger.py
 import os
+import re
 import json
-import logging
 import datetime as dt
-import gspread
+from circuit_breaker import obtener as obtener_circuito, Protegido
+import logs
 
-logging.basicConfig(level=logging.INFO)
+log = logs.obtener("sheets")
 
 # ---------- Config de credenciales ----------
 # Usa GOOGLE_APPLICATION_CREDENTIALS (ruta al JSON del service account).
 # Si no está, intenta "credentials/SHEETS_KEY.json".
 SA_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "credentials/SHEETS_KEY.json")
+SHEETS_TIMEOUT_S = float(os.getenv("GOOGLE_SHEETS_TIMEOUT", "20"))
+
+CB_SHEETS = obtener_circuito("sheets")
 
 # Lee múltiples Sheet IDs:
 # Opción A: GOOGLE_SHEETS_IDS="id1,id2,id3"
@@ -37,42 +41,42 @@ def _resolve_sheet_ids():
     return out
 
 _client = None
-_worksheets = None
+_worksheets = {}  # sid -> worksheet; sólo se guardan las hojas que sí abrieron
 
 def _get_client():
     global _client
     if _client is None:
+        import gspread  # import diferido: no se paga al arrancar el worker
         # gspread usará el JSON del service account
         _client = gspread.service_account(filename=SA_PATH)
+        _client.set_timeout(SHEETS_TIMEOUT_S)
     return _client
 
 def _get_worksheets():
     """
     Abre y cachea sheet1 de todos los IDs configurados.
     Lo hacemos lazy (en tiempo de uso) para evitar fallas al importar.
+    Las hojas que no se pudieron abrir NO se cachean: se reintentan en la
+    siguiente llamada (si el arranque coincide con una caída de Google, el
+    worker no se queda sin hojas para siempre).
     """
-    global _worksheets
-    if _worksheets is not None:
-        return _worksheets
-
     sheet_ids = _resolve_sheet_ids()
     if not sheet_ids:
-        logging.error("No hay Sheet IDs configurados. Revisa tu .env")
-        _worksheets = []
-        return _worksheets
-
-    cli = _get_client()
-    ws_list = []
-    for sid in sheet_ids:
-        try:
-            ws = cli.open_by_key(sid).sheet1
-            ws_list.append((sid, ws))
-            logging.info(f"Conectado a Google Sheet: {sid}")
-        except Exception as e:
-            logging.error(f"No se pudo abrir la hoja {sid}: {e}")
-
-    _worksheets = ws_list
-    return _worksheets
+        log.error("No hay Sheet IDs configurados. Revisa tu .env")
+        return []
+
+    faltantes = [sid for sid in sheet_ids if sid not in _worksheets]
+    if faltantes:
+        cli = _get_client()
+        for sid in faltantes:
+            try:
+                ws = CB_SHEETS.call(lambda: cli.open_by_key(sid).sheet1)
+                _worksheets[sid] = Protegido(ws, CB_SHEETS)
+                log.info("conectado a Google Sheet", extra={"sheet": sid})
+            except Exception as e:
+                log.error("no se pudo abrir la hoja: %s", e, extra={"sheet": sid})
+
+    return [(sid, _worksheets[sid]) for sid in sheet_ids if sid in _worksheets]
 
 def _armar_row(datos_generales: dict, ticket: dict):
     """
@@ -113,23 +117,60 @@ def _armar_row(datos_generales: dict, ticket: dict):
         archivo      # K
     ]
 
-def registrar_ticket_en_sheets(datos_generales: dict, ticket: dict) -> bool:
+def _fila_de_rango(updated_range: str):
+    """'tickets!A57:M57' -> 57"""
+    m = re.search(r"![A-Z]+(\d+)", updated_range or "")
+    return int(m.group(1)) if m else None
+
+def registrar_ticket_con_fila(datos_generales: dict, ticket: dict, escritas: set = None):
     """
-    Anexa la fila en TODOS los Google Sheets configurados.
-    Devuelve True si al menos uno logró escribir.
+    Igual que registrar_ticket_en_sheets, pero devuelve (ok, row_index) donde
+    row_index es la fila escrita en el Sheet principal (GOOGLE_SHEETS_ID), el
+    que usan /tickets-pendientes y /asignar-premio. ok sólo es True si esa fila
+    se escribió y se conoce: sin ella el ticket no es asignable y hay que reintentar.
+
+    `escritas` (opcional) es el conjunto de Sheet IDs que ya tienen la fila de
+    un intento anterior: no se vuelven a escribir (sin duplicados en las hojas
+    secundarias) y se le agregan las que se escriban ahora.
     """
     ws_list = _get_worksheets()
     if not ws_list:
-        logging.error("Sin worksheets disponibles; no se registró el ticket.")
-        return False
+        log.error("sin worksheets disponibles; no se registró el ticket")
+        return False, None
 
+    escritas = escritas if escritas is not None else set()
+    principal = os.getenv("GOOGLE_SHEETS_ID", "").strip() or ws_list[0][0]
     row = _armar_row(datos_generales, ticket)
-    ok = False
+    row_index = None
     for sid, ws in ws_list:
+        if sid in escritas:
+            continue
         try:
-            ws.append_row(row, value_input_option="USER_ENTERED")
-            logging.info(f"Fila agregada en sheet {sid}")
-            ok = True
+            resp = ws.append_row(row, value_input_option="USER_ENTERED")
+            log.info("fila agregada", extra={"sheet": sid, "muestra": 0.2})
         except Exception as e:
-            logging.error(f"Error al escribir en sheet {sid}: {e}")
+            log.error("error al escribir en el sheet: %s", e, extra={"sheet": sid})
+            continue
+        if sid != principal:
+            escritas.add(sid)
+            continue
+        rango = ((resp or {}).get("updates") or {}).get("updatedRange", "")
+        row_index = _fila_de_rango(rango)
+        if row_index is None:
+            # No se sabe qué fila quedó: no es asignable; se reintenta como fallo
+            log.error("respuesta sin fila en el sheet principal", extra={"sheet": sid, "rango": rango})
+        else:
+            escritas.add(sid)
+    return row_index is not None, row_index
+
+def precargar() -> int:
+    """Autentica y abre todas las hojas de una vez (warm-up del worker)."""
+    return len(_get_worksheets())
+
+def registrar_ticket_en_sheets(datos_generales: dict, ticket: dict) -> bool:
+    """
+    Anexa la fila en TODOS los Google Sheets configurados.
+    Devuelve True si se escribió en el Sheet principal.
+    """
+    ok, _ = registrar_ticket_con_fila(datos_generales, ticket)
     return ok
@@ -1,30 +1,73 @@
 # sheets_utils.py
-import os, re
-import gspread
-from google.oauth2.service_account import Credentials
+import os, re, time, threading
+from circuit_breaker import obtener as obtener_circuito, Protegido
 
 SHEETS_ID  = os.getenv("GOOGLE_SHEETS_ID")
 CRED_PATH  = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 SHEETS_TAB = os.getenv("GOOGLE_SHEETS_TAB", "tickets")
+SHEETS_TIMEOUT_S = float(os.getenv("GOOGLE_SHEETS_TIMEOUT", "20"))
+WS_CACHE_TTL_S   = int(os.getenv("GOOGLE_SHEETS_WS_TTL", "600"))       # reusar auth/worksheet abierto
+HEADERS_TTL_S    = int(os.getenv("GOOGLE_SHEETS_HEADERS_TTL", "300"))  # mapa de encabezados
+
+CB_SHEETS = obtener_circuito("sheets")
 
 SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive",
 ]
 
-def open_worksheet():
-    if not CRED_PATH:
-        raise ValueError("Falta GOOGLE_SHEETS_CREDENTIALS")
-    if not SHEETS_ID:
-        raise ValueError("Falta GOOGLE_SHEETS_ID")
+def _open_worksheet():
+    # gspread/google-auth pesan ~0.2 s al importar: sólo cuando de verdad se abre el Sheet
+    import gspread
+    from google.oauth2.service_account import Credentials
     creds  = Credentials.from_service_account_file(CRED_PATH, scopes=SCOPES)
     client = gspread.authorize(creds)
+    client.set_timeout(SHEETS_TIMEOUT_S)
     sh     = client.open_by_key(SHEETS_ID)
     try:
         return sh.worksheet(SHEETS_TAB)
     except gspread.WorksheetNotFound:
         return sh.sheet1
 
+_cache_lock = threading.Lock()
+_ws_cache = {"ws": None, "ts": 0.0}
+_headers_cache = {"map": None, "ts": 0.0}
+
+def open_worksheet():
+    """
+    Abre la pestaña configurada (cacheada WS_CACHE_TTL_S para no re-autenticar
+    en cada request). Todas las llamadas (apertura y métodos del worksheet)
+    pasan por el circuito "sheets": si Google está caído se falla rápido con
+    CircuitoAbierto en lugar de esperar el timeout.
+    """
+    if not CRED_PATH:
+        raise ValueError("Falta GOOGLE_SHEETS_CREDENTIALS")
+    if not SHEETS_ID:
+        raise ValueError("Falta GOOGLE_SHEETS_ID")
+    with _cache_lock:
+        if _ws_cache["ws"] is not None and time.time() - _ws_cache["ts"] < WS_CACHE_TTL_S:
+            return _ws_cache["ws"]
+    ws = Protegido(CB_SHEETS.call(_open_worksheet), CB_SHEETS)
+    with _cache_lock:
+        _ws_cache.update(ws=ws, ts=time.time())
+    return ws
+
+def header_map(ws, force: bool = False) -> dict:
+    """
+    {encabezado_normalizado: índice_0} de la fila 1, cacheado HEADERS_TTL_S.
+    Sólo lee la fila de encabezados, no la hoja completa.
+    """
+    with _cache_lock:
+        if not force and _headers_cache["map"] is not None and time.time() - _headers_cache["ts"] < HEADERS_TTL_S:
+            return _headers_cache["map"]
+    headers = ws.row_values(1) or []
+    m = {}
+    for i, h in enumerate(headers):
+        m.setdefault(h.strip().lower(), i)
+    with _cache_lock:
+        _headers_cache.update(map=m, ts=time.time())
+    return m
+
 def parse_money(x) -> float:
     if x is None:
         return 0.0
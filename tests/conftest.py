@@ -0,0 +1,39 @@
+# tests/conftest.py
+"""
+Pruebas:  pip install pytest fakeredis  &&  python -m pytest -q
+
+Nada toca servicios reales: SQLite y carpetas van a tmp_path, Redis es
+fakeredis y OpenAI / Google Sheets se reemplazan por stand-ins locales.
+"""
+import os, sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """ticket_store apuntando a una base SQLite nueva."""
+    import ticket_store
+    monkeypatch.setattr(ticket_store, "DB_PATH", str(tmp_path / "tickets.sqlite3"))
+    monkeypatch.setattr(ticket_store, "_schema_listo", False)
+    return ticket_store
+
+
+@pytest.fixture(scope="session")
+def redis_falso():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture(scope="session")
+def app_mod(redis_falso):
+    """app.py importado con los tres pools de redis_pool sobre fakeredis."""
+    import redis_pool
+    for nombre in ("hot", "fondo", "pubsub"):
+        redis_pool._clientes[nombre] = redis_falso
+    import app
+    return app
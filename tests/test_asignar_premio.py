@@ -0,0 +1,145 @@
+# tests/test_asignar_premio.py
+"""/asignar-premio y /asignar-premios: candado por fila antes de leer, compare-and-set y liberación."""
+import pytest
+
+ENCABEZADOS = ["Timestamp", "Telefono", "Nombre", "Tienda", "Monto", "Premio", "Cantidad detectada"]
+COL_PREMIO = ENCABEZADOS.index("Premio")
+
+
+class HojaFalsa:
+    """Worksheet mínimo; `al_leer(fila)` corre en cada lectura de filas."""
+
+    def __init__(self, filas, al_leer=None):
+        self.filas = [list(ENCABEZADOS)] + [list(f) for f in filas]
+        self.al_leer = al_leer or (lambda fila: None)
+        self.escrituras = []
+        self.falla_escritura = False
+
+    def row_values(self, i):
+        if i > 1:
+            self.al_leer(i)
+        return list(self.filas[i - 1]) if i <= len(self.filas) else []
+
+    def batch_get(self, rangos):
+        out = []
+        for rango in rangos:
+            i = int(rango.split(":")[0])
+            self.al_leer(i)
+            out.append([list(self.filas[i - 1])] if i <= len(self.filas) else [])
+        return out
+
+    def batch_update(self, cambios, value_input_option=None):
+        if self.falla_escritura:
+            raise IOError("Sheets caído")
+        self.escrituras.append(cambios)
+        for cambio in cambios:
+            if cambio["range"].startswith("F"):
+                self.filas[int(cambio["range"][1:]) - 1][COL_PREMIO] = cambio["values"][0][0]
+
+
+def _fila(telefono, premio="Pendiente de validación"):
+    return ["2025-11-14 10:00:00", telefono, "Ana", "Plaza Centro", "1250", premio, ""]
+
+
+@pytest.fixture
+def entorno(app_mod, store, redis_falso, monkeypatch):
+    import sheets_utils
+    redis_falso.flushall()
+    enviados, repartos = [], []
+
+    def premio_especial(r, monto):
+        repartos.append(monto)
+        return "Termo", "especial"
+
+    monkeypatch.setattr(app_mod, "header_map", lambda ws, force=False: sheets_utils.header_map(ws, force=True))
+    monkeypatch.setattr(app_mod, "wsend", lambda to, text: enviados.append(to))
+    monkeypatch.setattr(app_mod, "obtener_premio_especial", premio_especial)
+    monkeypatch.setattr(app_mod, "obtener_premios_especiales", lambda r, montos: [premio_especial(r, m)[0] for m in montos])
+    monkeypatch.setattr(app_mod.notificaciones, "iniciar_worker", lambda *a, **k: None)
+    monkeypatch.setattr(app_mod, "iniciar_replicador", lambda: None)  # sin hilos de fondo en las pruebas
+
+    def usar_hoja(hoja):
+        monkeypatch.setattr(app_mod, "open_worksheet", lambda: hoja)
+        return hoja
+
+    return {"cliente": app_mod.app.test_client(), "r": redis_falso, "usar_hoja": usar_hoja,
+            "enviados": enviados, "repartos": repartos}
+
+
+def _asignar(entorno, row_index=2, telefono="5215550000001"):
+    return entorno["cliente"].post("/asignar-premio", json={
+        "row_index": row_index, "telefono": telefono, "cantidad_detectada": 1250})
+
+
+def test_asigna_leyendo_la_fila_con_el_candado_tomado(entorno):
+    r = entorno["r"]
+    leida_con_candado = []
+    hoja = entorno["usar_hoja"](HojaFalsa([_fila("5215550000001")],
+                                          al_leer=lambda i: leida_con_candado.append(r.exists(f"asignando:{i}"))))
+
+    resp = _asignar(entorno)
+    assert resp.status_code == 200 and resp.get_json()["premio"] == "Termo"
+    assert leida_con_candado == [1]
+    assert hoja.filas[1][COL_PREMIO] == "Termo" and len(hoja.escrituras) == 1
+    assert entorno["enviados"] == ["5215550000001"]
+    assert not r.exists("asignando:2")
+
+
+def test_segunda_asignacion_ve_la_fila_ya_resuelta(entorno):
+    entorno["usar_hoja"](HojaFalsa([_fila("5215550000001")]))
+    assert _asignar(entorno).status_code == 200
+    resp = _asignar(entorno)
+    assert resp.status_code == 400 and "no está pendiente" in resp.get_json()["error"]
+    assert len(entorno["repartos"]) == 1  # un solo decremento de inventario
+    assert entorno["enviados"] == ["5215550000001"]
+
+
+def test_candado_ajeno_no_lee_ni_reparte(entorno):
+    leidas = []
+    entorno["usar_hoja"](HojaFalsa([_fila("5215550000001")], al_leer=leidas.append))
+    entorno["r"].set("asignando:2", "otro revisor", ex=30)
+
+    resp = _asignar(entorno)
+    assert resp.status_code == 409
+    assert leidas == [] and entorno["repartos"] == []
+    assert entorno["r"].get("asignando:2") == "otro revisor"
+
+
+def test_fila_de_otro_telefono_es_conflicto_y_libera_candado(entorno):
+    entorno["usar_hoja"](HojaFalsa([_fila("5215559999999")]))
+    resp = _asignar(entorno)
+    assert resp.status_code == 409 and entorno["repartos"] == []
+    assert not entorno["r"].exists("asignando:2")
+
+
+def test_error_al_escribir_devuelve_inventario_y_libera_candado(entorno):
+    hoja = entorno["usar_hoja"](HojaFalsa([_fila("5215550000001")]))
+    hoja.falla_escritura = True
+    resp = _asignar(entorno)
+    assert resp.status_code == 500
+    assert entorno["r"].get("premio:Termo") == "1"  # la unidad regresó
+    assert not entorno["r"].exists("asignando:2")
+    assert entorno["enviados"] == []
+
+
+def test_lote_bloquea_antes_de_leer_y_omite_filas_ajenas(entorno):
+    r = entorno["r"]
+    leida_con_candado = {}
+    hoja = entorno["usar_hoja"](HojaFalsa(
+        [_fila("5215550000001"), _fila("5215550000002"), _fila("5215550000003", premio="Termo")],
+        al_leer=lambda i: leida_con_candado.setdefault(i, r.exists(f"asignando:{i}"))))
+    r.set("asignando:3", "otro revisor", ex=60)
+
+    resp = entorno["cliente"].post("/asignar-premios", json={"items": [
+        {"row_index": 2, "telefono": "5215550000001", "cantidad_detectada": 1250},
+        {"row_index": 3, "telefono": "5215550000002", "cantidad_detectada": 1250},
+        {"row_index": 4, "telefono": "5215550000003", "cantidad_detectada": 1250},
+    ]})
+    items = {x["row_index"]: x for x in resp.get_json()["items"]}
+    assert items[2]["status"] == "ok"
+    assert "Otra persona" in items[3]["error"]
+    assert "no está pendiente" in items[4]["error"]
+    assert leida_con_candado == {2: 1, 4: 1}  # la fila 3 (candado ajeno) ni se leyó
+    assert len(hoja.escrituras) == 1 and len(entorno["repartos"]) == 1
+    assert not r.exists("asignando:2") and not r.exists("asignando:4")
+    assert r.get("asignando:3") == "otro revisor"
@@ -0,0 +1,89 @@
+# tests/test_circuit_breaker.py
+"""Circuito por dependencia: qué errores lo abren, falla rápida y prueba semi-abierta."""
+import time
+
+import pytest
+
+from circuit_breaker import CircuitBreaker, CircuitoAbierto, Protegido, es_falla_de_dependencia
+
+
+class ErrorHTTP(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+
+
+def _falla(e):
+    def fn():
+        raise e
+    return fn
+
+
+def test_solo_fallas_de_la_dependencia_cuentan():
+    assert es_falla_de_dependencia(ErrorHTTP(503))
+    assert es_falla_de_dependencia(ErrorHTTP(429))
+    assert es_falla_de_dependencia(TimeoutError())
+    assert not es_falla_de_dependencia(ErrorHTTP(400))
+    assert not es_falla_de_dependencia(ValueError("json mal formado"))
+
+    cb = CircuitBreaker("prueba", fallos_max=2, reset_s=60)
+    for _ in range(5):
+        with pytest.raises(ErrorHTTP):
+            cb.call(_falla(ErrorHTTP(413)))
+    assert cb.estado()["estado"] == "cerrado"
+    assert cb.estado()["errores_peticion"] == 5
+
+
+def test_abre_tras_fallos_seguidos_y_rechaza_sin_llamar():
+    cb = CircuitBreaker("prueba", fallos_max=2, reset_s=60)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            cb.call(_falla(ConnectionError("caído")))
+    assert cb.abierto
+
+    llamadas = []
+    with pytest.raises(CircuitoAbierto) as exc:
+        cb.call(lambda: llamadas.append(1))
+    assert llamadas == []
+    assert exc.value.nombre == "prueba" and exc.value.reintento_en > 0
+    assert cb.estado()["rechazadas"] == 1
+
+
+def test_semi_abierto_deja_una_prueba_y_cierra_si_sale_bien(monkeypatch):
+    cb = CircuitBreaker("prueba", fallos_max=1, reset_s=10)
+    with pytest.raises(ConnectionError):
+        cb.call(_falla(ConnectionError("caído")))
+    monkeypatch.setattr(cb, "_abierto_desde", time.monotonic() - 11)
+    assert cb.estado()["estado"] == "semi_abierto"
+
+    assert cb.call(lambda: "ok") == "ok"
+    assert cb.estado()["estado"] == "cerrado"
+    assert cb.estado()["fallos_seguidos"] == 0
+
+
+def test_semi_abierto_vuelve_a_abrir_si_la_prueba_falla(monkeypatch):
+    cb = CircuitBreaker("prueba", fallos_max=3, reset_s=10)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            cb.call(_falla(ConnectionError("caído")))
+    monkeypatch.setattr(cb, "_abierto_desde", time.monotonic() - 11)
+    with pytest.raises(ConnectionError):
+        cb.call(_falla(ConnectionError("sigue caído")))
+    assert cb.abierto
+    assert cb.estado()["aperturas"] == 2
+
+
+def test_protegido_pasa_los_metodos_por_el_circuito():
+    class Hoja:
+        titulo = "Tickets"
+
+        def row_values(self, n):
+            raise ErrorHTTP(500)
+
+    cb = CircuitBreaker("prueba", fallos_max=1, reset_s=60)
+    hoja = Protegido(Hoja(), cb)
+    assert hoja.titulo == "Tickets"
+    with pytest.raises(ErrorHTTP):
+        hoja.row_values(2)
+    with pytest.raises(CircuitoAbierto):
+        hoja.row_values(2)
@@ -0,0 +1,79 @@
+# tests/test_control_carga.py
+"""Load shedding: token bucket, mensajes viejos y modo saturado con su enfriamiento."""
+import time
+
+import pytest
+
+
+@pytest.fixture
+def carga(redis_falso, monkeypatch):
+    import control_carga
+    redis_falso.flushall()
+    monkeypatch.setattr(control_carga, "_latencia_ewma", 0.0)
+    monkeypatch.setattr(control_carga, "_latencia_ocr_ewma", 0.0)
+    monkeypatch.setattr(control_carga, "_saturado_hasta", 0.0)
+    monkeypatch.setattr(control_carga, "_cola", (0.0, 0))
+    return control_carga
+
+
+def _pasar_enfriamiento(carga, monkeypatch):
+    monkeypatch.setattr(carga, "_saturado_hasta", time.monotonic() - 1)
+
+
+def test_mensajes_viejos_se_descartan_o_degradan(carga, redis_falso):
+    ahora = int(time.time())
+    assert carga.evaluar(redis_falso, "5215550000001", ahora) == "ok"
+    assert carga.evaluar(redis_falso, "5215550000001", ahora - carga.MSG_DEGRADAR_S - 5) == "degradar"
+    assert carga.evaluar(redis_falso, "5215550000001", ahora - carga.MSG_DESCARTAR_S - 5) == "viejo"
+    assert redis_falso.hgetall(carga.CONTADORES_KEY) == {"degradar": "1", "viejo": "1"}
+
+
+def test_token_bucket_por_telefono(carga, redis_falso, monkeypatch):
+    monkeypatch.setattr(carga, "FLOOD_CAPACIDAD", 3.0)
+    monkeypatch.setattr(carga, "FLOOD_TASA", 0.001)
+    decisiones = [carga.evaluar(redis_falso, "5215550000001") for _ in range(4)]
+    assert decisiones == ["ok", "ok", "ok", "limitado"]
+    assert carga.evaluar(redis_falso, "5215550000002") == "ok"  # otro teléfono, otro bucket
+    assert carga.avisar_limite(redis_falso, "5215550000001")
+    assert not carga.avisar_limite(redis_falso, "5215550000001")  # un aviso por ventana
+
+
+def test_un_mensaje_lento_no_deja_el_modo_saturado_pegado(carga, redis_falso, monkeypatch):
+    carga.medir(carga.CARGA_MAX_LATENCIA_S * 2)
+    assert carga.evaluar(redis_falso, "5215550000001") == "ok"  # una muestra pesa alfa, no todo
+
+    for _ in range(20):
+        carga.medir(carga.CARGA_MAX_LATENCIA_S * 2.5)
+    assert carga.evaluar(redis_falso, "5215550000001") == "saturado"
+    assert carga.evaluar(redis_falso, "5215550000002") == "saturado"  # dentro del enfriamiento
+
+    _pasar_enfriamiento(carga, monkeypatch)
+    assert carga.evaluar(redis_falso, "5215550000003") == "ok"
+    assert carga.estado(redis_falso)["latencia_ewma_s"] == 0
+
+
+def test_ocr_se_mide_aparte(carga, redis_falso, monkeypatch):
+    real, relojes = time.monotonic, iter([100.0, 100.0 + carga.CARGA_MAX_LATENCIA_S * 3])
+    monkeypatch.setattr(time, "monotonic", lambda: next(relojes))
+    with carga.tramo_ocr():
+        pass
+    monkeypatch.setattr(time, "monotonic", real)
+    carga.medir(carga.CARGA_MAX_LATENCIA_S * 3 + 0.5)
+    estado = carga.estado(redis_falso)
+    assert estado["latencia_ewma_s"] == pytest.approx(0.5 * 0.2)
+    assert estado["latencia_ocr_ewma_s"] == pytest.approx(carga.CARGA_MAX_LATENCIA_S * 3 * 0.2)
+
+
+def test_cola_de_notificaciones_llena_satura(carga, redis_falso, monkeypatch):
+    monkeypatch.setattr(carga, "CARGA_MAX_COLA", 2)
+    for i in range(3):
+        redis_falso.lpush(carga.notificaciones.COLA_KEY, i)
+    assert carga.evaluar(redis_falso, "5215550000001") == "saturado"
+
+
+def test_sin_redis_falla_abierta(carga):
+    class Caido:
+        def eval(self, *a, **k):
+            raise ConnectionError("sin redis")
+
+    assert carga.evaluar(Caido(), "5215550000001") == "ok"
@@ -0,0 +1,33 @@
+# tests/test_dashboard.py
+"""Endpoints del dashboard sobre el almacén local: inventario con ?sync=1 y top de vendedores."""
+import pytest
+
+
+@pytest.mark.parametrize("ruta", ["/inventario.json?sync=1", "/inventario?sync=1"])
+def test_sync_importa_antes_de_recalcular_el_inventario(app_mod, store, redis_falso, monkeypatch, ruta):
+    orden = []
+    monkeypatch.setattr(app_mod, "AUTO_SYNC_ON_DASHBOARD", True)
+    monkeypatch.setattr(app_mod, "iniciar_replicador", lambda: None)
+    monkeypatch.setattr(app_mod, "importar_sheet", lambda forzar=False: orden.append("importar"))
+    monkeypatch.setattr(app_mod, "auto_sync_from_sheets_if_stale", lambda **k: orden.append("inventario"))
+    redis_falso.flushall()
+
+    assert app_mod.app.test_client().get(ruta).status_code == 200
+    assert orden == ["importar", "inventario"]
+
+
+def test_top_vendedores_acumulado_sale_de_sql(app_mod, store, redis_falso, monkeypatch):
+    import leaderboards
+    monkeypatch.setattr(app_mod, "iniciar_replicador", lambda: None)
+    redis_falso.flushall()
+    for vendedor in ("Luis", "Luis", "Ana"):
+        store.insertar({"telefono": "5215550000001", "tienda": "Plaza Centro", "vendedor": vendedor}, {})
+    leaderboards.registrar(redis_falso, "Plaza Centro", "Ana")  # sólo Redis: hoy/semana
+    redis_falso.set(leaderboards.BUILT_KEY, 1)
+
+    cliente = app_mod.app.test_client()
+    total = cliente.get("/sheets/top-vendedores").get_json()
+    assert total["periodo"] == "total" and total["total_registros"] == 3
+    assert total["items"][0] == {"vendedor": "Luis", "registros": 2}
+    hoy = cliente.get("/sheets/top-vendedores?periodo=hoy").get_json()
+    assert hoy["items"] == [{"vendedor": "Ana", "registros": 1}]
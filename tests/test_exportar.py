@@ -0,0 +1,65 @@
+# tests/test_exportar.py
+"""Exportación en streaming: filtros, datos del OCR y un renglón por producto."""
+import csv, io, json
+from datetime import datetime
+
+import pytest
+
+
+@pytest.fixture
+def exp(store, tmp_path, monkeypatch):
+    import exportar
+    monkeypatch.setattr(exportar, "DIR_PROCESSED", str(tmp_path))
+    (tmp_path / "a.jpg.ai.json").write_text(json.dumps({
+        "total": 1250.0, "confidence_score": 0.92,
+        "products": [{"description": "Cable THW 12", "line_total": 1000.0},
+                     {"description": " Cinta ", "line_total": 250.0}]}), encoding="utf-8")
+
+    store.insertar({"telefono": "5215550000001", "nombre": "Ana", "tienda": "Plaza Centro", "monto": "1,250.00",
+                    "premio": "Amazon $500", "nombre_archivo": "https://bot/catalogo_img/a.jpg"}, {})
+    store.insertar({"telefono": "5215550000002", "nombre": "Beto", "tienda": "Norte", "monto": "300",
+                    "premio": "Pendiente de validación", "nombre_archivo": "b.jpg"}, {})
+    viejo = store.insertar({"telefono": "5215550000003", "nombre": "Caro", "tienda": "Plaza Centro",
+                            "premio": "Amazon $500"}, {})
+    with store._conn() as c:
+        c.execute("UPDATE tickets SET creado = ? WHERE id = ?", (datetime(2025, 11, 1, 12).timestamp(), viejo))
+    return exportar
+
+
+def _csv(lineas):
+    return list(csv.DictReader(io.StringIO("".join(lineas))))
+
+
+def test_csv_con_ocr_y_filtros(exp):
+    filas = _csv(exp.stream("csv", tienda="plaza centro", premio="AMAZON $500"))
+    assert [f["nombre"] for f in filas] == ["Ana", "Caro"]
+    assert filas[0]["ocr_total"] == "1250.0" and filas[0]["ocr_confianza"] == "0.92"
+    assert filas[0]["ocr_productos"] == "Cable THW 12: 1000.0 | Cinta: 250.0"
+    assert filas[1]["ocr_total"] == ""
+
+    hoy = datetime.now().strftime("%Y-%m-%d")
+    assert [f["nombre"] for f in _csv(exp.stream("csv", desde=hoy, hasta=hoy))] == ["Ana", "Beto"]
+    assert [f["nombre"] for f in _csv(exp.stream("csv", hasta="2025-11-01"))] == ["Caro"]
+
+
+def test_csv_por_producto_repite_el_ticket(exp):
+    filas = _csv(exp.stream("csv", por_producto=True, tienda="Plaza Centro"))
+    assert [(f["nombre"], f["producto"], f["importe_linea"]) for f in filas] == [
+        ("Ana", "Cable THW 12", "1000.0"), ("Ana", "Cinta", "250.0"), ("Caro", "", "")]
+
+
+def test_jsonl_lleva_los_productos_como_lista(exp):
+    filas = [json.loads(l) for l in exp.stream("jsonl", tienda="Plaza Centro")]
+    assert len(filas) == 2
+    assert filas[0]["productos"][1] == {"descripcion": "Cinta", "importe": 250.0}
+    assert filas[0]["monto"] == 1250.0
+
+
+def test_iterar_por_lotes_no_pierde_filas(exp, store):
+    assert [t["nombre"] for t in store.iterar(lote=1)] == ["Ana", "Beto", "Caro"]
+
+
+def test_cli_escribe_el_archivo(exp, tmp_path):
+    salida = tmp_path / "tickets.jsonl"
+    assert exp.main(["--formato", "jsonl", "--tienda", "Norte", "-o", str(salida)]) == 0
+    assert [json.loads(l)["nombre"] for l in salida.read_text(encoding="utf-8").splitlines()] == ["Beto"]
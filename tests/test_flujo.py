@@ -0,0 +1,91 @@
+# tests/test_flujo.py
+"""Máquina de estados del registro: preguntas en orden, validadores, foto y segundo ticket."""
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def conversacion(redis_falso, monkeypatch):
+    import flujo
+    redis_falso.flushall()
+    monkeypatch.setattr(flujo.registro_vendedores, "resolver_texto",
+                        lambda r, texto: SimpleNamespace(nombre="Luis") if "VEND01" in texto else None)
+    enviados, registrados = [], []
+    ctx = flujo.Contexto(
+        redis=redis_falso,
+        enviar=lambda tel, texto: enviados.append(texto),
+        enviar_botones=lambda tel, texto, botones: enviados.append(botones),
+        validar=lambda media_id, tel: {"valido": True, "monto": 1500.0, "nombre_archivo": f"{media_id}.jpg"},
+        registrar=lambda datos, ticket: registrados.append((datos, ticket)),
+        url_ticket=lambda nombre: f"https://bot/catalogo_img/{nombre}",
+    )
+
+    def decir(texto=None, **mensaje):
+        mensaje.setdefault("from", "5215550000001")
+        if texto is not None:
+            mensaje.update(type="text", text={"body": texto})
+        return flujo.procesar(ctx, mensaje, modo="abierta")
+
+    return SimpleNamespace(flujo=flujo, decir=decir, enviados=enviados, registrados=registrados)
+
+
+def _boton(titulo):
+    return {"type": "interactive", "interactive": {"type": "button_reply", "button_reply": {"title": titulo}}}
+
+
+def test_registro_completo_con_foto_y_sin_segundo_ticket(conversacion):
+    c = conversacion
+    assert c.decir("Hola QUIERO PARTICIPAR VEND01") == "inicio"
+    for respuesta in ("Ana López", "Ferretería Centro", "LOAA800101XX0", "ana@correo.mx"):
+        c.decir(respuesta)
+    assert c.enviados[-1] == ("Electricista", "Contratista", "Otro")
+    c.decir(**_boton("Contratista"))
+    assert c.decir("3") == "medio ok"
+    assert c.enviados[-1] == c.flujo.MENSAJES["foto"]
+
+    assert c.decir(type="image", image={"id": "m1"}) == "ticket recibido"
+    datos, ticket = c.registrados[0]
+    assert datos["nombre"] == "Ana López" and datos["medio"] == "En tienda" and datos["ocupacion"] == "Contratista"
+    assert datos["vendedor"] == "Luis" and datos["monto"] == 1500.0
+    assert datos["nombre_archivo"] == "https://bot/catalogo_img/m1.jpg"
+    assert ticket["premio"] == "Pendiente de validación"
+
+    assert c.decir("no") == "fin"
+    assert c.decir("hola") == "esperando inicio"
+
+
+def test_respuesta_invalida_repite_el_paso(conversacion):
+    c = conversacion
+    c.decir("QUIERO PARTICIPAR")
+    for respuesta in ("Ana", "Tienda", "RFC"):
+        c.decir(respuesta)
+    assert c.decir("no-es-correo") == "respuesta inválida (correo)"
+    assert c.decir("ana@correo.mx") == "correo ok"
+    c.decir(**_boton("Otro"))
+    assert c.decir("7") == "respuesta inválida (medio)"
+
+
+def test_foto_que_no_es_imagen_y_segundo_ticket(conversacion, redis_falso):
+    c = conversacion
+    c.flujo.sesiones.reemplazar(redis_falso, "5215550000001", c.flujo.FOTO, {"nombre": "Ana"})
+    assert c.decir(type="document", document={"filename": "ticket.pdf"}) == "archivo no válido: document"
+    assert "ticket.pdf" in c.enviados[-1]
+    c.decir(type="image", image={"id": "m1"})
+    assert c.decir("Sí") == "esperando foto 2do ticket"
+    c.decir(type="image", image={"id": "m2"})
+    assert [d["nombre"] for d, _ in c.registrados] == ["Ana", "Ana"]
+    assert len(c.flujo.sesiones.tickets(redis_falso, "5215550000001")) == 2
+
+
+def test_salir_y_campana_cerrada(conversacion, redis_falso):
+    c = conversacion
+    c.decir("QUIERO PARTICIPAR")
+    assert c.decir("salir") == "salir"
+    assert c.decir("Ana") == "sesión terminada"
+
+    enviados = []
+    ctx = c.flujo.Contexto(redis_falso, lambda tel, texto: enviados.append(texto), None, None, None, None)
+    mensaje = {"from": "5215550000001", "type": "text", "text": {"body": "QUIERO PARTICIPAR"}}
+    assert c.flujo.procesar(ctx, mensaje, modo="cerrada") == "mensaje de cierre enviado"
+    assert enviados == [c.flujo.MENSAJES["cierre"]]
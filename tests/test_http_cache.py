@@ -0,0 +1,74 @@
+# tests/test_http_cache.py
+"""GET condicional: 304 sin ejecutar la vista mientras no cambie la versión; compresión."""
+import gzip
+
+import pytest
+from flask import Flask
+
+
+@pytest.fixture
+def cliente(redis_falso):
+    import http_cache
+    redis_falso.flushall()
+    app = Flask(__name__)
+    llamadas = []
+
+    @app.get("/datos")
+    @http_cache.condicional(redis_falso)
+    def datos():
+        llamadas.append(1)
+        return {"filas": ["x" * 40] * 50}
+
+    app.after_request(http_cache.comprimir)
+    c = app.test_client()
+    c.llamadas = llamadas
+    return c
+
+
+def test_revalidacion_sin_cambios_responde_304_sin_ejecutar_la_vista(cliente):
+    r1 = cliente.get("/datos")
+    assert r1.status_code == 200 and r1.headers["ETag"].startswith('W/"')
+    assert "no-cache" in r1.headers["Cache-Control"]
+
+    r2 = cliente.get("/datos", headers={"If-None-Match": r1.headers["ETag"]})
+    assert r2.status_code == 304 and r2.data == b""
+    assert len(cliente.llamadas) == 1
+
+
+def test_bump_invalida_el_etag(cliente, redis_falso):
+    import http_cache
+    etag = cliente.get("/datos").headers["ETag"]
+    http_cache.bump(redis_falso)
+    r = cliente.get("/datos", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["ETag"] != etag
+    assert r.headers.get("Last-Modified")
+    assert len(cliente.llamadas) == 2
+
+
+def test_if_modified_since_usa_el_ultimo_cambio(cliente, redis_falso):
+    import http_cache
+    http_cache.bump(redis_falso)
+    lm = cliente.get("/datos").headers["Last-Modified"]
+    assert cliente.get("/datos", headers={"If-Modified-Since": lm}).status_code == 304
+    assert cliente.get("/datos", headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"}).status_code == 200
+
+
+def test_comprime_con_gzip_si_el_cliente_lo_acepta(cliente):
+    r = cliente.get("/datos", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in r.headers["Vary"]
+    assert b'"filas"' in gzip.decompress(r.data)
+    assert "Content-Encoding" not in cliente.get("/datos").headers
+
+
+def test_sin_redis_sirve_sin_cache(redis_falso):
+    import http_cache
+
+    class Caido:
+        def mget(self, *a):
+            raise ConnectionError("sin redis")
+
+    app = Flask(__name__)
+    app.add_url_rule("/x", "x", http_cache.condicional(Caido())(lambda: "hola"))
+    r = app.test_client().get("/x", headers={"If-None-Match": "*"})
+    assert r.status_code == 200 and "ETag" not in r.headers
@@ -0,0 +1,80 @@
+# tests/test_image_store.py
+"""Almacén por contenido: un objeto por foto, vistas como hardlinks, catálogo y compactación."""
+import os, time
+
+import pytest
+
+
+@pytest.fixture
+def imgs(tmp_path, monkeypatch):
+    import image_store
+    monkeypatch.chdir(tmp_path)  # images_to_process / images_processed son relativas
+    raiz = tmp_path / "image_store"
+    monkeypatch.setattr(image_store, "STORE_DIR", str(raiz))
+    monkeypatch.setattr(image_store, "OBJECTS_DIR", str(raiz / "objects"))
+    monkeypatch.setattr(image_store, "THUMBS_DIR", str(raiz / "thumbs"))
+    monkeypatch.setattr(image_store, "INDEX_PATH", str(raiz / "index.sqlite3"))
+    monkeypatch.setattr(image_store, "_schema_listo", False)
+    return image_store
+
+
+def test_misma_foto_se_guarda_una_vez(imgs):
+    a = imgs.guardar(b"foto-1", "5215550000001", "m1")
+    b = imgs.guardar(b"foto-1", "5215550000002", "m2")
+    again = imgs.guardar(b"foto-1", "5215550000001", "m3")
+
+    assert not a["duplicado"] and b["duplicado"] and again["duplicado"]
+    assert a["nombre_archivo"] == again["nombre_archivo"] != b["nombre_archivo"]
+    assert os.path.samefile(a["ruta"], imgs.ruta_objeto(a["sha256"]))
+    assert os.path.samefile(b["ruta"], imgs.ruta_objeto(a["sha256"]))
+    assert imgs.stats() == {"imagenes": 2, "objetos_unicos": 1, "bytes_objetos": len(b"foto-1")}
+    assert imgs.info(a["nombre_archivo"])["media_id"] == "m3"
+
+
+def test_resolver_sobrevive_al_borrado_de_la_vista(imgs):
+    g = imgs.guardar(b"foto-1", "5215550000001")
+    os.remove(g["ruta"])
+    assert imgs.resolver(g["nombre_archivo"]) == imgs.ruta_objeto(g["sha256"])
+    assert imgs.resolver("no-existe.jpg") is None
+
+
+def test_listar_pagina_y_busca_por_telefono(imgs):
+    for i in range(5):
+        imgs.guardar(f"foto-{i}".encode(), f"52155500000{i % 2}")
+    items, total = imgs.listar(pagina=2, por_pagina=2)
+    assert total == 5 and len(items) == 2
+    items, total = imgs.listar(q="521555000001")
+    assert total == 2 and {i["telefono"] for i in items} == {"521555000001"}
+
+
+def test_migrar_reemplaza_copias_por_hardlinks(imgs):
+    os.makedirs(imgs.DIR_TO_PROCESS)
+    os.makedirs(imgs.DIR_PROCESSED)
+    for carpeta in (imgs.DIR_TO_PROCESS, imgs.DIR_PROCESSED):
+        with open(os.path.join(carpeta, "uuid-viejo_5215550000001.jpg"), "wb") as f:
+            f.write(b"legada")
+
+    assert imgs.migrar()["importadas"] == 1
+    vista = os.path.join(imgs.DIR_TO_PROCESS, "uuid-viejo_5215550000001.jpg")
+    procesada = os.path.join(imgs.DIR_PROCESSED, "uuid-viejo_5215550000001.jpg")
+    assert os.path.samefile(vista, procesada)
+    assert imgs.info("uuid-viejo_5215550000001.jpg")["telefono"] == "5215550000001"
+    assert imgs.migrar() == {"importadas": 0, "ya_vinculadas": 1, "bytes_liberados": 0}
+
+
+def test_compactar_respeta_la_gracia_y_borra_huerfanos(imgs, monkeypatch):
+    vieja = imgs.guardar(b"vieja", "5215550000001")
+    nueva = imgs.guardar(b"nueva", "5215550000002")
+    with imgs._conn() as c:
+        c.execute("UPDATE imagenes SET ts = ? WHERE nombre_archivo = ?",
+                  (int(time.time()) - 10 * 86400, vieja["nombre_archivo"]))
+
+    # Recién escrito: guardar() pudo no haber indexado todavía
+    assert imgs.compactar(retencion_dias=5)["objetos_borrados"] == 0
+    assert os.path.exists(imgs.ruta_objeto(vieja["sha256"]))
+
+    monkeypatch.setattr(imgs, "COMPACTAR_GRACIA_S", -1)
+    assert imgs.compactar()["objetos_borrados"] == 1
+    assert not os.path.exists(imgs.ruta_objeto(vieja["sha256"]))
+    assert not os.path.exists(vieja["ruta"])
+    assert os.path.exists(imgs.ruta_objeto(nueva["sha256"]))
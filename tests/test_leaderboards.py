@@ -0,0 +1,82 @@
+# tests/test_leaderboards.py
+"""Leaderboards en sorted sets: ZINCRBY por ticket, top-N por periodo y reconstrucción por lotes."""
+import time
+
+import pytest
+
+
+@pytest.fixture
+def lb(redis_falso):
+    import leaderboards
+    redis_falso.flushall()
+    return leaderboards
+
+
+def test_registrar_y_top_normaliza_nombres(lb, redis_falso):
+    for tienda in ("Home Depót", "  home   depot ", "Plaza Centro"):
+        lb.registrar(redis_falso, tienda, "Luis")
+    items, distintas, total = lb.top(redis_falso, "tiendas", "total", 8)
+    assert items == [("Home Depót", 2), ("Plaza Centro", 1)]
+    assert (distintas, total) == (2, 3)
+    assert lb.top(redis_falso, "vendedores", "hoy", 8)[0] == [("Luis", 3)]
+
+
+def test_filas_viejas_no_entran_a_cubetas_vencidas(lb, redis_falso):
+    viejo = time.time() - lb.LB_TTL_SEMANA_S - 86400
+    lb.registrar(redis_falso, "Plaza Centro", "", ts=viejo)
+    assert lb.top(redis_falso, "tiendas", "total")[2] == 1
+    assert not list(redis_falso.scan_iter("lb:tiendas:semana:*"))
+
+
+def test_reconstruir_por_lotes_reemplaza_lo_anterior(lb, redis_falso):
+    lb.registrar(redis_falso, "Tienda Borrada", "Nadie")
+    ahora = time.time()
+    filas = [("Plaza Centro", "Luis", ahora), ("Plaza Norte", "Ana", ahora), ("Plaza Centro", "", ahora)]
+    assert lb.reconstruir(redis_falso, iter(filas), lote=2) == 3
+
+    items, distintas, total = lb.top(redis_falso, "tiendas", "total")
+    assert items == [("Plaza Centro", 2), ("Plaza Norte", 1)] and (distintas, total) == (2, 3)
+    assert sorted(lb.top(redis_falso, "vendedores", "hoy")[0]) == [("Ana", 1), ("Luis", 1)]
+    assert redis_falso.hget("lb:tiendas:nombres", "tienda borrada") is None
+    assert redis_falso.exists(lb.BUILT_KEY)
+    assert not list(redis_falso.scan_iter("lbtmp_*"))
+    assert redis_falso.ttl(lb._key("tiendas", "hoy")) > 0  # el RENAME conserva la expiración
+
+
+def test_reconstruir_fallido_no_toca_lo_publicado(lb, redis_falso):
+    lb.registrar(redis_falso, "Plaza Centro", "")
+
+    def filas():
+        yield ("Plaza Norte", "", time.time())
+        raise RuntimeError("se cayó la lectura")
+
+    with pytest.raises(RuntimeError):
+        lb.reconstruir(redis_falso, filas(), lote=1)
+    assert lb.top(redis_falso, "tiendas", "total")[0] == [("Plaza Centro", 1)]
+    assert not list(redis_falso.scan_iter("lbtmp_*"))
+
+
+def test_importar_con_filas_nuevas_reconstruye(lb, redis_falso, store):
+    class Hoja:
+        def __init__(self, filas):
+            self.filas = filas
+
+        def get_all_values(self):
+            return [["Timestamp", "Teléfono", "Tienda", "Vendedor", "Premio"]] + self.filas
+
+    def reconstruir():
+        lb.reconstruir(redis_falso, store.filas_leaderboard())
+        llamadas.append(1)
+
+    llamadas = []
+    hoja = Hoja([["2025-11-14 10:00:00", "5215550000001", "Plaza Centro", "Luis", "Termo"]])
+    store.importar_desde_sheet(hoja, al_cambiar_conteos=reconstruir)
+    assert lb.top(redis_falso, "tiendas", "total")[0] == [("Plaza Centro", 1)]
+
+    store.importar_desde_sheet(hoja, al_cambiar_conteos=reconstruir)  # sin cambios: no reconstruye
+    assert len(llamadas) == 1
+
+    hoja.filas[0][2] = "Plaza Norte"  # corrección manual en el Sheet
+    store.importar_desde_sheet(hoja, al_cambiar_conteos=reconstruir)
+    assert len(llamadas) == 2
+    assert lb.top(redis_falso, "tiendas", "total")[0] == [("Plaza Norte", 1)]
@@ -0,0 +1,35 @@
+# tests/test_logs.py
+"""logs: obtener() no arranca nada; configurar() es explícito e idempotente."""
+import json, logging, threading
+
+
+def test_obtener_no_arranca_el_listener(monkeypatch):
+    import logs
+    monkeypatch.setattr(logs, "_listener", None)
+    hilos = threading.active_count()
+    logs.obtener("prueba").info("sin configurar")
+    assert logs._listener is None
+    assert threading.active_count() == hilos
+
+
+def test_configurar_es_idempotente_y_escribe_json(monkeypatch, capsys):
+    import logs
+    root = logging.getLogger()
+    handlers, nivel = list(root.handlers), root.level
+    monkeypatch.setattr(logs, "_listener", None)
+    try:
+        logs.configurar(nivel="INFO", formato="json")
+        listener = logs._listener
+        logs.configurar()
+        assert logs._listener is listener
+        with logs.correlacion("abc123"):
+            logs.obtener("prueba").info("hola", extra={"tienda": "T1"})
+        logs.detener()
+    finally:
+        for h in list(root.handlers):
+            root.removeHandler(h)
+        for h in handlers:
+            root.addHandler(h)
+        root.setLevel(nivel)
+    linea = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert (linea["msg"], linea["cid"], linea["tienda"]) == ("hola", "abc123", "T1")
@@ -0,0 +1,69 @@
+# tests/test_notificaciones.py
+"""Cola de notificaciones: ack desde la lista en proceso, reintentos agendados y huérfanos."""
+import json, time
+
+import pytest
+
+
+@pytest.fixture
+def notif(redis_falso):
+    import notificaciones
+    redis_falso.flushall()
+    return notificaciones
+
+
+def _procesando(notif):
+    return f"{notif.PROCESANDO_KEY}:{notif.worker_id()}"
+
+
+def test_envio_exitoso_hace_ack(notif, redis_falso):
+    enviados = []
+    notif.encolar(redis_falso, "5215550000001", "hola")
+    assert notif.procesar_uno(redis_falso, lambda t, m: enviados.append((t, m)) or {"messages": [{}]}, timeout=1)
+    assert enviados == [("5215550000001", "hola")]
+    assert redis_falso.llen(_procesando(notif)) == 0
+    assert notif.pendientes(redis_falso) == 0
+    assert not notif.procesar_uno(redis_falso, lambda t, m: {}, timeout=1)
+
+
+def test_fallo_se_agenda_sin_bloquear_la_cola(notif, redis_falso, monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda s: pytest.fail("el worker no debe dormir"))
+    notif.encolar(redis_falso, "5215550000001", "falla")
+    notif.encolar(redis_falso, "5215550000002", "sale")
+    enviados = []
+
+    def enviar(tel, texto):
+        enviados.append(tel)
+        if tel.endswith("1"):
+            raise ConnectionError("graph caído")
+        return {"messages": [{}]}
+
+    notif.procesar_uno(redis_falso, enviar, timeout=1)
+    notif.procesar_uno(redis_falso, enviar, timeout=1)
+    assert enviados == ["5215550000001", "5215550000002"]
+    assert redis_falso.zcard(notif.REINTENTOS_KEY) == 1
+    assert notif.pendientes(redis_falso) == 1
+
+    assert notif.mover_vencidos(redis_falso) == 0  # todavía no vence
+    assert notif.mover_vencidos(redis_falso, time.time() + 60) == 1
+    item = json.loads(redis_falso.lindex(notif.COLA_KEY, 0))
+    assert (item["telefono"], item["intentos"]) == ("5215550000001", 1)
+
+
+def test_payload_de_error_de_graph_no_cuenta_como_entrega(notif, redis_falso, monkeypatch):
+    monkeypatch.setattr(notif, "MAX_INTENTOS", 1)
+    notif.encolar(redis_falso, "5215550000001", "hola")
+    notif.procesar_uno(redis_falso, lambda t, m: {"error": {"code": 131047}}, timeout=1)
+    assert redis_falso.llen(notif.FALLIDAS_KEY) == 1
+    assert redis_falso.llen(_procesando(notif)) == 0
+    assert notif.entregado({"messages": [{"id": "wamid.x"}]})
+    assert not notif.entregado(None)
+
+
+def test_recupera_lo_que_dejo_un_worker_sin_latido(notif, redis_falso):
+    redis_falso.lpush(f"{notif.PROCESANDO_KEY}:otro:1", "a")
+    redis_falso.lpush(f"{notif.PROCESANDO_KEY}:vivo:2", "b")
+    redis_falso.set(f"{notif.LATIDO_KEY}:vivo:2", 1)
+    assert notif.recuperar_huerfanos(redis_falso) == 1
+    assert redis_falso.lrange(notif.COLA_KEY, 0, -1) == ["a"]
+    assert redis_falso.llen(f"{notif.PROCESANDO_KEY}:vivo:2") == 1
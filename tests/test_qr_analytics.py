@@ -0,0 +1,49 @@
+# tests/test_qr_analytics.py
+"""Analítica de QR: sólo vendedores registrados y conversiones ligadas a un escaneo."""
+import time
+
+import pytest
+
+
+@pytest.fixture
+def qr(redis_falso):
+    import qr_analytics
+    redis_falso.flushall()
+    return qr_analytics
+
+
+def test_codigos_desconocidos_van_a_una_sola_cubeta(qr, redis_falso):
+    assert qr.vendedor_de_qr(redis_falso, " v001 ") == "V001"
+    for basura in ("XYZ123", "' OR 1=1", "scraper-77"):
+        qr.registrar_escaneo(redis_falso, qr.vendedor_de_qr(redis_falso, basura), "visitante")
+    assert redis_falso.zrange(qr.SCANS_KEY, 0, -1, withscores=True) == [(qr.DESCONOCIDO, 3.0)]
+    assert not redis_falso.exists(f"qr:{qr.DESCONOCIDO}:abiertos")
+
+
+def test_conversion_requiere_un_escaneo_previo(qr, redis_falso):
+    assert not qr.registrar_mensaje(redis_falso, "5215550000001", "V001")  # escribió el código sin escanear
+    assert redis_falso.zscore(qr.CONV_KEY, "V001") is None
+
+    qr.registrar_escaneo(redis_falso, "V001", "visitante-a")
+    assert qr.registrar_mensaje(redis_falso, "5215550000002", "V001")
+    assert not qr.registrar_mensaje(redis_falso, "5215550000003", "V001")  # el escaneo ya se consumió
+    assert not qr.registrar_mensaje(redis_falso, "5215550000002", "V001")  # mismo teléfono, no cuenta dos veces
+
+    fila = {x["vendedor_id"]: x for x in qr.resumen(redis_falso)}["V001"]
+    assert (fila["scans"], fila["conversiones"], fila["tasa_conversion"]) == (1, 1, 1.0)
+
+
+def test_escaneo_fuera_de_la_ventana_no_convierte(qr, redis_falso):
+    ts = time.time()
+    qr.registrar_escaneo(redis_falso, "V002", "visitante-b", ts=ts - qr.QR_VENTANA_CONVERSION_S - 5)
+    assert not qr.registrar_mensaje(redis_falso, "5215550000004", "V002", ts=ts)
+
+
+def test_detalle_por_hora(qr, redis_falso):
+    ts = time.time()
+    qr.registrar_escaneo(redis_falso, "V003", "visitante-c", ts=ts)
+    qr.registrar_escaneo(redis_falso, "V003", "visitante-c", ts=ts)
+    qr.registrar_mensaje(redis_falso, "5215550000005", "V003", ts=ts)
+    d = qr.detalle(redis_falso, "V003", horas=2, hasta=ts)
+    assert (d["scans"], d["conversiones"], d["visitantes_unicos"]) == (2, 1, 1)
+    assert d["por_hora"][-1]["scans"] == 2 and d["por_hora"][-1]["mensajes"] == 1
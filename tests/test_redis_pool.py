@@ -0,0 +1,61 @@
+# tests/test_redis_pool.py
+"""Pools de Redis: límites por tipo de trabajo, espera acotada, reintentos y estado."""
+import pytest
+import redis
+
+
+@pytest.fixture
+def pool_falso():
+    fakeredis = pytest.importorskip("fakeredis")
+    import redis_pool
+
+    def crear(max_connections=2):
+        return redis_pool.PoolMedido(connection_class=fakeredis.FakeRedisConnection, server=fakeredis.FakeServer(),
+                                     max_connections=max_connections, timeout=0.05, nombre="prueba",
+                                     decode_responses=True)
+    return crear
+
+
+def test_cuenta_conexiones_en_uso_y_espera_acotada(pool_falso):
+    pool = pool_falso(max_connections=2)
+    assert redis.Redis(connection_pool=pool).set("a", 1)
+    assert pool.estado() == {"max": 2, "abiertas": 1, "en_uso": 0}
+
+    a, b = pool.get_connection(), pool.get_connection()
+    assert pool.estado()["en_uso"] == 2
+    with pytest.raises(redis.exceptions.ConnectionError):
+        pool.get_connection()  # lleno: espera POOL_ESPERA_S y falla en vez de abrir otro socket
+    pool.release(a)
+    pool.release(b)
+    assert pool.estado() == {"max": 2, "abiertas": 2, "en_uso": 0}
+
+
+def test_cada_tipo_de_trabajo_tiene_su_configuracion(monkeypatch):
+    import redis_pool
+    monkeypatch.setattr(redis_pool, "REDIS_URL", "redis://:secreto@redis.interno:6380/2")
+    hot, fondo = redis_pool._crear_pool("hot"), redis_pool._crear_pool("fondo")
+
+    assert hot.max_connections == redis_pool.POOL_MAX
+    assert fondo.max_connections == redis_pool.POOL_MAX_FONDO
+    assert hot.connection_kwargs["socket_timeout"] < fondo.connection_kwargs["socket_timeout"]
+    assert (hot.connection_kwargs["host"], hot.connection_kwargs["port"], hot.connection_kwargs["db"]) == \
+        ("redis.interno", 6380, 2)
+    assert hot.connection_kwargs["decode_responses"] is True
+    # Sólo se reintentan caídas de conexión, nunca un timeout de lectura
+    assert hot.connection_kwargs["retry"]._supported_errors == (redis.exceptions.ConnectionError,)
+
+
+def test_cliente_es_uno_por_pool_y_estado_reporta_ping(pool_falso, monkeypatch):
+    import redis_pool
+    monkeypatch.setattr(redis_pool, "_clientes", {})
+    monkeypatch.setattr(redis_pool, "_crear_pool", lambda nombre: pool_falso())
+
+    c = redis_pool.cliente("hot")
+    assert redis_pool.cliente("hot") is c
+    assert redis_pool.cliente("fondo") is not c
+    estado = redis_pool.estado()
+    assert set(estado) == {"hot", "fondo"}
+    assert estado["hot"]["ok"] and estado["hot"]["max"] == 2
+
+    redis_pool.cerrar()
+    assert redis_pool.estado()["hot"]["ok"]  # el pool reabre al siguiente comando
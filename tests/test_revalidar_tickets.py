@@ -0,0 +1,236 @@
+# tests/test_revalidar_tickets.py
+"""CLI de re-validación contra un stand-in local de /v1/chat/completions (sin tokens ni red)."""
+import csv, json, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+TOTAL = 1250.5
+
+
+class _VisionFalsa(BaseHTTPRequestHandler):
+    llamadas = 0
+    caido = False  # True: responde 500 (sin reintentos del SDK)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        type(self).llamadas += 1
+        if type(self).caido:
+            self.send_response(500)
+            self.send_header("x-should-retry", "false")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        contenido = {"total": TOTAL, "currency": "MXN", "confidence_score": 9,
+                     "products": [{"description": "Refrigerador", "line_total": TOTAL}]}
+        cuerpo = json.dumps({
+            "id": "chatcmpl-prueba", "object": "chat.completion", "created": 0, "model": "stand-in",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": json.dumps(contenido)}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def vision():
+    _VisionFalsa.llamadas, _VisionFalsa.caido = 0, False
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _VisionFalsa)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_port}/v1", _VisionFalsa
+    srv.shutdown()
+
+
+@pytest.fixture
+def carpetas(tmp_path, monkeypatch):
+    """Trabaja en tmp_path (las carpetas de imágenes son relativas) con tres tickets."""
+    Image = pytest.importorskip("PIL.Image")
+    pytest.importorskip("openai")
+    import ticket_validator as tv
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(tv, "API_KEY", "sk-prueba")
+    monkeypatch.setattr(tv, "OCR_TIERED", False)
+    (tmp_path / tv.DIR_TO_PROCESS).mkdir()
+    (tmp_path / tv.DIR_PROCESSED).mkdir()
+    for nombre in ("a_5215550000001.jpg", "b_5215550000002.jpg", "c_5215550000003.jpg"):
+        Image.new("RGB", (16, 16), "white").save(tmp_path / tv.DIR_TO_PROCESS / nombre)
+    return tmp_path
+
+
+def _correr(base_url, *args):
+    import revalidar_tickets
+    return revalidar_tickets.main(["--no-sheet", "--workers", "2", "--base-url", base_url, *args])
+
+
+def test_procesa_todo_y_escribe_ai_json(vision, carpetas):
+    url, stub = vision
+    assert _correr(url) == 0
+    assert stub.llamadas == 3
+
+    resultados = json.loads((carpetas / "revalidacion" / "resultados.json").read_text(encoding="utf-8"))
+    assert sorted(resultados) == ["a_5215550000001.jpg", "b_5215550000002.jpg", "c_5215550000003.jpg"]
+    assert all(r["ok"] and r["total"] == TOTAL and not r["error"] for r in resultados.values())
+    ai = json.loads((carpetas / "images_processed" / "a_5215550000001.jpg.ai.json").read_text(encoding="utf-8"))
+    assert ai["products"][0]["description"] == "Refrigerador" and ai["prompt_version"]
+
+
+def test_omite_imagenes_con_ai_json_vigente(vision, carpetas):
+    url, stub = vision
+    _correr(url)
+    _correr(url)
+    assert stub.llamadas == 3  # la segunda corrida no llama al endpoint
+    _correr(url, "--force")
+    assert stub.llamadas == 6
+
+
+def test_resume_no_repite_lo_del_checkpoint(vision, carpetas):
+    url, stub = vision
+    _correr(url, "--limit", "1")
+    assert stub.llamadas == 1
+    ckpt = (carpetas / "revalidacion" / "checkpoint.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(ckpt) == 1
+
+    _correr(url, "--resume", "--force")
+    assert stub.llamadas == 3
+    resultados = json.loads((carpetas / "revalidacion" / "resultados.json").read_text(encoding="utf-8"))
+    assert len(resultados) == 3
+
+
+def test_resume_reintenta_lo_que_quedo_con_error(vision, carpetas, monkeypatch):
+    import ticket_validator as tv
+    url, stub = vision
+    monkeypatch.setattr(tv, "RETRY", 0)
+    stub.caido = True
+    _correr(url, "--limit", "1")
+    ckpt = (carpetas / "revalidacion" / "checkpoint.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(ckpt) == 1 and json.loads(ckpt[0])["error"]
+
+    stub.caido, stub.llamadas = False, 0
+    assert _correr(url, "--resume") == 0
+    assert stub.llamadas == 3  # la del error también
+    resultados = json.loads((carpetas / "revalidacion" / "resultados.json").read_text(encoding="utf-8"))
+    assert all(r["ok"] and not r["error"] for r in resultados.values())
+
+
+def test_circuito_abierto_detiene_la_corrida_sin_marcar_errores(vision, carpetas, monkeypatch):
+    import ticket_validator as tv
+    from circuit_breaker import CircuitBreaker
+    url, stub = vision
+    monkeypatch.setattr(tv, "RETRY", 0)
+    monkeypatch.setattr(tv, "CB_OPENAI", CircuitBreaker("openai", fallos_max=1, reset_s=60))
+    stub.caido = True
+    assert _correr(url, "--workers", "1") == 3
+    assert stub.llamadas == 1  # las otras dos ni se mandaron
+    ckpt = (carpetas / "revalidacion" / "checkpoint.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(ckpt) == 1  # sólo la que sí llegó a OpenAI
+
+    monkeypatch.setattr(tv, "CB_OPENAI", CircuitBreaker("openai"))
+    stub.caido = False
+    assert _correr(url, "--resume") == 0
+    resultados = json.loads((carpetas / "revalidacion" / "resultados.json").read_text(encoding="utf-8"))
+    assert len(resultados) == 3 and all(r["ok"] for r in resultados.values())
+
+
+def test_vacia_la_cola_de_ocr_pendiente(vision, carpetas):
+    import ticket_validator as tv
+    url, stub = vision
+    tv.encolar_ocr_pendiente("c_5215550000003.jpg", "5215550000003", "m3", "Circuito 'openai' abierto")
+    tv.encolar_ocr_pendiente("ya_no_existe.jpg", "5215550000009", "m9", "timeout")
+
+    _correr(url, "--limit", "1")
+    assert stub.llamadas == 1
+    assert (carpetas / "images_processed" / "c_5215550000003.jpg.ai.json").exists()  # la encolada va primero
+    assert not (carpetas / tv.COLA_OCR_PENDIENTE).exists()
+    assert not (carpetas / (tv.COLA_OCR_PENDIENTE + ".procesando")).exists()
+
+
+def test_cola_regresa_lo_que_no_se_resolvio(carpetas, monkeypatch):
+    import revalidar_tickets, ticket_validator as tv
+    monkeypatch.setattr(tv, "RETRY", 0)
+    tv.encolar_ocr_pendiente("a_5215550000001.jpg", "5215550000001", "m1", "timeout")
+    # Endpoint inexistente: la llamada falla y el item vuelve a la cola
+    revalidar_tickets.main(["--no-sheet", "--base-url", "http://127.0.0.1:9/v1"])
+    cola = (carpetas / tv.COLA_OCR_PENDIENTE).read_text(encoding="utf-8").splitlines()
+    assert [json.loads(l)["archivo"] for l in cola] == ["a_5215550000001.jpg"]
+
+
+def test_diff_contra_montos_del_sheet(tmp_path):
+    import revalidar_tickets
+    resultados = {"a.jpg": {"total": 100.0}, "b.jpg": {"total": 80.0}, "c.jpg": {"total": None}}
+    montos = {"a.jpg": 100.0, "b.jpg": 75.5, "d.jpg": 10.0}
+    ruta = tmp_path / "diff.csv"
+    assert revalidar_tickets.escribir_diff(str(ruta), resultados, montos) == 3
+    with open(ruta, newline="", encoding="utf-8") as f:
+        estados = {row["archivo"]: row["estado"] for row in csv.DictReader(f)}
+    assert estados == {"a.jpg": "igual", "b.jpg": "difiere", "c.jpg": "sin_registro", "d.jpg": "sin_imagen"}
+
+
+def _ticket_en_revision(store, archivo, telefono):
+    return store.insertar({"telefono": telefono, "nombre": "Ana", "tienda": "Plaza Centro", "monto": 0.0,
+                           "premio": "Revisión manual", "motivo": "OCR no disponible por el momento",
+                           "nombre_archivo": f"https://bot.example/catalogo_img/{archivo}"}, {})
+
+
+def test_ocr_diferido_se_escribe_en_el_ticket(vision, carpetas, store):
+    import ticket_validator as tv
+    url, _ = vision
+    tid = _ticket_en_revision(store, "c_5215550000003.jpg", "5215550000003")
+    otro = _ticket_en_revision(store, "b_5215550000002.jpg", "5215550000002")  # no estaba en la cola
+    tv.encolar_ocr_pendiente("c_5215550000003.jpg", "5215550000003", "m3", "timeout")
+
+    assert _correr(url) == 0
+    with store._conn() as c:
+        fila = dict(c.execute("SELECT * FROM tickets WHERE id = ?", (tid,)).fetchone())
+        intacto = c.execute("SELECT premio FROM tickets WHERE id = ?", (otro,)).fetchone()[0]
+    assert (fila["premio"], fila["monto"]) == ("Pendiente de validación", TOTAL)
+    assert json.loads(fila["raw"])["datos"]["monto"] == TOTAL  # la replicación pendiente lleva el monto nuevo
+    assert intacto == "Revisión manual"
+    assert not (carpetas / tv.COLA_OCR_PENDIENTE).exists()
+
+
+class _Hoja:
+    def __init__(self, filas):
+        self.filas = filas
+        self.escrituras = []
+
+    def row_values(self, i):
+        return list(self.filas[i - 1])
+
+    def batch_update(self, cambios, value_input_option=None):
+        self.escrituras.extend(cambios)
+
+
+def test_ocr_diferido_en_fila_replicada_usa_candado_y_cas(store, redis_falso):
+    import revalidar_tickets, sheets_utils
+    redis_falso.flushall()
+    sheets_utils._headers_cache.update(map=None, ts=0.0)
+    _ticket_en_revision(store, "a.jpg", "5215550000001")
+    store.replicar_uno(lambda d, t, e: (True, 2))
+    hoja = _Hoja([["Telefono", "Monto", "Premio", "Motivo"],
+                  ["5215550000001", "0", "Revisión manual", "OCR no disponible"]])
+    item = {"archivo": "a.jpg"}
+    resultados = {"a.jpg": {"total": 99.5, "error": ""}}
+
+    redis_falso.set("asignando:2", "revisor")
+    assert revalidar_tickets.aplicar_ocr_a_tickets([item], resultados, hoja, redis_falso) == [item]
+    assert hoja.escrituras == []  # un revisor tiene la fila: se queda en la cola
+
+    redis_falso.delete("asignando:2")
+    assert revalidar_tickets.aplicar_ocr_a_tickets([item], resultados, hoja, redis_falso) == []
+    assert {c["range"]: c["values"][0][0] for c in hoja.escrituras} == {
+        "B2": 99.5, "C2": "Pendiente de validación", "D2": "Monto detectado: $99.50"}
+    assert not redis_falso.exists("asignando:2")
+    items, _ = store.tickets_pendientes()
+    assert items[0]["row_index"] == 2 and items[0]["cantidad_detectada"] == 99.5
+
+    # Sin Sheet (--no-sheet) la fila replicada no se toca y el item vuelve a la cola
+    _ticket_en_revision(store, "b.jpg", "5215550000002")
+    store.replicar_uno(lambda d, t, e: (True, 3))
+    assert revalidar_tickets.aplicar_ocr_a_tickets([{"archivo": "b.jpg"}], {"b.jpg": {"total": 5.0}}) == [{"archivo": "b.jpg"}]
@@ -0,0 +1,50 @@
+# tests/test_series.py
+"""Series de tiempo: un evento suma en las tres resoluciones y la lectura rellena con ceros."""
+from datetime import datetime
+
+import pytest
+
+
+@pytest.fixture
+def series(redis_falso):
+    import series
+    redis_falso.flushall()
+    return series
+
+
+def test_un_evento_cae_en_minuto_hora_y_dia(series, redis_falso):
+    ts = datetime(2026, 3, 10, 14, 35, 20).timestamp()
+    series.registrar(redis_falso, ts=ts, tickets=1, monto=850.5, premios=0)
+    series.registrar(redis_falso, ts=ts + 30, tickets=1, ocr_validos=1, monto=100.0)
+
+    hora = series.serie(redis_falso, "hora", n=1, hasta=ts)[0]
+    assert hora == {"t": int(datetime(2026, 3, 10, 14).timestamp()), "tickets": 2,
+                    "ocr_validos": 1, "monto": 950.5, "premios": 0}
+    assert series.serie(redis_falso, "dia", n=1, hasta=ts)[0]["t"] == int(datetime(2026, 3, 10).timestamp())
+    assert series.serie(redis_falso, "min", n=1, hasta=ts)[0]["tickets"] == 2
+    assert 0 < redis_falso.ttl(f"ts:min:{int(ts - ts % 60)}") <= 60 + series.RESOLUCIONES["min"][1]
+
+
+def test_serie_rellena_huecos_y_ordena_de_viejo_a_nuevo(series, redis_falso):
+    base = datetime(2026, 3, 10, 9).timestamp()
+    series.registrar(redis_falso, ts=base, tickets=3)
+    series.registrar(redis_falso, ts=base + 2 * 3600, tickets=1)
+
+    puntos = series.serie(redis_falso, "hora", n=4, hasta=base + 3 * 3600)
+    assert [p["t"] for p in puntos] == [int(base + i * 3600) for i in range(4)]
+    assert [p["tickets"] for p in puntos] == [3, 0, 1, 0]
+
+
+def test_ignora_metricas_desconocidas_y_acota_n(series, redis_falso):
+    series.registrar(redis_falso, visitas=5, tickets=0)
+    assert redis_falso.keys("ts:*") == []
+    paso, retencion = series.RESOLUCIONES["min"]
+    assert len(series.serie(redis_falso, "min", n=10 ** 6)) == retencion // paso
+
+
+def test_registrar_dentro_de_un_pipeline(series, redis_falso):
+    p = redis_falso.pipeline()
+    series.registrar(redis_falso, ts=datetime(2026, 3, 10, 9).timestamp(), pipe=p, tickets=1)
+    assert redis_falso.keys("ts:*") == []
+    p.execute()
+    assert len(redis_falso.keys("ts:*")) == 3
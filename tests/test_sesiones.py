@@ -0,0 +1,55 @@
+# tests/test_sesiones.py
+"""Sesiones como HASH: escrituras por campo, historial recortado y migración del JSON legado."""
+import json
+
+import pytest
+
+
+@pytest.fixture
+def ses(redis_falso):
+    import sesiones
+    redis_falso.flushall()
+    return sesiones
+
+
+def test_guardar_solo_toca_los_campos_dados(ses, redis_falso):
+    ses.reemplazar(redis_falso, "5215550000001", 1, {"nombre": "Ana", "tienda": None})
+    ses.guardar(redis_falso, "5215550000001", paso=2)
+    ses.guardar(redis_falso, "5215550000001", respuestas={"ciudad": "León"})
+
+    assert ses.cargar(redis_falso, "5215550000001") == {
+        "paso": 2, "respuestas": {"nombre": "Ana", "tienda": "", "ciudad": "León"}}
+    assert 0 < redis_falso.ttl("sesion:5215550000001") <= ses.SESION_TTL_S
+    assert ses.cargar(redis_falso, "5215550000009") is None
+
+
+def test_reemplazar_conserva_el_historial(ses, redis_falso, monkeypatch):
+    monkeypatch.setattr(ses, "SESION_MAX_TICKETS", 3)
+    for i in range(5):
+        ses.agregar_ticket(redis_falso, "5215550000001", {"n": i})
+    ses.reemplazar(redis_falso, "5215550000001", 0)
+
+    sesion = ses.cargar(redis_falso, "5215550000001", con_tickets=True)
+    assert sesion["respuestas"] == {}
+    assert sesion["tickets"] == [{"n": 4}, {"n": 3}, {"n": 2}]  # más reciente primero, recortado
+
+
+def test_operaciones_de_un_mensaje_en_un_pipeline(ses, redis_falso):
+    p = redis_falso.pipeline()
+    ses.guardar(redis_falso, "5215550000001", paso=3, pipe=p)
+    ses.agregar_ticket(redis_falso, "5215550000001", {"n": 1}, pipe=p)
+    assert ses.cargar(redis_falso, "5215550000001") is None
+    p.execute()
+    assert ses.tickets(redis_falso, "5215550000001") == [{"n": 1}]
+
+
+def test_migra_la_sesion_json_legada_al_leerla(ses, redis_falso):
+    redis_falso.set("chatbot:5215550000001", json.dumps(
+        {"paso": 4, "respuestas": {"nombre": "Ana"}, "tickets": [{"n": 1}, {"n": 2}]}))
+
+    sesion = ses.cargar(redis_falso, "5215550000001", con_tickets=True)
+    assert sesion == {"paso": 4, "respuestas": {"nombre": "Ana"}, "tickets": [{"n": 2}, {"n": 1}]}
+    assert not redis_falso.exists("chatbot:5215550000001")
+
+    ses.eliminar(redis_falso, "5215550000001")
+    assert redis_falso.keys("*") == []
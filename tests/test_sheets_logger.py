@@ -0,0 +1,50 @@
+# tests/test_sheets_logger.py
+"""registrar_ticket_con_fila: sólo cuenta como replicado si el Sheet principal devolvió su fila."""
+import pytest
+
+
+class Hoja:
+    def __init__(self, rango="tickets!A57:M57", falla=False):
+        self.rango, self.falla, self.filas = rango, falla, 0
+
+    def append_row(self, row, value_input_option=None):
+        if self.falla:
+            raise IOError("Sheets caído")
+        self.filas += 1
+        return {"updates": {"updatedRange": self.rango}}
+
+
+@pytest.fixture
+def hojas(monkeypatch):
+    import sheets_logger
+    principal, secundaria = Hoja(), Hoja(rango="otra!A3:M3")
+    monkeypatch.setenv("GOOGLE_SHEETS_ID", "principal")
+    monkeypatch.setattr(sheets_logger, "_get_worksheets",
+                        lambda: [("secundaria", secundaria), ("principal", principal)])
+    return sheets_logger, principal, secundaria
+
+
+def test_devuelve_la_fila_del_principal(hojas):
+    sl, principal, secundaria = hojas
+    escritas = set()
+    assert sl.registrar_ticket_con_fila({"telefono": "5215550000001"}, {}, escritas) == (True, 57)
+    assert escritas == {"principal", "secundaria"}
+
+
+def test_principal_caido_es_fallo_y_no_repite_la_secundaria(hojas):
+    sl, principal, secundaria = hojas
+    principal.falla = True
+    escritas = set()
+    assert sl.registrar_ticket_con_fila({}, {}, escritas) == (False, None)
+    assert escritas == {"secundaria"}
+
+    principal.falla = False
+    assert sl.registrar_ticket_con_fila({}, {}, escritas) == (True, 57)
+    assert secundaria.filas == 1 and principal.filas == 1
+
+
+def test_rango_ilegible_es_fallo(hojas):
+    sl, principal, _ = hojas
+    principal.rango = ""
+    assert sl.registrar_ticket_con_fila({}, {}) == (False, None)
+    assert not sl.registrar_ticket_en_sheets({}, {})
@@ -0,0 +1,132 @@
+# tests/test_ticket_store.py
+"""Estados de replicación a Sheets: pendiente -> enviando -> ok | error (reintento)."""
+import time
+
+
+def _ticket(store, **datos):
+    base = {"telefono": "5215550000000", "nombre": "Ana", "tienda": "Plaza Centro",
+            "monto": "1,250.00", "premio": "Pendiente de validación"}
+    base.update(datos)
+    return store.insertar(base, {"ticket_photo": "media:1"})
+
+
+def _fila(store, tid):
+    with store._conn() as c:
+        return dict(c.execute("SELECT * FROM tickets WHERE id = ?", (tid,)).fetchone())
+
+
+def _vencer_backoff(store, tid):
+    with store._conn() as c:
+        c.execute("UPDATE tickets SET sync_ts = ? WHERE id = ?", (time.time() - 1, tid))
+
+
+def test_replicacion_ok_guarda_fila_del_sheet(store):
+    tid = _ticket(store)
+    assert _fila(store, tid)["sync_estado"] == "pendiente"
+    assert store.pendientes_sync() == 1
+
+    avisos = []
+    assert store.replicar_uno(lambda d, t, e: (True, 57), lambda i, row, d: avisos.append((i, row)))
+    fila = _fila(store, tid)
+    assert (fila["sync_estado"], fila["sheet_row"]) == ("ok", 57)
+    assert avisos == [(tid, 57)]
+    assert store.pendientes_sync() == 0
+    assert not store.replicar_uno(lambda d, t, e: (True, 58))  # ya no hay nada por replicar
+
+    items, total = store.tickets_pendientes()
+    assert total == 1 and items[0]["row_index"] == 57 and items[0]["cantidad_detectada"] == 1250.0
+
+
+def test_fallo_espera_backoff_y_cuenta_como_pendiente(store):
+    tid = _ticket(store)
+    assert store.replicar_uno(lambda d, t, e: (False, None))
+    fila = _fila(store, tid)
+    assert fila["sync_estado"] == "error" and fila["sync_intentos"] == 1
+    assert fila["sync_ts"] > time.time()
+    assert not store.replicar_uno(lambda d, t, e: (True, 2))  # todavía en backoff
+    assert store.pendientes_sync() == 1
+
+
+def test_excepcion_del_escritor_cuenta_como_fallo(store):
+    tid = _ticket(store)
+
+    def revienta(d, t, e):
+        raise IOError("Sheets caído")
+
+    assert store.replicar_uno(revienta)
+    assert _fila(store, tid)["sync_estado"] == "error"
+
+
+def test_nunca_deja_de_reintentar_tras_una_caida_larga(store):
+    tid = _ticket(store)
+    for _ in range(20):
+        _vencer_backoff(store, tid)
+        assert store.replicar_uno(lambda d, t, e: (False, None))
+    fila = _fila(store, tid)
+    assert fila["sync_intentos"] == 20
+    assert fila["sync_ts"] - time.time() <= store.SYNC_BACKOFF_MAX_S + 1
+    assert store.pendientes_sync() == 1
+
+    _vencer_backoff(store, tid)
+    assert store.replicar_uno(lambda d, t, e: (True, 9))
+    assert _fila(store, tid)["sheet_row"] == 9
+
+
+def test_reserva_vencida_la_reclama_un_solo_proceso(store):
+    tid = _ticket(store)
+    with store._conn() as c:
+        c.execute("UPDATE tickets SET sync_estado = 'enviando', sync_ts = ? WHERE id = ?",
+                  (time.time() - store.SYNC_LEASE_S - 5, tid))
+
+    class Intercalada:
+        """Otro proceso reclama la fila entre nuestro SELECT y nuestro UPDATE."""
+
+        def __init__(self, c):
+            self.c, self.ganador = c, None
+
+        def execute(self, sql, params=()):
+            if sql.lstrip().startswith("UPDATE") and self.ganador is None:
+                with store._conn() as otra:
+                    self.ganador = store._tomar_siguiente(otra)
+            return self.c.execute(sql, params)
+
+    with store._conn() as c:
+        intercalada = Intercalada(c)
+        assert store._tomar_siguiente(intercalada) is None
+    assert intercalada.ganador is not None and intercalada.ganador["id"] == tid
+
+
+def test_importar_no_duplica_la_fila_replicada(store):
+    tid = _ticket(store)
+    store.replicar_uno(lambda d, t, e: (True, 2))
+
+    class Hoja:
+        def get_all_values(self):
+            return [["Timestamp", "Teléfono", "Nombre", "Tienda", "Monto", "Premio"],
+                    ["2025-11-14 10:00:00", "5215550000000", "Ana", "Plaza Centro", "1250", "Termo"]]
+
+    assert store.importar_desde_sheet(Hoja()) == 1
+    assert store.stats()["tickets"] == 1
+    assert _fila(store, tid)["premio"] == "Termo"
+
+
+def test_sin_fila_del_sheet_principal_sigue_pendiente(store):
+    tid = _ticket(store)
+    escritas_vistas = []
+
+    def solo_secundaria(d, t, escritas):
+        escritas_vistas.append(set(escritas))
+        escritas.add("secundaria")
+        return True, None  # p. ej. falló el principal o no se pudo leer updatedRange
+
+    assert store.replicar_uno(solo_secundaria)
+    fila = _fila(store, tid)
+    assert fila["sync_estado"] == "error" and fila["sheet_row"] is None
+    assert store.pendientes_sync() == 1
+
+    _vencer_backoff(store, tid)
+    assert store.replicar_uno(lambda d, t, escritas: escritas_vistas.append(set(escritas)) or (True, 12))
+    assert escritas_vistas == [set(), {"secundaria"}]  # el reintento no duplica la secundaria
+    assert _fila(store, tid)["sheet_row"] == 12
+    items, total = store.tickets_pendientes()
+    assert total == 1 and items[0]["row_index"] == 12
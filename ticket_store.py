@@ -0,0 +1,553 @@
+# ticket_store.py
+#!/usr/bin/env python3
+"""
+Almacén local de tickets (SQLite en modo WAL) como fuente primaria.
+
+Cada ticket se escribe primero aquí (un INSERT local, sin red) y un hilo
+replicador lo anexa después a Google Sheets; cuando Sheets confirma, se
+guarda la fila (sheet_row), que es la llave que usan /asignar-premio y el
+dashboard de pendientes.
+
+Los reportes del dashboard (tiendas, premios asignados, monto total,
+vendedores, pendientes) son consultas SQL con índices; ninguna petición del
+dashboard espera a Google. Las ediciones manuales en el Sheet se traen con
+importar_desde_sheet() (el replicador lo hace cada TICKETS_IMPORT_S o se
+fuerza con ?sync=1 / CLI).
+
+CLI:
+  python ticket_store.py importar      # Sheet -> SQLite (reconciliación)
+  python ticket_store.py stats
+"""
+import os, json, time, sqlite3, argparse, threading
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterable
+
+from sheets_utils import parse_money
+from leaderboards import normalizar
+import logs
+
+log = logs.obtener("ticket_store")
+
+DB_PATH = os.getenv("TICKETS_DB", os.path.join("data", "tickets.sqlite3"))
+SYNC_BACKOFF_MAX_S = int(os.getenv("TICKETS_SYNC_BACKOFF_MAX_S", "600"))  # nunca se deja de reintentar
+SYNC_LEASE_S      = int(os.getenv("TICKETS_SYNC_LEASE_S", "120"))
+TICKETS_IMPORT_S  = int(os.getenv("TICKETS_IMPORT_S", "300"))
+
+ESTADOS_PENDIENTES = ("pendiente de validación", "revisión manual", "pendiente")
+# Valores de la columna Premio que no son premios reales
+NO_PREMIOS = ("monto insuficiente", "revisión manual", "revision manual",
+              "sin premios", "sin premio", "rechazado")
+# Tickets cuyo OCR falló o quedó diferido (modo degradado)
+EN_REVISION = ("revisión manual", "revision manual")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    creado        REAL NOT NULL,
+    timestamp     TEXT NOT NULL,
+    telefono      TEXT,
+    nombre        TEXT,
+    tienda        TEXT,
+    tienda_norm   TEXT,
+    rfc_nombre    TEXT,
+    correo        TEXT,
+    ocupacion     TEXT,
+    medio         TEXT,
+    monto         REAL NOT NULL DEFAULT 0,
+    monto_texto   TEXT,
+    premio        TEXT,
+    premio_norm   TEXT,
+    motivo        TEXT,
+    vendedor      TEXT,
+    archivo       TEXT,
+    raw           TEXT,
+    sheet_row     INTEGER UNIQUE,
+    sync_estado   TEXT NOT NULL DEFAULT 'pendiente',   -- pendiente | enviando | ok | error
+    sync_intentos INTEGER NOT NULL DEFAULT 0,
+    sync_ts       REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_tienda   ON tickets(tienda_norm, creado);
+CREATE INDEX IF NOT EXISTS idx_tickets_premio   ON tickets(premio_norm, creado);
+CREATE INDEX IF NOT EXISTS idx_tickets_vendedor ON tickets(vendedor);
+CREATE INDEX IF NOT EXISTS idx_tickets_telefono ON tickets(telefono);
+CREATE INDEX IF NOT EXISTS idx_tickets_creado   ON tickets(creado);
+CREATE INDEX IF NOT EXISTS idx_tickets_sync     ON tickets(sync_estado, id);
+CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT);
+"""
+
+_schema_listo = False
+_despertar = threading.Event()
+_replicador: Optional[threading.Thread] = None
+_replicador_lock = threading.Lock()
+_detener = threading.Event()
+
+
+def _conn() -> sqlite3.Connection:
+    global _schema_listo
+    os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+    c = sqlite3.connect(DB_PATH, timeout=10, isolation_level=None)  # autocommit; BEGIN explícito
+    c.row_factory = sqlite3.Row
+    if not _schema_listo:
+        c.execute("PRAGMA journal_mode=WAL")
+        c.executescript(_SCHEMA)
+        _schema_listo = True
+    c.execute("PRAGMA synchronous=NORMAL")
+    return c
+
+
+def es_pendiente(premio: str) -> bool:
+    return (premio or "").strip().lower() in ESTADOS_PENDIENTES
+
+def _tienda(t: str) -> str:
+    return " ".join((t or "").split())
+
+
+# -------------------------------
+# Escritura
+# -------------------------------
+def insertar(datos: Dict[str, Any], ticket: Dict[str, Any]) -> int:
+    """Guarda el ticket localmente (pendiente de replicar a Sheets). Devuelve su id."""
+    ahora = time.time()
+    tienda = _tienda(datos.get("tienda", ""))
+    premio = (datos.get("premio") or "").strip()
+    fila = (
+        ahora, datetime.fromtimestamp(ahora).strftime("%Y-%m-%d %H:%M:%S"),
+        datos.get("telefono", ""), datos.get("nombre", ""), tienda, normalizar(tienda),
+        datos.get("rfc_nombre", ""), datos.get("correo", ""), datos.get("ocupacion", ""),
+        datos.get("medio", ""), parse_money(datos.get("monto")), str(datos.get("monto") or ""),
+        premio, premio.lower(), datos.get("motivo", ""), datos.get("vendedor", ""),
+        datos.get("nombre_archivo", ""),
+        json.dumps({"datos": datos, "ticket": ticket, "cid": logs.cid()}, ensure_ascii=False, default=str),
+    )
+    with _conn() as c:
+        cur = c.execute(
+            """INSERT INTO tickets (creado, timestamp, telefono, nombre, tienda, tienda_norm, rfc_nombre,
+                   correo, ocupacion, medio, monto, monto_texto, premio, premio_norm, motivo, vendedor,
+                   archivo, raw)
+               VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""", fila)
+        tid = cur.lastrowid
+    _despertar.set()
+    return tid
+
+
+def asignar_premios(asignaciones: Iterable[Tuple[int, str]]) -> int:
+    """[(sheet_row, premio), ...] -> actualiza el premio de las filas ya replicadas."""
+    datos = [(premio, premio.strip().lower(), int(row)) for row, premio in asignaciones]
+    if not datos:
+        return 0
+    with _conn() as c:
+        c.execute("BEGIN")
+        cur = c.executemany("UPDATE tickets SET premio = ?, premio_norm = ? WHERE sheet_row = ?", datos)
+        c.execute("COMMIT")
+        return cur.rowcount
+
+
+def asignar_premio(sheet_row: int, premio: str) -> bool:
+    return asignar_premios([(sheet_row, premio)]) > 0
+
+
+def en_revision_por_archivo(nombre_archivo: str) -> List[Dict[str, Any]]:
+    """
+    Tickets que siguen en revisión manual con la imagen `nombre_archivo`
+    (la columna archivo guarda la URL pública: se compara el basename).
+    """
+    with _conn() as c:
+        filas = c.execute(
+            f"""SELECT id, telefono, sheet_row, sync_estado FROM tickets
+                WHERE premio_norm IN ({','.join('?' * len(EN_REVISION))})
+                  AND (archivo = ? OR substr(archivo, -length(?) - 1) = '/' || ?)
+                ORDER BY id""", (*EN_REVISION, nombre_archivo, nombre_archivo, nombre_archivo)).fetchall()
+    return [dict(f) for f in filas]
+
+
+def actualizar_ocr(ticket_id: int, monto: float, motivo: str, premio: str) -> bool:
+    """
+    Escribe el resultado de un OCR diferido (cola del modo degradado) en un
+    ticket que sigue en revisión manual. También en raw, así que si aún no se
+    replica, llega al Sheet con los valores nuevos. False si el ticket ya no
+    está en revisión o el replicador lo está enviando en este momento.
+    """
+    with _conn() as c:
+        c.execute("BEGIN IMMEDIATE")
+        fila = c.execute("SELECT raw, premio_norm, sync_estado FROM tickets WHERE id = ?",
+                         (ticket_id,)).fetchone()
+        if fila is None or fila["premio_norm"] not in EN_REVISION or fila["sync_estado"] == "enviando":
+            c.execute("ROLLBACK")
+            return False
+        raw = json.loads(fila["raw"] or "{}")
+        raw.setdefault("datos", {}).update({"monto": monto, "motivo": motivo, "premio": premio})
+        c.execute("""UPDATE tickets SET monto = ?, monto_texto = ?, premio = ?, premio_norm = ?, motivo = ?,
+                         raw = ? WHERE id = ?""",
+                  (monto, str(monto), premio, premio.strip().lower(), motivo,
+                   json.dumps(raw, ensure_ascii=False, default=str), ticket_id))
+        c.execute("COMMIT")
+    return True
+
+
+# -------------------------------
+# Reportes (SQL)
+# -------------------------------
+def contar_tiendas() -> Tuple[Dict[str, int], int]:
+    with _conn() as c:
+        filas = c.execute("""SELECT tienda, COUNT(*) AS n FROM tickets
+                             WHERE tienda_norm != '' GROUP BY tienda""").fetchall()
+    counts = {f["tienda"]: f["n"] for f in filas}
+    return counts, sum(counts.values())
+
+
+def contar_premios_asignados() -> Tuple[Dict[str, int], int]:
+    with _conn() as c:
+        filas = c.execute("""SELECT premio, COUNT(*) AS n FROM tickets
+                             WHERE premio_norm != '' GROUP BY premio""").fetchall()
+    counts = {f["premio"]: f["n"] for f in filas if not f["premio"].lower().startswith(NO_PREMIOS)}
+    return counts, sum(counts.values())
+
+
+def total_monto() -> float:
+    with _conn() as c:
+        return round(c.execute("SELECT COALESCE(SUM(monto), 0) FROM tickets").fetchone()[0], 2)
+
+
+def top_vendedores(limit: int = 8) -> Tuple[List[Tuple[str, int]], int, int]:
+    """([(vendedor, registros), ...], total_vendedores, total_registros)"""
+    with _conn() as c:
+        filas = c.execute("""SELECT vendedor, COUNT(*) AS n FROM tickets
+                             WHERE vendedor != '' GROUP BY vendedor ORDER BY n DESC""").fetchall()
+    return [(f["vendedor"], f["n"]) for f in filas[:max(0, limit)]], len(filas), sum(f["n"] for f in filas)
+
+
+def filas_leaderboard() -> Iterable[Tuple[str, str, float]]:
+    """(tienda, vendedor, creado) de todos los tickets, para reconstruir los leaderboards."""
+    with _conn() as c:
+        for f in c.execute("SELECT tienda, vendedor, creado FROM tickets"):
+            yield f["tienda"] or "", f["vendedor"] or "", f["creado"]
+
+
+def tickets_pendientes(pagina: int = 1, por_pagina: int = 50, tienda: Optional[str] = None,
+                       monto_min: Optional[float] = None, monto_max: Optional[float] = None,
+                       max_edad_s: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Página de tickets pendientes de validación / revisión manual ya replicados
+    (tienen fila en el Sheet, que es lo que asigna /asignar-premio), más
+    recientes primero. Devuelve (items, total_filtrado).
+    """
+    pagina = max(1, pagina)
+    por_pagina = max(1, min(por_pagina, 500))
+    where = [f"premio_norm IN ({','.join('?' * len(ESTADOS_PENDIENTES))})", "sheet_row IS NOT NULL"]
+    args: List[Any] = list(ESTADOS_PENDIENTES)
+    if tienda:
+        where.append("tienda_norm = ?")
+        args.append(normalizar(tienda))
+    if monto_min is not None:
+        where.append("monto >= ?")
+        args.append(monto_min)
+    if monto_max is not None:
+        where.append("monto <= ?")
+        args.append(monto_max)
+    if max_edad_s:
+        where.append("creado >= ?")
+        args.append(time.time() - max_edad_s)
+    cond = " AND ".join(where)
+
+    with _conn() as c:
+        total = c.execute(f"SELECT COUNT(*) FROM tickets WHERE {cond}", args).fetchone()[0]
+        filas = c.execute(
+            f"""SELECT sheet_row AS row_index, timestamp, nombre, telefono, tienda,
+                       monto_texto AS monto_ocr, monto AS cantidad_detectada, premio, archivo AS ticket
+                FROM tickets WHERE {cond} ORDER BY creado DESC LIMIT ? OFFSET ?""",
+            args + [por_pagina, (pagina - 1) * por_pagina]).fetchall()
+    return [dict(f) for f in filas], int(total)
+
+
+def iterar(desde: Optional[float] = None, hasta: Optional[float] = None, tienda: Optional[str] = None,
+           premio: Optional[str] = None, lote: int = 1000) -> Iterable[Dict[str, Any]]:
+    """
+    Todos los tickets que cumplen los filtros, en orden de id, por lotes de
+    `lote` (keyset sobre id): memoria constante y sin dejar una lectura
+    abierta entre lotes.
+    """
+    where, args = ["id > ?"], [0]
+    if desde is not None:
+        where.append("creado >= ?")
+        args.append(desde)
+    if hasta is not None:
+        where.append("creado < ?")
+        args.append(hasta)
+    if tienda:
+        where.append("tienda_norm = ?")
+        args.append(normalizar(tienda))
+    if premio:
+        where.append("premio_norm = ?")
+        args.append(premio.strip().lower())
+    sql = (f"""SELECT id, timestamp, telefono, nombre, tienda, rfc_nombre, correo, ocupacion, medio,
+                      monto, monto_texto, premio, motivo, vendedor, archivo, sheet_row, sync_estado
+               FROM tickets WHERE {' AND '.join(where)} ORDER BY id LIMIT ?""")
+    while True:
+        with _conn() as c:
+            filas = c.execute(sql, args + [lote]).fetchall()
+        for f in filas:
+            yield dict(f)
+        if len(filas) < lote:
+            return
+        args[0] = filas[-1]["id"]
+
+
+# -------------------------------
+# Replicación a Google Sheets
+# -------------------------------
+def _tomar_siguiente(c: sqlite3.Connection) -> Optional[sqlite3.Row]:
+    """Reserva un ticket por replicar (varios procesos pueden correr el replicador)."""
+    ahora = time.time()
+    fila = c.execute(
+        """SELECT * FROM tickets
+           WHERE (sync_estado IN ('pendiente', 'error') OR (sync_estado = 'enviando' AND sync_ts < ?))
+             AND (sync_ts IS NULL OR sync_ts <= ?)
+           ORDER BY id LIMIT 1""", (ahora - SYNC_LEASE_S, ahora)).fetchone()
+    if fila is None:
+        return None
+    # Sólo gana quien ve el mismo estado Y el mismo sync_ts que leyó: si otro
+    # proceso reclamó la fila (p. ej. una reserva vencida) el sync_ts ya cambió
+    cur = c.execute("""UPDATE tickets SET sync_estado = 'enviando', sync_ts = ?
+                       WHERE id = ? AND sync_estado = ? AND sync_ts IS ?""",
+                    (ahora, fila["id"], fila["sync_estado"], fila["sync_ts"]))
+    return fila if cur.rowcount == 1 else None
+
+
+def replicar_uno(escribir: Callable[[Dict[str, Any], Dict[str, Any], set], Tuple[bool, Optional[int]]],
+                 al_replicar: Optional[Callable[[int, Optional[int], Dict[str, Any]], None]] = None) -> bool:
+    """
+    Replica un ticket a Sheets. False si no había nada por replicar.
+
+    escribir(datos, ticket, escritas) -> (ok, sheet_row); `escritas` son los
+    Sheet IDs que ya tienen la fila de intentos anteriores (se guarda en raw).
+    """
+    with _conn() as c:
+        fila = _tomar_siguiente(c)
+    if fila is None:
+        return False
+
+    raw = json.loads(fila["raw"] or "{}")
+    with logs.correlacion(raw.get("cid")):  # mismo cid que el mensaje que creó el ticket
+        return _replicar(fila, raw, escribir, al_replicar)
+
+
+def _replicar(fila, raw, escribir, al_replicar) -> bool:
+    datos, ticket = raw.get("datos", {}), raw.get("ticket", {})
+    escritas = set(raw.get("hojas") or [])
+    t0 = time.monotonic()
+    try:
+        ok, row_index = escribir(datos, ticket, escritas)
+    except Exception as e:
+        log.error("error replicando ticket %s: %s", fila["id"], e)
+        ok, row_index = False, None
+    # Sin fila en el Sheet principal el ticket no es asignable ni aparece en
+    # /tickets-pendientes: se reintenta aunque alguna hoja secundaria sí escribió
+    ok = ok and row_index is not None
+    log.info("ticket replicado" if ok else "replicación fallida",
+             extra={"ticket_id": fila["id"], "sheet_row": row_index,
+                    "intentos": fila["sync_intentos"] + 1, "dur_ms": round(1000 * (time.monotonic() - t0))})
+
+    with _conn() as c:
+        if ok:
+            c.execute("BEGIN")
+            # Una importación pudo traer la fila antes de que la marcáramos: nos quedamos con la local
+            c.execute("DELETE FROM tickets WHERE sheet_row = ? AND id != ?", (row_index, fila["id"]))
+            c.execute("UPDATE tickets SET sync_estado = 'ok', sheet_row = ?, sync_ts = ? WHERE id = ?",
+                      (row_index, time.time(), fila["id"]))
+            c.execute("COMMIT")
+        else:
+            intentos = fila["sync_intentos"] + 1
+            raw["hojas"] = sorted(escritas)
+            # Backoff: el siguiente intento no antes de 2^n segundos, tope SYNC_BACKOFF_MAX_S.
+            # No hay máximo de intentos: tras una caída larga de Sheets el ticket sigue
+            # reintentándose cada SYNC_BACKOFF_MAX_S hasta llegar al Sheet
+            c.execute("""UPDATE tickets SET sync_estado = 'error', sync_intentos = ?, sync_ts = ?, raw = ?
+                         WHERE id = ?""",
+                      (intentos, time.time() + min(2 ** min(intentos, 30), SYNC_BACKOFF_MAX_S),
+                       json.dumps(raw, ensure_ascii=False, default=str), fila["id"]))
+    if ok and al_replicar:
+        try:
+            al_replicar(fila["id"], row_index, datos)
+        except Exception as e:
+            log.error("al_replicar: %s", e)
+    return True
+
+
+def _loop(escribir, al_replicar, importar):
+    ultimo_import = time.monotonic()
+    while not _detener.is_set():
+        try:
+            while not _detener.is_set() and replicar_uno(escribir, al_replicar):
+                pass
+            if importar and time.monotonic() - ultimo_import >= TICKETS_IMPORT_S:
+                ultimo_import = time.monotonic()
+                importar()
+        except Exception as e:
+            log.exception("replicador: %s", e)
+        _despertar.wait(timeout=5)
+        _despertar.clear()
+
+
+def iniciar_replicador(escribir, al_replicar=None, importar: Optional[Callable[[], Any]] = None):
+    """Arranca (una sola vez por proceso) el hilo que replica a Sheets e importa cambios manuales."""
+    global _replicador
+    with _replicador_lock:
+        if _replicador is not None and _replicador.is_alive():
+            return _replicador
+        _detener.clear()
+        _replicador = threading.Thread(target=_loop, args=(escribir, al_replicar, importar),
+                                       name="ticket_store", daemon=True)
+        _replicador.start()
+        return _replicador
+
+
+def detener_replicador(timeout: float = 20) -> bool:
+    """
+    Apagado ordenado: deja terminar el ticket que se está replicando y no
+    toma más (los pendientes siguen en SQLite para el próximo arranque).
+    """
+    _detener.set()
+    _despertar.set()
+    h = _replicador
+    if h is not None and h.is_alive():
+        h.join(timeout)
+        return not h.is_alive()
+    return True
+
+
+# -------------------------------
+# Sheet -> SQLite (reconciliación)
+# -------------------------------
+_COLUMNAS = {
+    "timestamp": ("timestamp",),
+    "telefono": ("telefono", "teléfono"),
+    "nombre": ("nombre",),
+    "tienda": ("tienda",),
+    "rfc_nombre": ("rfc/nombre factura", "rfc_nombre", "rfc o nombre", "rfc"),
+    "correo": ("correo", "correo electrónico", "email"),
+    "ocupacion": ("ocupación", "ocupacion"),
+    "medio": ("medio",),
+    "monto": ("monto", "total", "importe", "cantidad detectada"),
+    "premio": ("premio",),
+    "motivo": ("motivo",),
+    "vendedor": ("vendedor",),
+    "archivo": ("archivo", "ticket", "nombre_archivo"),
+}
+
+
+def importar_desde_sheet(ws, al_cambiar_conteos: Optional[Callable[[], Any]] = None) -> int:
+    """
+    UNA lectura del Sheet: actualiza las filas conocidas (premios asignados a
+    mano, correcciones) e inserta las que no existen localmente. Devuelve filas leídas.
+
+    `al_cambiar_conteos` se llama después del COMMIT si la importación trajo
+    filas nuevas o cambió tienda/vendedor de alguna (los leaderboards de Redis
+    se reconstruyen con eso; ZINCRBY sólo ve los tickets del bot).
+    """
+    rows = ws.get_all_values() or []
+    if not rows:
+        return 0
+    headers = [normalizar(h) for h in rows[0]]
+    idx = {}
+    for campo, nombres in _COLUMNAS.items():
+        for n in nombres:
+            if normalizar(n) in headers:
+                idx[campo] = headers.index(normalizar(n))
+                break
+
+    def col(row, campo):
+        i = idx.get(campo)
+        return (row[i] if i is not None and i < len(row) else "") or ""
+
+    ahora = time.time()
+    datos = []
+    for sheet_row, row in enumerate(rows[1:], start=2):
+        if not any((v or "").strip() for v in row):
+            continue
+        ts = col(row, "timestamp")
+        creado = _parse_ts(ts, ahora)
+        tienda, premio = _tienda(col(row, "tienda")), col(row, "premio").strip()
+        datos.append((
+            creado, ts, col(row, "telefono"), col(row, "nombre"), tienda, normalizar(tienda),
+            col(row, "rfc_nombre"), col(row, "correo"), col(row, "ocupacion"), col(row, "medio"),
+            parse_money(col(row, "monto")), col(row, "monto"), premio, premio.lower(),
+            col(row, "motivo"), col(row, "vendedor"), col(row, "archivo"), sheet_row, ahora,
+        ))
+
+    with _conn() as c:
+        c.execute("BEGIN")
+        conocidas = {f["sheet_row"]: (f["tienda_norm"], f["vendedor"]) for f in
+                     c.execute("SELECT sheet_row, tienda_norm, vendedor FROM tickets WHERE sheet_row IS NOT NULL")}
+        cambia_conteos = any(conocidas.get(d[17]) != (d[5], d[15]) for d in datos)
+        c.executemany(
+            """INSERT INTO tickets (creado, timestamp, telefono, nombre, tienda, tienda_norm, rfc_nombre,
+                   correo, ocupacion, medio, monto, monto_texto, premio, premio_norm, motivo, vendedor,
+                   archivo, sheet_row, sync_estado, sync_ts)
+               VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,'ok',?)
+               ON CONFLICT(sheet_row) DO UPDATE SET
+                   telefono = excluded.telefono, nombre = excluded.nombre,
+                   tienda = excluded.tienda, tienda_norm = excluded.tienda_norm,
+                   monto = excluded.monto, monto_texto = excluded.monto_texto,
+                   premio = excluded.premio, premio_norm = excluded.premio_norm,
+                   motivo = excluded.motivo, vendedor = excluded.vendedor""", datos)
+        c.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('importado_ts', ?)", (str(int(ahora)),))
+        c.execute("COMMIT")
+    if cambia_conteos and al_cambiar_conteos:
+        try:
+            al_cambiar_conteos()
+        except Exception as e:
+            log.error("al_cambiar_conteos: %s", e)
+    return len(datos)
+
+
+def asegurar(abrir_ws) -> bool:
+    """Importa el Sheet si el almacén nunca se ha llenado (primer arranque). True si lo leyó."""
+    with _conn() as c:
+        hecho = c.execute("SELECT 1 FROM meta WHERE clave = 'importado_ts'").fetchone()
+    if hecho:
+        return False
+    importar_desde_sheet(abrir_ws())
+    return True
+
+
+def pendientes_sync() -> int:
+    """Tickets que todavía no llegan al Sheet (cola del replicador, incluidos los que esperan reintento)."""
+    with _conn() as c:
+        return c.execute("SELECT COUNT(*) FROM tickets WHERE sync_estado IN ('pendiente', 'enviando', 'error')").fetchone()[0]
+
+
+def stats() -> Dict[str, Any]:
+    with _conn() as c:
+        por_estado = {f["sync_estado"]: f["n"] for f in
+                      c.execute("SELECT sync_estado, COUNT(*) AS n FROM tickets GROUP BY sync_estado")}
+        imp = c.execute("SELECT valor FROM meta WHERE clave = 'importado_ts'").fetchone()
+    return {"tickets": sum(por_estado.values()), "sync": por_estado,
+            "importado_ts": int(imp["valor"]) if imp else None}
+
+
+def _parse_ts(valor: str, default: float) -> float:
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return datetime.strptime((valor or "").strip(), fmt).timestamp()
+        except ValueError:
+            continue
+    return default
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Almacén local de tickets (SQLite)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("importar", help="Sheet -> SQLite (reconciliación)")
+    sub.add_parser("stats")
+    args = ap.parse_args()
+    logs.configurar()
+
+    if args.cmd == "importar":
+        from sheets_utils import open_worksheet
+        print(f"{importar_desde_sheet(open_worksheet())} filas importadas")
+    else:
+        print(json.dumps(stats(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
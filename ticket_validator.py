@@ -1,11 +1,15 @@
 # ticket_validator.py
 #!/usr/bin/env python3
-import os, io, re, json, time, uuid, shutil, requests, base64
+import os, io, re, json, time, hashlib, threading, requests, base64
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from PIL import Image
+from typing import List, Dict, Any, Optional, TYPE_CHECKING
 from dotenv import load_dotenv
-from openai import OpenAI
+from circuit_breaker import obtener as obtener_circuito, CircuitoAbierto
+import image_store
+import logs
+
+if TYPE_CHECKING:  # openai y PIL se importan al primer uso (~0.8 s menos al arrancar)
+    from openai import OpenAI
 
 load_dotenv()
 
@@ -16,37 +20,83 @@ MODEL       = os.getenv("OPENAI_VISION_MODEL", "gpt-4o")
 API_KEY     = os.getenv("OPENAI_API_KEY")
 TIMEOUT_S   = int(os.getenv("OPENAI_TIMEOUT", "45"))
 RETRY       = int(os.getenv("OPENAI_RETRY", "2"))
+BASE_URL    = os.getenv("OPENAI_BASE_URL") or None  # p. ej. un stand-in local para pruebas
+
+# OCR escalonado: primero un modelo barato; si la lectura es dudosa, se repite con MODEL.
+OCR_TIERED         = os.getenv("OCR_TIERED", "0") == "1"
+MODEL_FAST         = os.getenv("OPENAI_VISION_MODEL_FAST", "gpt-4o-mini")
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "7"))
+OCR_SUM_TOLERANCE  = float(os.getenv("OCR_SUM_TOLERANCE", "0.05"))  # 5% de diferencia productos vs total
+
+# Precios USD por 1M tokens (entrada, salida) para el costo estimado por tier.
+PRECIOS_MODELO = {
+    MODEL_FAST: (float(os.getenv("OPENAI_PRICE_IN_FAST", "0.15")), float(os.getenv("OPENAI_PRICE_OUT_FAST", "0.60"))),
+    MODEL:      (float(os.getenv("OPENAI_PRICE_IN", "2.50")),      float(os.getenv("OPENAI_PRICE_OUT", "10.00"))),
+}
 
 DIR_TO_PROCESS = "images_to_process"
 DIR_PROCESSED  = "images_processed"
-os.makedirs(DIR_TO_PROCESS, exist_ok=True)
-os.makedirs(DIR_PROCESSED,  exist_ok=True)
+COLA_OCR_PENDIENTE = os.path.join(DIR_PROCESSED, "ocr_pendientes.jsonl")
+
+CB_OPENAI = obtener_circuito("openai")
+CB_GRAPH  = obtener_circuito("graph")
+log = logs.obtener("ocr")
 
 # -------------------------------
 # WhatsApp Graph helpers
 # -------------------------------
+def _graph_get(url: str, token: str, timeout: int) -> requests.Response:
+    resp = requests.get(url, headers={"Authorization": f"Bearer {token}"}, timeout=timeout)
+    if resp.status_code >= 500:
+        # Sólo los 5xx cuentan como caída de Graph; los 4xx son errores del media_id/token.
+        raise requests.HTTPError(f"{resp.status_code} {resp.text[:200]}", response=resp)
+    return resp
+
 def obtener_media_url(media_id: str, token: str) -> Optional[str]:
     url = f"https://graph.facebook.com/v20.0/{media_id}"
-    headers = {"Authorization": f"Bearer {token}"}
-    resp = requests.get(url, headers=headers, timeout=20)
+    try:
+        resp = CB_GRAPH.call(_graph_get, url, token, 20)
+    except (CircuitoAbierto, requests.RequestException) as e:
+        log.error("obtener_media_url: %s", e, extra={"media_id": media_id})
+        return None
     if resp.ok:
         return resp.json().get("url")
-    print(f"[obtener_media_url] {resp.status_code} {resp.text}")
+    log.error("obtener_media_url: HTTP %s", resp.status_code, extra={"media_id": media_id, "resp": resp.text[:200]})
     return None
 
-def descargar_imagen_local(media_id: str, token: str, telefono: str) -> Optional[str]:
+def descargar_imagen_local(media_id: str, token: str, telefono: str) -> Optional[Dict[str, Any]]:
+    """
+    Descarga la imagen al almacén por contenido (image_store) y devuelve
+    {nombre_archivo, ruta, sha256, duplicado}; la ruta es la vista en images_to_process.
+    """
     media_url = obtener_media_url(media_id, token)
     if not media_url:
         return None
-    resp = requests.get(media_url, headers={"Authorization": f"Bearer {token}"}, timeout=60)
+    try:
+        resp = CB_GRAPH.call(_graph_get, media_url, token, 60)
+    except (CircuitoAbierto, requests.RequestException) as e:
+        log.error("descargar_imagen_local: %s", e, extra={"media_id": media_id})
+        return None
     if not resp.ok:
-        print(f"[descargar_imagen_local] {resp.status_code} al descargar media")
+        log.error("descargar_imagen_local: HTTP %s al descargar media", resp.status_code, extra={"media_id": media_id})
         return None
-    nombre = f"{uuid.uuid4()}_{telefono}.jpg"
-    ruta = os.path.join(DIR_TO_PROCESS, nombre)  # <- ORIGINAL se guarda aquí (tu /catalogo_img usa esta carpeta)
-    with open(ruta, "wb") as f:
-        f.write(resp.content)
-    return ruta
+    # ORIGINAL: objeto único en image_store + hardlink en images_to_process (tu /catalogo_img usa esta carpeta)
+    return image_store.guardar(resp.content, telefono, media_id)
+
+def encolar_ocr_pendiente(nombre_archivo: str, telefono: str, media_id: str, motivo: str) -> None:
+    """
+    Modo degradado: encola la imagen que no se pudo analizar. revalidar_tickets.py
+    vacía esta cola en cada corrida (primero que el resto) y regresa a ella lo que
+    siga sin resolverse.
+    """
+    item = {"archivo": nombre_archivo, "telefono": telefono, "media_id": media_id,
+            "motivo": motivo, "ts": int(time.time())}
+    try:
+        asegurar_carpetas()
+        with open(COLA_OCR_PENDIENTE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    except Exception as e:
+        log.error("encolar_ocr_pendiente: %s", e, extra={"archivo": nombre_archivo})
 
 # -------------------------------
 # Prompt (extrae TOTAL y renglones cuando existen)
@@ -74,6 +124,10 @@ SALIDA JSON (siempre):
 Responde ÚNICAMENTE JSON válido, sin texto adicional.
 '''
 
+# Cambia cuando cambian el prompt o el modelo; los .ai.json con otra versión se consideran viejos.
+_MODELOS_VERSION = f"{MODEL_FAST}>{MODEL}" if OCR_TIERED else MODEL
+PROMPT_VERSION = hashlib.sha1(f"{_MODELOS_VERSION}\n{SYSTEM_PROMPT}".encode("utf-8")).hexdigest()[:12]
+
 # -------------------------------
 # Helpers
 # -------------------------------
@@ -96,7 +150,17 @@ def clean_json_response(content: str) -> str:
         return j
     return content
 
+def asegurar_carpetas() -> None:
+    os.makedirs(DIR_TO_PROCESS, exist_ok=True)
+    os.makedirs(DIR_PROCESSED,  exist_ok=True)
+
+def precargar() -> None:
+    """Importa openai y PIL y crea las carpetas (warm-up del worker)."""
+    import openai, PIL.Image  # noqa: F401
+    asegurar_carpetas()
+
 def img_to_b64(path: Path) -> str:
+    from PIL import Image
     with Image.open(path) as im:
         im = im.convert("RGB")
         from io import BytesIO
@@ -104,15 +168,31 @@ def img_to_b64(path: Path) -> str:
         im.save(buf, format="JPEG", quality=90)
         return base64.b64encode(buf.getvalue()).decode("utf-8")
 
+def nuevo_cliente(base_url: Optional[str] = None) -> "OpenAI":
+    from openai import OpenAI
+    return OpenAI(api_key=API_KEY, timeout=TIMEOUT_S, base_url=base_url or BASE_URL)
+
+def ruta_ai_json(nombre_archivo: str) -> str:
+    return os.path.join(DIR_PROCESSED, f"{nombre_archivo}.ai.json")
+
+def guardar_ai_json(nombre_archivo: str, data: Dict[str, Any]) -> None:
+    payload = dict(data)
+    payload["prompt_version"] = PROMPT_VERSION
+    asegurar_carpetas()
+    with open(ruta_ai_json(nombre_archivo), "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
 # -------------------------------
 # Llamada a OpenAI (una imagen)
 # -------------------------------
-def call_openai_for_image(client: OpenAI, img_b64: str) -> Dict[str, Any]:
+def call_openai_for_image(client: "OpenAI", img_b64: str, model: Optional[str] = None) -> Dict[str, Any]:
+    model = model or MODEL
     last_err = None
     for attempt in range(1 + RETRY):
         try:
-            resp = client.chat.completions.create(
-                model=MODEL,
+            resp = CB_OPENAI.call(
+                client.chat.completions.create,
+                model=model,
                 messages=[
                     {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": [
@@ -135,23 +215,126 @@ def call_openai_for_image(client: OpenAI, img_b64: str) -> Dict[str, Any]:
                 "currency": (data.get("currency") or "MXN"),
                 "products": data.get("products") or [],
                 "confidence_score": to_float(data.get("confidence_score")) or 5.0,
+                "model": model,
             }
+            usage = getattr(resp, "usage", None)
+            if usage is not None:
+                out["usage"] = {
+                    "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+                    "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+                }
             return out
+        except CircuitoAbierto:
+            raise  # falla rápido: no tiene caso reintentar con el circuito abierto
         except Exception as e:
             last_err = e
-            print(f"[OpenAI] intento {attempt + 1} falló: {e}")
+            log.warning("OpenAI intento %s falló: %s", attempt + 1, e, extra={"modelo": model})
             if attempt < RETRY:
                 time.sleep(1.2)
     raise RuntimeError(f"OpenAI error después de {RETRY + 1} intentos: {last_err}")
 
+# -------------------------------
+# OCR escalonado (modelo barato -> modelo caro)
+# -------------------------------
+_metricas_lock = threading.Lock()
+_metricas_ocr: Dict[str, Dict[str, float]] = {}
+
+def _registrar_tier(tier: str, model: str, latencia_s: float, data: Optional[Dict[str, Any]], error: bool = False):
+    uso = (data or {}).get("usage") or {}
+    p_in, p_out = PRECIOS_MODELO.get(model, (0.0, 0.0))
+    costo = (uso.get("prompt_tokens", 0) * p_in + uso.get("completion_tokens", 0) * p_out) / 1_000_000
+    with _metricas_lock:
+        m = _metricas_ocr.setdefault(tier, {
+            "model": model, "llamadas": 0, "errores": 0, "escalados": 0,
+            "latencia_total_s": 0.0, "latencia_max_s": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0, "costo_usd": 0.0,
+        })
+        m["llamadas"] += 1
+        m["errores"] += 1 if error else 0
+        m["latencia_total_s"] += latencia_s
+        m["latencia_max_s"] = max(m["latencia_max_s"], latencia_s)
+        m["prompt_tokens"] += uso.get("prompt_tokens", 0)
+        m["completion_tokens"] += uso.get("completion_tokens", 0)
+        m["costo_usd"] += costo
+
+def metricas_ocr() -> Dict[str, Dict[str, float]]:
+    """Snapshot de latencia/costo acumulados por tier en este proceso."""
+    with _metricas_lock:
+        out = {}
+        for tier, m in _metricas_ocr.items():
+            d = dict(m)
+            d["latencia_prom_s"] = round(m["latencia_total_s"] / m["llamadas"], 3) if m["llamadas"] else 0.0
+            d["costo_usd"] = round(m["costo_usd"], 6)
+            out[tier] = d
+        return out
+
+def motivo_escalar(data: Dict[str, Any]) -> Optional[str]:
+    """
+    Devuelve por qué una lectura del modelo barato no es confiable, o None si sirve:
+    total ausente, confianza baja o productos que no suman cerca del total.
+    """
+    total = data.get("total")
+    if total is None:
+        return "sin_total"
+    if (data.get("confidence_score") or 0) < OCR_MIN_CONFIDENCE:
+        return "confianza_baja"
+    lineas = [to_float(p.get("line_total")) for p in (data.get("products") or []) if isinstance(p, dict)]
+    lineas = [x for x in lineas if x is not None]
+    if lineas and total > 0:
+        suma = sum(lineas)
+        if abs(suma - total) / total > OCR_SUM_TOLERANCE:
+            return "suma_no_cuadra"
+    return None
+
+def _llamar_tier(client: "OpenAI", img_b64: str, tier: str, model: str) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    try:
+        data = call_openai_for_image(client, img_b64, model=model)
+    except Exception:
+        _registrar_tier(tier, model, time.perf_counter() - t0, None, error=True)
+        raise
+    _registrar_tier(tier, model, time.perf_counter() - t0, data)
+    return data
+
+def extraer_ticket(client: "OpenAI", img_b64: str) -> Dict[str, Any]:
+    """
+    Punto de entrada del OCR. Con OCR_TIERED=1 intenta primero MODEL_FAST y
+    escala a MODEL sólo si motivo_escalar() encuentra algo dudoso (o el
+    modelo barato falla). Agrega "tier" y "escalado_por" al resultado.
+    """
+    if not OCR_TIERED or MODEL_FAST == MODEL:
+        data = _llamar_tier(client, img_b64, "principal", MODEL)
+        data["tier"] = "principal"
+        return data
+
+    try:
+        data = _llamar_tier(client, img_b64, "rapido", MODEL_FAST)
+        motivo = motivo_escalar(data)
+    except Exception as e:
+        log.warning("modelo rápido falló, escalando: %s", e)
+        motivo = "error_rapido"
+
+    if motivo is None:
+        data["tier"] = "rapido"
+        return data
+
+    with _metricas_lock:
+        if "rapido" in _metricas_ocr:
+            _metricas_ocr["rapido"]["escalados"] += 1
+    data = _llamar_tier(client, img_b64, "principal", MODEL)
+    data["tier"] = "principal"
+    data["escalado_por"] = motivo
+    return data
+
 # -------------------------------
 # API pública para tu APP
 # -------------------------------
 def validar_ticket_desde_media(media_id: str, token: str, telefono: str) -> Dict[str, Any]:
     """
     Devuelve: {valido: bool, monto: float|0.0, nombre_archivo: str, motivo: str, ocr_detectado: bool}
-    - Descarga la imagen ORIGINAL en images_to_process (tu app sirve /catalogo_img desde aquí).
-    - Copia la imagen a images_processed para auditoría.
+    - Descarga la imagen ORIGINAL al almacén por contenido y la expone en images_to_process
+      (tu app sirve /catalogo_img desde aquí).
+    - La "copia" en images_processed para auditoría es un hardlink al mismo objeto.
     - Usa OpenAI Vision para extraer el total.
     """
     out = {"valido": False, "monto": 0.0, "nombre_archivo": "", "motivo": "", "ocr_detectado": False}
@@ -161,27 +344,35 @@ def validar_ticket_desde_media(media_id: str, token: str, telefono: str) -> Dict
         return out
 
     # 1) Descargar imagen original en images_to_process/
-    ruta_original = descargar_imagen_local(media_id, token, telefono)
-    if not ruta_original:
+    guardada = descargar_imagen_local(media_id, token, telefono)
+    if not guardada:
         out["motivo"] = "No se pudo descargar la imagen"
         return out
 
-    nombre_archivo = os.path.basename(ruta_original)
+    ruta_original = guardada["ruta"]
+    nombre_archivo = guardada["nombre_archivo"]
     out["nombre_archivo"] = nombre_archivo
+    out["duplicado"] = guardada["duplicado"]  # misma foto ya recibida antes (de cualquier teléfono)
 
-    # 2) Copiar a images_processed/ (trabajo/auditoría)
+    # 2) Vista en images_processed/ (trabajo/auditoría): hardlink, no copia
     ruta_trabajo = os.path.join(DIR_PROCESSED, nombre_archivo)
     try:
-        shutil.copy2(ruta_original, ruta_trabajo)
+        image_store.vincular(ruta_original, DIR_PROCESSED, nombre_archivo)
     except Exception as e:
-        print(f"[validar_ticket_desde_media] Error copiando a processed: {e}")
-        # Si falla la copia seguimos, ya tenemos el original
+        log.error("Error vinculando en processed: %s", e, extra={"archivo": nombre_archivo})
+        # Si falla seguimos, ya tenemos el original
 
     # 3) Llamada a OpenAI Vision
     try:
-        client = OpenAI(api_key=API_KEY, timeout=TIMEOUT_S)
+        client = nuevo_cliente()
         b64 = img_to_b64(Path(ruta_trabajo if os.path.exists(ruta_trabajo) else ruta_original))
-        data = call_openai_for_image(client, b64)
+        data = extraer_ticket(client, b64)
+    except CircuitoAbierto as e:
+        # Modo degradado: no esperamos a OpenAI; el ticket queda para revisión manual/OCR posterior.
+        encolar_ocr_pendiente(nombre_archivo, telefono, media_id, str(e))
+        out["motivo"] = "OCR no disponible por el momento; ticket en cola para revisión manual"
+        out["degradado"] = True
+        return out
     except Exception as e:
         out["motivo"] = f"Error analizando imagen: {e}"
         return out
@@ -196,11 +387,13 @@ def validar_ticket_desde_media(media_id: str, token: str, telefono: str) -> Dict
     out["valido"] = True               # La app ya valida montos mínimos en el flujo
     out["ocr_detectado"] = True
     out["motivo"] = f"Monto detectado: ${out['monto']:,.2f}"
+    log.info("ocr", extra={"archivo": nombre_archivo, "monto": out["monto"], "tier": data.get("tier"),
+                           "escalado_por": data.get("escalado_por"), "confianza": data.get("confidence_score")})
 
-    # 5) Guardar JSON junto a la copia en processed (best-effort)
+    # 5) Guardar JSON junto a la copia en processed y el monto en el índice del catálogo (best-effort)
     try:
-        with open(os.path.join(DIR_PROCESSED, f"{nombre_archivo}.ai.json"), "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        guardar_ai_json(nombre_archivo, data)
+        image_store.actualizar_monto(nombre_archivo, out["monto"])
     except Exception:
         pass
 